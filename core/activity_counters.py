@@ -0,0 +1,72 @@
+"""Contadores deslizantes por merchant (total / buy / sell) en buckets de tiempo.
+
+Cada aviso suma en el bucket de su segundo y en el total del merchant; al
+avanzar el reloj los buckets que salen de la ventana se restan enteros. Los
+merchants con total >= `threshold` se mantienen en un conjunto aparte, así
+`offenders()` cuesta O(k log k) sobre los infractores y no sobre todos los
+merchants.
+"""
+import heapq
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class SlidingCounters:
+    def __init__(self, window_seconds: int = 300, bucket_seconds: int = 10, threshold: Optional[int] = None):
+        self.window_seconds = int(window_seconds)
+        self.bucket_seconds = max(1, int(bucket_seconds))
+        self.threshold = threshold
+        # (bucket_id, {merchant: [total, buy, sell]}) del más antiguo al más nuevo
+        self._buckets: deque = deque()
+        self._totals: Dict[str, List[int]] = {}
+        self._above = set()
+
+    @staticmethod
+    def _bump(side: str, n: int, counts: List[int]):
+        counts[0] += n
+        if side == 'buy':
+            counts[1] += n
+        elif side == 'sell':
+            counts[2] += n
+
+    def add(self, ts: float, merchant: str, side: str, n: int = 1):
+        bucket = int(ts) // self.bucket_seconds
+        self.advance(ts)
+        if not self._buckets or self._buckets[-1][0] < bucket:
+            self._buckets.append((bucket, {}))
+        # avisos fuera de orden caen en el último bucket
+        per = self._buckets[-1][1].setdefault(merchant, [0, 0, 0])
+        total = self._totals.setdefault(merchant, [0, 0, 0])
+        self._bump(side, n, per)
+        self._bump(side, n, total)
+        if self.threshold is not None and total[0] >= self.threshold:
+            self._above.add(merchant)
+
+    def advance(self, now: float):
+        """Resta los buckets que quedan fuera de (now - window, now]."""
+        oldest = (int(now) - self.window_seconds) // self.bucket_seconds
+        while self._buckets and self._buckets[0][0] <= oldest:
+            _, per = self._buckets.popleft()
+            for merchant, (t, b, s) in per.items():
+                total = self._totals[merchant]
+                total[0] -= t
+                total[1] -= b
+                total[2] -= s
+                if total[0] <= 0:
+                    del self._totals[merchant]
+                    self._above.discard(merchant)
+                elif self.threshold is not None and total[0] < self.threshold:
+                    self._above.discard(merchant)
+
+    def get(self, merchant: str) -> Dict[str, int]:
+        t, b, s = self._totals.get(merchant, (0, 0, 0))
+        return {'merchant': merchant, 'count': t, 'buy': b, 'sell': s}
+
+    def offenders(self, limit: int = None) -> List[Tuple[str, int]]:
+        """(merchant, count) con count >= threshold, de mayor a menor."""
+        items = ((self._totals[m][0], m) for m in self._above)
+        top = heapq.nlargest(limit, items) if limit else sorted(items, reverse=True)
+        return [(m, c) for c, m in top]
+
+    def __len__(self) -> int:
+        return len(self._totals)
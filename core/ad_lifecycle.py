@@ -0,0 +1,202 @@
+"""Seguimiento del ciclo de vida de anuncios entre snapshots consecutivos.
+
+Cada snapshot se cruza con el anterior del mismo par mediante un hash join por
+`(merchant, side, métodos de pago)` en O(n). De ese cruce salen eventos
+`appear`, `disappear`, `reprice`, `requantity` y `relist` con su duración, que
+alimentan estadísticas por merchant (latencia real de relist, frecuencia de
+repricing, vida media de un anuncio) sin consultar la base de datos.
+"""
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from core import app_config, db
+
+APPEAR = 'appear'
+DISAPPEAR = 'disappear'
+REPRICE = 'reprice'
+REQUANTITY = 'requantity'
+RELIST = 'relist'
+
+
+@dataclass
+class AdEvent:
+    kind: str
+    pair: str
+    merchant_id: str
+    merchant: str
+    side: str
+    ts_ms: int
+    # appear: 0; disappear: vida del anuncio; reprice/requantity: tiempo desde el
+    # cambio anterior; relist: tiempo entre la baja y la nueva publicación
+    duration_ms: int
+    price: float
+    quantity: float
+    prev_price: Optional[float] = None
+    prev_quantity: Optional[float] = None
+
+
+@dataclass
+class _LiveAd:
+    merchant_id: str
+    merchant: str
+    side: str
+    price: float
+    quantity: float
+    first_seen: int
+    price_since: int
+    quantity_since: int
+
+
+def _ident(ad) -> str:
+    m_id = getattr(ad, 'merchant_id', None)
+    return m_id if m_id and m_id != 'N/A' else ad.merchant
+
+
+def _payment_key(payment_method: str) -> Tuple[str, ...]:
+    raw = (payment_method or '').strip('[]')
+    return tuple(sorted({p.strip().strip('\'"') for p in raw.split(',') if p.strip().strip('\'"')}))
+
+
+def _match_key(ad) -> tuple:
+    return (_ident(ad), ad.side, _payment_key(ad.payment_method))
+
+
+class AdTracker:
+    def __init__(self, stats_window_seconds: int = 24 * 3600, relist_window_seconds: int = None):
+        cfg = app_config.DETECTORS.get('merchant_intelligence', {})
+        self.stats_window_ms = stats_window_seconds * 1000
+        self.relist_window_ms = (relist_window_seconds or cfg.get('relist_window_seconds', 900)) * 1000
+        self._lock = threading.Lock()
+        # pair -> match key -> anuncios vivos (ordenados por precio)
+        self._live: Dict[str, Dict[tuple, List[_LiveAd]]] = {}
+        # (pair, merchant, side) -> ts (ms) de la última baja, para detectar relists
+        self._gone: Dict[tuple, int] = {}
+        # eventos recientes por merchant + cola global para podar en O(1) amortizado
+        self._by_merchant: Dict[str, deque] = {}
+        self._order: deque = deque()
+        self._listeners: List[Callable[[str, List[AdEvent]], None]] = []
+
+    def add_listener(self, fn: Callable[[str, List[AdEvent]], None]):
+        self._listeners.append(fn)
+
+    def observe(self, snap) -> List[AdEvent]:
+        """Cruza `snap` con el snapshot anterior del par y devuelve los eventos."""
+        ts = db.to_ms(snap.timestamp)
+        pair = snap.pair
+        current: Dict[tuple, list] = {}
+        for ad in snap.ads:
+            current.setdefault(_match_key(ad), []).append(ad)
+
+        events: List[AdEvent] = []
+        with self._lock:
+            previous = self._live.get(pair, {})
+            live: Dict[tuple, List[_LiveAd]] = {}
+            for key, ads in current.items():
+                ads.sort(key=lambda a: a.price)
+                olds = previous.get(key, [])
+                matched = []
+                for i, ad in enumerate(ads):
+                    if i < len(olds):
+                        matched.append(self._update(olds[i], ad, pair, ts, events))
+                    else:
+                        matched.append(self._appear(ad, pair, ts, events))
+                for old in olds[len(ads):]:
+                    self._disappear(old, pair, ts, events)
+                live[key] = matched
+            for key, olds in previous.items():
+                if key not in current:
+                    for old in olds:
+                        self._disappear(old, pair, ts, events)
+            self._live[pair] = live
+            for ev in events:
+                ident = ev.merchant_id
+                self._by_merchant.setdefault(ident, deque()).append(ev)
+                self._order.append((ev.ts_ms, ident))
+            self._prune_locked(ts)
+
+        for fn in self._listeners:
+            try:
+                fn(pair, events)
+            except Exception:
+                pass
+        return events
+
+    def _appear(self, ad, pair, ts, events) -> _LiveAd:
+        ident = _ident(ad)
+        gone_at = self._gone.pop((pair, ident, ad.side), None)
+        if gone_at is not None and ts - gone_at <= self.relist_window_ms:
+            kind, duration = RELIST, ts - gone_at
+        else:
+            kind, duration = APPEAR, 0
+        events.append(AdEvent(kind, pair, ident, ad.merchant, ad.side, ts, duration, ad.price, ad.quantity))
+        return _LiveAd(ident, ad.merchant, ad.side, ad.price, ad.quantity, ts, ts, ts)
+
+    def _update(self, old: _LiveAd, ad, pair, ts, events) -> _LiveAd:
+        if ad.price != old.price:
+            events.append(AdEvent(REPRICE, pair, old.merchant_id, ad.merchant, ad.side, ts, ts - old.price_since,
+                                  ad.price, ad.quantity, prev_price=old.price, prev_quantity=old.quantity))
+            old.price_since = ts
+        if ad.quantity != old.quantity:
+            events.append(AdEvent(REQUANTITY, pair, old.merchant_id, ad.merchant, ad.side, ts,
+                                  ts - old.quantity_since, ad.price, ad.quantity,
+                                  prev_price=old.price, prev_quantity=old.quantity))
+            old.quantity_since = ts
+        old.price = ad.price
+        old.quantity = ad.quantity
+        old.merchant = ad.merchant
+        return old
+
+    def _disappear(self, old: _LiveAd, pair, ts, events):
+        events.append(AdEvent(DISAPPEAR, pair, old.merchant_id, old.merchant, old.side, ts, ts - old.first_seen,
+                              old.price, old.quantity))
+        self._gone[(pair, old.merchant_id, old.side)] = ts
+
+    def _prune_locked(self, now_ms: int):
+        horizon = now_ms - self.stats_window_ms
+        while self._order and self._order[0][0] < horizon:
+            _, ident = self._order.popleft()
+            dq = self._by_merchant.get(ident)
+            if dq:
+                dq.popleft()
+                if not dq:
+                    del self._by_merchant[ident]
+        relist_horizon = now_ms - self.relist_window_ms
+        if len(self._gone) > 4096:
+            self._gone = {k: v for k, v in self._gone.items() if v >= relist_horizon}
+
+    def events_for(self, merchant_id: str, since_ms: int = None) -> List[AdEvent]:
+        with self._lock:
+            evs = list(self._by_merchant.get(merchant_id, ()))
+        if since_ms is not None:
+            evs = [e for e in evs if e.ts_ms >= since_ms]
+        return evs
+
+    def merchant_stats(self, merchant_id: str, seconds: int = None) -> dict:
+        """Repricing / relist / vida media de anuncios de un merchant en la ventana."""
+        since = db.now_ms() - seconds * 1000 if seconds else None
+        counts = {APPEAR: 0, DISAPPEAR: 0, REPRICE: 0, REQUANTITY: 0, RELIST: 0}
+        durations = {DISAPPEAR: [], REPRICE: [], RELIST: []}
+        for ev in self.events_for(merchant_id, since):
+            counts[ev.kind] += 1
+            if ev.kind in durations:
+                durations[ev.kind].append(ev.duration_ms)
+
+        def _avg_s(values):
+            return round(sum(values) / len(values) / 1000, 1) if values else None
+
+        return {
+            'reprices': counts[REPRICE],
+            'requantities': counts[REQUANTITY],
+            'relists': counts[RELIST],
+            'appears': counts[APPEAR],
+            'disappears': counts[DISAPPEAR],
+            'avg_reprice_interval_s': _avg_s(durations[REPRICE]),
+            'avg_relist_latency_s': _avg_s(durations[RELIST]),
+            'avg_ad_lifetime_s': _avg_s(durations[DISAPPEAR]),
+        }
+
+    def live_count(self, pair: str) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._live.get(pair, {}).values())
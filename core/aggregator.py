@@ -1,84 +1,128 @@
 """Minimal aggregator: compute 10-minute buckets from RAM window and persist to DB.
 
-Simple, single-node periodic flush. Intended for experimental validation only (V1).
+Buckets are aligned to the wall clock: each covers [B, B + bucket_seconds) with B
+a multiple of `bucket_seconds` (epoch UTC), is written once it has closed, and is
+upserted under the unique key (pair, resolution, bucket_ts). After a restart the
+aggregator resumes from the last persisted bucket of each pair; whatever is no
+longer in RAM is rebuilt from `raw_archive` (up to `AGGREGATOR_CATCHUP_HOURS`).
+
+The window lock is only held to copy references to the bucket's snapshots;
+metrics are computed outside it with NumPy over each snapshot's cached
+`BookView`, and rows go to the batch writer.
 """
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
+from itertools import groupby
 import threading
-from core import ram_window, db
+import time
+
+import numpy as np
+
+from core import app_config, ram_window, db
+from core.book import top_matrix
+from core.ram_window import Ad, Snapshot
+
+TOP_N = 50
+# margen tras el cierre del bucket para que entren los snapshots del último ciclo
+CLOSE_GRACE_SECONDS = 5
+# bloques BUY/SELL archivados a menos de esto forman un mismo snapshot
+_ARCHIVE_CYCLE_MS = 60_000
 
 
 def _compute_bucket(snaps):
-    prices = []
-    volumes = []
-
-    # Metricas de spread por snapshot
-    snapshot_spreads = []
-    total_volumes = []
-
-    for s in snaps:
-        # side='buy' (Tab Compra): Mercaderes Vendiendo. Mejor: Menor precio.
-        m_sellers = sorted([ad for ad in s.ads if ad.side == 'buy'], key=lambda x: x.price)
-        
-        # side='sell' (Tab Venta): Mercaderes Comprando. Mejor: Mayor precio.
-        m_buyers = sorted([ad for ad in s.ads if ad.side == 'sell'], key=lambda x: x.price, reverse=True)
-
-        # Calcular spread promedio de los primeros 50 para este snapshot
-        n_limit = min(50, len(m_sellers), len(m_buyers))
-        if n_limit > 0:
-            sp_list = []
-            for i in range(n_limit):
-                if m_buyers[i].price > 0:
-                    # Market Spread = (Ask - Bid) / Bid
-                    sp_list.append(((m_sellers[i].price - m_buyers[i].price) / m_buyers[i].price) * 100.0)
-            if sp_list:
-                snapshot_spreads.append(sum(sp_list) / len(sp_list))
-
-        total_vol_snap = sum(ad.quantity for ad in s.ads)
-        total_volumes.append(total_vol_snap)
-
-        for ad in s.ads:
-            prices.append(ad.price)
-            volumes.append(ad.quantity)
-
-    if not prices:
+    if not snaps:
+        return None
+    books = [s.book for s in snaps]
+    prices = np.concatenate([b.prices for b in books])
+    if not len(prices):
         return None
+    volumes = np.concatenate([b.quantities for b in books])
 
-    avg_price = sum(prices) / len(prices)
-    min_price = min(prices)
-    max_price = max(prices)
-    total_vol = sum(volumes)
+    # side='buy' (Tab Compra): Mercaderes Vendiendo. Mejor: Menor precio.
+    # side='sell' (Tab Venta): Mercaderes Comprando. Mejor: Mayor precio.
+    asks = top_matrix([b.ask_prices for b in books], TOP_N)
+    bids = top_matrix([b.bid_prices for b in books], TOP_N)
 
-    # volatility: sample stddev
-    import math
-    mean = avg_price
-    var = sum((p - mean) ** 2 for p in prices) / max(1, len(prices))
-    volatility = math.sqrt(var)
+    # Market Spread = (Ask - Bid) / Bid, posición a posición hasta min(50, asks, bids)
+    n_limit = np.array([min(TOP_N, len(b.ask_prices), len(b.bid_prices)) for b in books])
+    paired = (np.arange(TOP_N)[None, :] < n_limit[:, None]) & (bids > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sp = np.where(paired, (asks - bids) / bids * 100.0, np.nan)
+    has_spread = paired.any(axis=1)
+    snapshot_spreads = np.nanmean(sp[has_spread], axis=1) if has_spread.any() else np.empty(0)
 
-    # Calcular promedios para persistencia detallada
-    # Usamos el promedio de las mejores puntas registradas en cada snapshot
-    avg_cost = mean([mean([ad.price for ad in sorted([a for a in s.ads if a.side=='buy'], key=lambda x: x.price)[:50]]) for s in snaps if any(a.side=='buy' for a in s.ads)]) if snaps else mean(prices)
-    avg_revenue = mean([mean([ad.price for ad in sorted([a for a in s.ads if a.side=='sell'], key=lambda x: x.price, reverse=True)[:50]]) for s in snaps if any(a.side=='sell' for a in s.ads)]) if snaps else mean(prices)
+    total_volumes = np.array([b.quantities.sum() for b in books])
+
+    # Promedio de las mejores 50 puntas de cada snapshot (solo snapshots con ese lado)
+    has_asks = ~np.isnan(asks[:, 0])
+    has_bids = ~np.isnan(bids[:, 0])
+    avg_price = float(prices.mean())
+    avg_cost = float(np.nanmean(asks[has_asks], axis=1).mean()) if has_asks.any() else avg_price
+    avg_revenue = float(np.nanmean(bids[has_bids], axis=1).mean()) if has_bids.any() else avg_price
 
     return {
         'avg_price': avg_price,
-        'min_price': min_price,
-        'max_price': max_price,
-        'volume': total_vol,
-        'spread_pct_bucket': sum(snapshot_spreads) / len(snapshot_spreads) if snapshot_spreads else 0,
-        'volatility': volatility,
-        'sample_count': len(prices),
-        'total_exposed_vol': sum(total_volumes) / len(total_volumes) if total_volumes else 0,
+        'min_price': float(prices.min()),
+        'max_price': float(prices.max()),
+        'volume': float(volumes.sum()),
+        'spread_pct_bucket': float(snapshot_spreads.mean()) if len(snapshot_spreads) else 0,
+        # volatility: population stddev of all ad prices
+        'volatility': float(prices.std()),
+        'sample_count': int(len(prices)),
+        'total_exposed_vol': float(total_volumes.mean()) if len(total_volumes) else 0,
         'avg_cost': avg_cost,
         'avg_revenue': avg_revenue
     }
 
 
+def _snapshot_from_blocks(pair, ts_ms, blocks):
+    ads = []
+    for block in blocks:
+        side = block.trade_type.lower()
+        for item in block.to_raw():
+            adv, advertiser = item["adv"], item["advertiser"]
+            if "price" not in adv:
+                continue
+            # mismos campos que BinanceExchange._simplify
+            ads.append(Ad(
+                price=adv["price"],
+                quantity=float(adv.get("tradableQuantity") or adv.get("surplusAmount") or 0),
+                merchant=advertiser.get("nickName") or "unknown",
+                side=side,
+                min_limit=float(adv.get("minSingleTransAmount") or 0),
+                max_limit=float(adv.get("dynamicMaxSingleTransAmount") or 0),
+                payment_method=", ".join(m.get("tradeMethodName", "") for m in adv.get("tradeMethods", [])),
+                merchant_id=str(advertiser.get("userNo") or "N/A"),
+            ))
+    return Snapshot(timestamp=datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc), pair=pair,
+                    exchange=blocks[0].exchange, ads=ads)
+
+
+def archived_snapshots(pair: str, since_ms: int, until_ms: int):
+    """Snapshots reconstruidos desde raw_archive: un bloque BUY + uno SELL por ciclo de fetch."""
+    from core import raw_archive
+
+    out, group = [], []
+    for block in raw_archive.read_blocks(pair=pair, since=since_ms, until=until_ms, flush=True):
+        if group and (block.trade_type in {b.trade_type for b in group}
+                      or block.ts_ms - group[0].ts_ms > _ARCHIVE_CYCLE_MS):
+            out.append(_snapshot_from_blocks(pair, group[0].ts_ms, group))
+            group = []
+        group.append(block)
+    if group:
+        out.append(_snapshot_from_blocks(pair, group[0].ts_ms, group))
+    return out
+
+
 class Aggregator:
-    def __init__(self, window: ram_window.RamWindow, bucket_seconds: int = 600):
+    def __init__(self, window: ram_window.RamWindow, bucket_seconds: int = 600, catchup_seconds: int = None):
         self.window = window
         self.bucket_seconds = bucket_seconds
+        self.catchup_seconds = (catchup_seconds if catchup_seconds is not None
+                                else app_config.AGGREGATOR_CATCHUP_HOURS * 3600)
         self._stop = threading.Event()
         self._thread = None
+        # pair -> inicio (epoch s) del próximo bucket por persistir; se carga de la DB en el primer flush
+        self._next = None
 
     def start(self):
         if self._thread:
@@ -92,52 +136,105 @@ class Aggregator:
         if self._thread:
             self._thread.join(timeout=1)
 
+    def seconds_to_next_close(self, now: float = None) -> float:
+        now = time.time() if now is None else now
+        return self.bucket_seconds - now % self.bucket_seconds + CLOSE_GRACE_SECONDS
+
     def _run(self):
-        while not self._stop.wait(self.bucket_seconds):
+        # el primer flush (inmediato) recupera los buckets cerrados durante la caída
+        wait = 0
+        while not self._stop.wait(wait):
             try:
                 self.flush_once()
             except Exception:
                 pass
+            wait = self.seconds_to_next_close()
 
-    def flush_once(self):
-        now = datetime.now(timezone.utc)
-        bucket_start = now.replace(second=0, microsecond=0) - timedelta(
-            seconds=now.minute % (self.bucket_seconds // 60) * 60)
-        # for each pair in RAM, aggregate last bucket_seconds
+    def _frozen_slice(self, cutoff):
+        """Referencias a los snapshots posteriores a `cutoff` por par y el snapshot más antiguo
+        en RAM de cada par (único tramo bajo el lock)."""
+        out, oldest = {}, {}
         with self.window.lock:
-            for pair, dq in list(self.window.pair_index.items()):
-                cutoff = now - timedelta(seconds=self.bucket_seconds)
-                snaps = [s for s in dq if s.timestamp >= cutoff]
-                if not snaps:
-                    continue
-                metrics = _compute_bucket(snaps)
-                if metrics is None:
-                    continue
-                db.save_aggregated_price(
-                    pair=pair,
-                    bucket_start=bucket_start.isoformat(),
-                    avg_price=metrics['avg_price'],
-                    min_price=metrics['min_price'],
-                    max_price=metrics['max_price'],
-                    volume=metrics['volume'],
-                    spread_pct=metrics['spread_pct_bucket'],
-                    volatility=metrics['volatility'],
-                    sample_count=metrics['sample_count'],
-                )
-
-                # Guardar metricas financieras historicas
-                db.save_market_metric(
-                    pair, 'avg_spread_top50', metrics['spread_pct_bucket'])
-                db.save_market_metric(
-                    pair, 'total_volume', metrics['total_exposed_vol'])
-                
-                # Persistencia dedicada para historial de spread
-                db.save_spread_entry(
-                    pair, 
-                    metrics['avg_cost'], 
-                    metrics['avg_revenue'], 
-                    metrics['spread_pct_bucket']
-                )
+            for pair, dq in self.window.pair_index.items():
+                if dq:
+                    oldest[pair] = dq[0].timestamp.timestamp()
+                snaps = []
+                for s in reversed(dq):
+                    if s.timestamp < cutoff:
+                        break
+                    snaps.append(s)
+                if snaps:
+                    snaps.reverse()
+                    out[pair] = snaps
+        return out, oldest
+
+    def flush_once(self, now: float = None) -> int:
+        """Persiste cada bucket cerrado pendiente de cada par; retorna buckets escritos."""
+        now = time.time() if now is None else float(now)
+        res = self.bucket_seconds
+        closed_until = int(now) - int(now) % res
+        # sketches de cuantiles de los buckets cerrados (fuera del lock de la ventana)
+        try:
+            self.window.price_sketches.rollup(res, now=now)
+        except Exception:
+            pass
+        if self._next is None:
+            self._next = {pair: ts // 1000 + res for pair, ts in db.last_aggregated_buckets(res, flush=True).items()}
+        floor = closed_until - self.catchup_seconds
+        floor -= floor % res
+        # sin bucket previo: solo el último cerrado
+        default_start = closed_until - res
+        cutoff = max(floor, min([default_start, *self._next.values()]))
+        ram, ram_oldest = self._frozen_slice(datetime.fromtimestamp(cutoff, tz=timezone.utc))
+
+        written = 0
+        for pair in sorted(set(ram) | set(self._next)):
+            start = max(self._next.get(pair, default_start), floor)
+            if start >= closed_until:
+                continue
+            snaps = [s for s in ram.get(pair, ()) if start <= s.timestamp.timestamp() < closed_until]
+            ram_from = min(ram_oldest.get(pair, closed_until), closed_until)
+            if start < ram_from:
+                # tramo que ya no está en RAM (reinicio): desde el archivo crudo
+                snaps = archived_snapshots(pair, start * 1000, int(ram_from * 1000)) + snaps
+            by_bucket = groupby(snaps, key=lambda s: int(s.timestamp.timestamp()) // res * res)
+            for bucket_ts, group in by_bucket:
+                metrics = _compute_bucket(list(group))
+                if metrics is not None:
+                    self._persist(pair, bucket_ts, metrics)
+                    written += 1
+            self._next[pair] = closed_until
+        return written
+
+    def _persist(self, pair, bucket_ts, metrics):
+        db.save_aggregated_price(
+            pair=pair,
+            bucket_start=datetime.fromtimestamp(bucket_ts, tz=timezone.utc).isoformat(),
+            avg_price=metrics['avg_price'],
+            min_price=metrics['min_price'],
+            max_price=metrics['max_price'],
+            volume=metrics['volume'],
+            spread_pct=metrics['spread_pct_bucket'],
+            volatility=metrics['volatility'],
+            sample_count=metrics['sample_count'],
+            resolution=self.bucket_seconds,
+        )
+
+        # Guardar metricas financieras historicas (al cierre del bucket)
+        closed_ms = (bucket_ts + self.bucket_seconds) * 1000
+        db.save_market_metric(
+            pair, 'avg_spread_top50', metrics['spread_pct_bucket'], ts=closed_ms)
+        db.save_market_metric(
+            pair, 'total_volume', metrics['total_exposed_vol'], ts=closed_ms)
+
+        # Persistencia dedicada para historial de spread
+        db.save_spread_entry(
+            pair,
+            metrics['avg_cost'],
+            metrics['avg_revenue'],
+            metrics['spread_pct_bucket'],
+            ts=closed_ms,
+        )
 
 
 _GLOBAL_AGG: Aggregator = None
@@ -34,6 +34,12 @@ def _env_float(key: str, default: float) -> float:
 WINDOW_SECONDS = _env_int("WINDOW_SECONDS", 6 * 3600)
 INGEST_MIN_ROWS = _env_int("INGEST_MIN_ROWS", 100)
 DEFAULT_TZ = os.getenv("DEFAULT_TZ", "America/Bogota")
+# máximo de historia que el agregador recupera (RAM o raw_archive) tras una caída
+AGGREGATOR_CATCHUP_HOURS = _env_int("AGGREGATOR_CATCHUP_HOURS", 24)
+
+# Write-behind batch writer (core/writer.py)
+WRITER_FLUSH_MS = _env_int("WRITER_FLUSH_MS", 250)
+WRITER_MAX_ROWS = _env_int("WRITER_MAX_ROWS", 500)
 
 # Configuración del sistema de automatización /auto
 AUTOMATION_MIN_MINUTES = _env_int("AUTO_MIN_INTERVAL", 30)
@@ -49,6 +55,9 @@ AUTOMATION_MAX_TASKS = {
 DETECTORS: Dict[str, Any] = {
     "volatility": {
         "enabled": _env_bool("DETECTOR_VOLATILITY_ENABLED", True),
+        # clase del detector incremental (core.detectors.runner) y presupuesto de CPU por evaluación
+        "plugin": "core.detectors.volatility:VolatilityDetector",
+        "budget_ms": _env_float("DETECTOR_VOLATILITY_BUDGET_MS", 20.0),
         # percent (fraction) threshold on price stddev / mean to consider volatile
         "stddev_pct_threshold": _env_float("DETECTOR_VOLATILITY_STDDEV_PCT", 0.02),
         "min_samples": _env_int("DETECTOR_VOLATILITY_MIN_SAMPLES", 50),
@@ -56,6 +65,8 @@ DETECTORS: Dict[str, Any] = {
     },
     "liquidity": {
         "enabled": _env_bool("DETECTOR_LIQUIDITY_ENABLED", True),
+        "plugin": "core.detectors.liquidity:LiquidityDetector",
+        "budget_ms": _env_float("DETECTOR_LIQUIDITY_BUDGET_MS", 20.0),
         # absolute volume thresholds per pair over the window
         "buy_volume_threshold": _env_float("DETECTOR_LIQUIDITY_BUY_VOL", 10.0),
         "sell_volume_threshold": _env_float("DETECTOR_LIQUIDITY_SELL_VOL", 10.0),
@@ -63,6 +74,8 @@ DETECTORS: Dict[str, Any] = {
     },
     "merchant": {
         "enabled": _env_bool("DETECTOR_MERCHANT_ENABLED", True),
+        "plugin": "core.detectors.merchant:MerchantActivityDetector",
+        "budget_ms": _env_float("DETECTOR_MERCHANT_BUDGET_MS", 50.0),
         # count of ads from the same merchant in recent seconds to flag
         "activity_count_threshold": _env_int("DETECTOR_MERCHANT_COUNT", 20),
         "activity_window_seconds": _env_int("DETECTOR_MERCHANT_WINDOW", 300),
@@ -70,11 +83,40 @@ DETECTORS: Dict[str, Any] = {
     },
     "merchant_intelligence": {
         "enabled": _env_bool("MERCHANT_INTEL_ENABLED", True),
+        "plugin": "core.detectors.merchant_intel:MerchantIntelDetector",
+        "budget_ms": _env_float("MERCHANT_INTEL_BUDGET_MS", 200.0),
         "weight_frequency": _env_float("MERCHANT_W_FREQ", 0.4),
         "weight_persistence": _env_float("MERCHANT_W_PERSIST", 0.3),
         "weight_relist": _env_float("MERCHANT_W_RELIST", 0.3),
         "history_days": _env_int("MERCHANT_HISTORY_DAYS", 7),
         "top_n_to_track": _env_int("MERCHANT_TRACK_TOP", 50),
+        # cada cuánto se vuelcan por lotes los scores en memoria a merchant_registry
+        "registry_flush_seconds": _env_int("MERCHANT_REGISTRY_FLUSH_SECONDS", 60),
+        # fórmula única del automation score (F: cambios/día, V: apariciones/día)
+        "change_norm": _env_float("MERCHANT_CHANGE_NORM", 50.0),
+        "activity_norm": _env_float("MERCHANT_ACTIVITY_NORM", 40.0),
+        "bot_threshold": _env_float("MERCHANT_BOT_THRESHOLD", 70.0),
+        "active_threshold": _env_float("MERCHANT_ACTIVE_THRESHOLD", 40.0),
+        # re-scoring completo por lotes
+        "rescore_minutes": _env_int("MERCHANT_RESCORE_MINUTES", 15),
+        # una baja seguida de un alta del mismo merchant/lado dentro de esta ventana es un relist
+        "relist_window_seconds": _env_int("MERCHANT_RELIST_WINDOW_SECONDS", 900),
+    },
+    "price_jump": {
+        "enabled": _env_bool("DETECTOR_PRICE_JUMP_ENABLED", True),
+        "plugin": "core.detectors.price_jump:PriceJumpDetector",
+        "budget_ms": _env_float("DETECTOR_PRICE_JUMP_BUDGET_MS", 50.0),
+        # horizontes (s) de los z-scores de bid / ask / mid top-N
+        "horizons": os.getenv("DETECTOR_PRICE_JUMP_HORIZONS", "60,300,1800"),
+        "z_threshold": _env_float("DETECTOR_PRICE_JUMP_Z", 4.0),
+        "min_move_pct": _env_float("DETECTOR_PRICE_JUMP_MIN_MOVE_PCT", 0.3),
+        "min_samples": _env_int("DETECTOR_PRICE_JUMP_MIN_SAMPLES", 5),
+        "top_n": _env_int("DETECTOR_PRICE_JUMP_TOP_N", 10),
+        # CUSUM del spread (en desviaciones estándar del horizonte más largo)
+        "cusum_k": _env_float("DETECTOR_SPREAD_CUSUM_K", 0.5),
+        "cusum_h": _env_float("DETECTOR_SPREAD_CUSUM_H", 5.0),
+        "eval_seconds": _env_int("DETECTOR_PRICE_JUMP_EVAL_SECONDS", 30),
+        "debounce_seconds": _env_int("DETECTOR_PRICE_JUMP_DEBOUNCE", 600),
     },
     "depth": {
         "enabled": _env_bool("DEPTH_WALL_ENABLED", True),
@@ -127,4 +169,5 @@ CONFIG = {
     "umbral_volatilidad": 3,
 }
 
-__all__ = ["get_config", "WINDOW_SECONDS", "INGEST_MIN_ROWS", "DETECTORS", "CONFIG"]
+__all__ = ["get_config", "WINDOW_SECONDS", "INGEST_MIN_ROWS", "DETECTORS", "CONFIG",
+           "WRITER_FLUSH_MS", "WRITER_MAX_ROWS"]
@@ -0,0 +1,91 @@
+"""Vista ordenada del libro de un snapshot (arrays NumPy), calculada una sola vez.
+
+side='buy' (pestaña Compra): merchants vendiendo USDT, mejor = menor precio (asks).
+side='sell' (pestaña Venta): merchants comprando USDT, mejor = mayor precio (bids).
+
+Cada lado lleva además la cantidad y el nocional acumulados desde el mejor precio, de modo que
+el precio efectivo de llenar cualquier monto es una búsqueda binaria más una interpolación.
+"""
+import numpy as np
+
+
+class BookView:
+    __slots__ = ("asks", "bids", "ask_prices", "ask_qty", "bid_prices", "bid_qty", "prices", "quantities",
+                 "ask_cum_qty", "ask_cum_notional", "bid_cum_qty", "bid_cum_notional", "_banks")
+
+    def __init__(self, ads):
+        self.asks = sorted([ad for ad in ads if ad.side == 'buy'], key=lambda a: a.price)
+        self.bids = sorted([ad for ad in ads if ad.side == 'sell'], key=lambda a: a.price, reverse=True)
+        self.ask_prices = np.fromiter((a.price for a in self.asks), dtype=np.float64, count=len(self.asks))
+        self.ask_qty = np.fromiter((a.quantity for a in self.asks), dtype=np.float64, count=len(self.asks))
+        self.bid_prices = np.fromiter((a.price for a in self.bids), dtype=np.float64, count=len(self.bids))
+        self.bid_qty = np.fromiter((a.quantity for a in self.bids), dtype=np.float64, count=len(self.bids))
+        # todos los anuncios en el orden original
+        self.prices = np.fromiter((a.price for a in ads), dtype=np.float64, count=len(ads))
+        self.quantities = np.fromiter((a.quantity for a in ads), dtype=np.float64, count=len(ads))
+        # acumulados desde el mejor precio de cada lado
+        self.ask_cum_qty = np.cumsum(self.ask_qty)
+        self.ask_cum_notional = np.cumsum(self.ask_prices * self.ask_qty)
+        self.bid_cum_qty = np.cumsum(self.bid_qty)
+        self.bid_cum_notional = np.cumsum(self.bid_prices * self.bid_qty)
+        self._banks = {}
+
+    def side(self, side: str):
+        """Anuncios ordenados del lado pedido ('buy' -> asks, 'sell' -> bids)."""
+        return self.asks if side == 'buy' else self.bids
+
+    def prices_of(self, side: str) -> np.ndarray:
+        return self.ask_prices if side == 'buy' else self.bid_prices
+
+    def qty_of(self, side: str) -> np.ndarray:
+        return self.ask_qty if side == 'buy' else self.bid_qty
+
+    def fill(self, side: str, sizes) -> tuple:
+        """Llenado de cada monto (USDT) de `sizes` contra el lado `side`, del mejor precio hacia atrás.
+
+        Devuelve (precio_efectivo, slippage_pct) como arrays; NaN donde el lado no tiene
+        liquidez suficiente (ver `depth_of`).
+        """
+        if side == 'buy':
+            return fill_curve(self.ask_prices, self.ask_cum_qty, self.ask_cum_notional, sizes)
+        return fill_curve(self.bid_prices, self.bid_cum_qty, self.bid_cum_notional, sizes)
+
+    def depth_of(self, side: str) -> float:
+        """Cantidad total visible del lado."""
+        cum = self.ask_cum_qty if side == 'buy' else self.bid_cum_qty
+        return float(cum[-1]) if len(cum) else 0.0
+
+    def for_bank(self, bank: str) -> "BookView":
+        """Vista del libro con solo los anuncios cuyo método de pago contiene `bank` (memoizada)."""
+        key = bank.lower()
+        view = self._banks.get(key)
+        if view is None:
+            ads = [a for a in self.asks + self.bids if key in (a.payment_method or '').lower()]
+            view = self._banks[key] = BookView(ads)
+        return view
+
+
+def fill_curve(prices: np.ndarray, cum_qty: np.ndarray, cum_notional: np.ndarray, sizes) -> tuple:
+    """Precio efectivo y slippage % (vs el mejor precio) para un vector de montos, O(log n) por monto."""
+    sizes = np.atleast_1d(np.asarray(sizes, dtype=np.float64))
+    avg = np.full(sizes.shape, np.nan)
+    if not len(prices):
+        return avg, avg.copy()
+    ok = (sizes > 0) & (sizes <= cum_qty[-1])
+    s = sizes[ok]
+    # primer nivel cuyo acumulado alcanza el monto; el resto se toma a ese precio
+    k = np.searchsorted(cum_qty, s, side='left')
+    prev_qty = np.where(k > 0, cum_qty[k - 1], 0.0)
+    prev_notional = np.where(k > 0, cum_notional[k - 1], 0.0)
+    avg[ok] = (prev_notional + (s - prev_qty) * prices[k]) / s
+    slippage = np.abs(avg / prices[0] - 1) * 100
+    return avg, slippage
+
+
+def top_matrix(arrays, n: int) -> np.ndarray:
+    """Apila los primeros `n` valores de cada array en una matriz (len(arrays), n) rellena con NaN."""
+    out = np.full((len(arrays), n), np.nan)
+    for i, a in enumerate(arrays):
+        k = min(n, len(a))
+        out[i, :k] = a[:k]
+    return out
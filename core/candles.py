@@ -0,0 +1,231 @@
+"""Velas OHLC incrementales por par y lado (1m, 5m, 15m, 1h, 1d).
+
+Cada snapshot actualiza la vela de 1 m abierta de (pair, side) con:
+- best: mejor precio del lado (ask más bajo en 'buy', bid más alto en 'sell'),
+- top: media del top-N del lado,
+- spread: (mejor ask - mejor bid) / mejor bid en %, el mismo en ambos lados,
+más el volumen expuesto del lado (media de la vela, ponderada por muestras `n`).
+
+Al cerrarse, una vela se persiste en `candles_<res>` y se funde en la vela
+abierta de la resolución siguiente: las resoluciones altas se derivan de las
+bajas, nunca de los snapshots. Tras un reinicio, las velas abiertas se siembran
+(y la anterior se repara) con las velas cerradas ya persistidas de la resolución
+inferior. `get_candles` devuelve un rango como arrays NumPy.
+"""
+import math
+import sqlite3
+import threading
+from itertools import groupby
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from core import db, writer
+
+RESOLUTIONS = db.CANDLE_RESOLUTIONS
+COLUMNS = db.CANDLE_COLUMNS
+TOP_N = 10
+
+_LEVEL = {label: i for i, (label, _) in enumerate(RESOLUTIONS)}
+_VOL, _N = len(COLUMNS) - 2, len(COLUMNS) - 1
+
+
+def _level(resolution) -> int:
+    if isinstance(resolution, str):
+        return _LEVEL[resolution]
+    return [res for _, res in RESOLUTIONS].index(int(resolution))
+
+
+def snapshot_points(snap, top_n: int = TOP_N) -> Dict[str, Tuple[float, float, float, float]]:
+    """{side: (best, media top-N, spread %, volumen expuesto)} de un snapshot."""
+    book = snap.book
+    asks, bids = book.ask_prices, book.bid_prices
+    spread = float((asks[0] - bids[0]) / bids[0] * 100) if len(asks) and len(bids) and bids[0] > 0 else math.nan
+    out = {}
+    for side in ('buy', 'sell'):
+        prices = book.prices_of(side)
+        if len(prices):
+            out[side] = (float(prices[0]), float(prices[:top_n].mean()), spread, float(book.qty_of(side).sum()))
+    return out
+
+
+def point_candle(values) -> List[float]:
+    best, top, spread, volume = values
+    return [best] * 4 + [top] * 4 + [spread] * 4 + [volume, 1]
+
+
+def merge_into(acc: List[float], c) -> List[float]:
+    """Funde la vela `c` (posterior en el tiempo) en `acc`, in situ. Los NaN no cuentan."""
+    for i in range(0, _VOL, 4):
+        o, h, l, cl = c[i:i + 4]
+        if acc[i] != acc[i]:
+            acc[i] = o
+        if h > acc[i + 1] or acc[i + 1] != acc[i + 1]:
+            acc[i + 1] = h
+        if l < acc[i + 2] or acc[i + 2] != acc[i + 2]:
+            acc[i + 2] = l
+        if cl == cl:
+            acc[i + 3] = cl
+    n = acc[_N] + c[_N]
+    acc[_VOL] = (acc[_VOL] * acc[_N] + c[_VOL] * c[_N]) / n if n else 0.0
+    acc[_N] = n
+    return acc
+
+
+def derive(rows, resolution: int) -> List[Tuple[int, List[float]]]:
+    """Agrupa velas (ts_ms, *valores) ordenadas por ts en velas de `resolution` segundos."""
+    step = resolution * 1000
+    out = []
+    for start, group in groupby(rows, key=lambda r: r[0] - r[0] % step):
+        group = list(group)
+        acc = list(group[0][1:])
+        for r in group[1:]:
+            merge_into(acc, r[1:])
+        out.append((start, acc))
+    return out
+
+
+def _load(label: str, pair: str, side: str, since_ms: int, until_ms: int, flush: bool = False):
+    if flush:
+        writer.flush()
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        return conn.execute(
+            f"SELECT ts, {', '.join(COLUMNS)} FROM candles_{label} "
+            "WHERE pair = ? AND side = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (pair, side, int(since_ms), int(until_ms))).fetchall()
+    finally:
+        conn.close()
+
+
+def _upsert(label: str, rows):
+    db.init_db()
+    cols = ", ".join(COLUMNS)
+    writer.execute_many(db.DB_PATH, f"""
+        INSERT INTO candles_{label} (pair, side, ts, {cols}) VALUES ({', '.join('?' * (len(COLUMNS) + 3))})
+        ON CONFLICT(pair, side, ts) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in COLUMNS)}
+    """, rows)
+
+
+class CandleEngine:
+    def __init__(self, top_n: int = TOP_N):
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        # (pair, side) -> por resolución, [inicio epoch s, vela] abierta o None
+        self._open: Dict[Tuple[str, str], list] = {}
+
+    def add_snapshot(self, snap):
+        ts = int(snap.timestamp.timestamp())
+        points = snapshot_points(snap, self.top_n)
+        with self._lock:
+            missing = [(snap.pair, side) for side in points if (snap.pair, side) not in self._open]
+        # la siembra lee la DB: fuera del lock, los lectores de velas abiertas no esperan a disco
+        seeds = {key: self._seed(key, ts) for key in missing}
+        closed: Dict[int, list] = {}
+        with self._lock:
+            for side, values in points.items():
+                key = (snap.pair, side)
+                slots = self._open.get(key)
+                if slots is None:
+                    slots, repaired = seeds[key]
+                    self._open[key] = slots
+                    for level, rows in repaired.items():
+                        closed.setdefault(level, []).extend(rows)
+                self._add(key, slots, 0, ts - ts % RESOLUTIONS[0][1], point_candle(values), closed)
+        for level, rows in closed.items():
+            _upsert(RESOLUTIONS[level][0], rows)
+
+    def _add(self, key, slots, level, start, candle, closed):
+        """Funde `candle` en la vela abierta de `level`; si empieza un bucket nuevo, cierra la
+        anterior y la propaga a la resolución siguiente."""
+        cur = slots[level]
+        if cur is not None and start > cur[0]:
+            prev_start, prev = cur
+            closed.setdefault(level, []).append((*key, prev_start * 1000, *prev))
+            if level + 1 < len(RESOLUTIONS):
+                up = RESOLUTIONS[level + 1][1]
+                self._add(key, slots, level + 1, prev_start - prev_start % up, prev, closed)
+            cur = None
+        if cur is None:
+            slots[level] = [start, list(candle)]
+        else:
+            merge_into(cur[1], candle)
+
+    def _seed(self, key, ts: int) -> Tuple[list, Dict[int, list]]:
+        """Velas abiertas de cada resolución a partir de las inferiores ya persistidas.
+
+        Re-deriva también el bucket anterior de cada resolución, que pudo quedar sin
+        cerrar si el proceso se detuvo a mitad; esas velas se devuelven por nivel para
+        que el llamador las persista junto con las cerradas.
+        """
+        slots = [None] * len(RESOLUTIONS)
+        repaired: Dict[int, list] = {}
+        # reparadas del nivel inferior, aún sin persistir: cuentan para derivar el siguiente
+        pending: Dict[int, list] = {}
+        try:
+            for level in range(1, len(RESOLUTIONS)):
+                res = RESOLUTIONS[level][1]
+                start = ts - ts % res
+                lower_label, lower_res = RESOLUTIONS[level - 1]
+                lower_open = ts - ts % lower_res
+                since_ms, until_ms = (start - res) * 1000, lower_open * 1000
+                rows = _load(lower_label, *key, since_ms, until_ms)
+                if pending:
+                    rows = sorted([r for r in rows if r[0] not in pending]
+                                  + [(b, *c) for b, c in pending.items() if since_ms <= b < until_ms],
+                                  key=lambda r: r[0])
+                pending = {}
+                for bucket_ms, candle in derive(rows, res):
+                    if bucket_ms // 1000 == start:
+                        slots[level] = [start, candle]
+                    else:
+                        repaired.setdefault(level, []).append((*key, bucket_ms, *candle))
+                        pending[bucket_ms] = candle
+        except Exception:
+            pass
+        return slots, repaired
+
+    def open_candles(self, pair: str, side: str, resolution) -> List[Tuple[int, List[float]]]:
+        """Velas aún no persistidas de `resolution` como [(inicio epoch s, vela)], en orden.
+
+        Incluye lo que siguen acumulando las resoluciones inferiores abiertas; puede haber
+        dos buckets si la vela anterior espera a que cierre la inferior para cerrarse.
+        """
+        level = _level(resolution)
+        res = RESOLUTIONS[level][1]
+        with self._lock:
+            slots = self._open.get((pair, side)) or []
+            # de la resolución pedida hacia abajo = orden cronológico
+            parts = [(s[0], list(s[1])) for s in reversed(slots[:level + 1]) if s is not None]
+        out = []
+        for start, candle in parts:
+            start -= start % res
+            if out and out[-1][0] == start:
+                merge_into(out[-1][1], candle)
+            else:
+                out.append((start, candle))
+        return out
+
+
+def get_candles(pair: str, side: str, resolution="1m", since=None, until=None,
+                engine: CandleEngine = None, include_open: bool = True) -> Dict[str, np.ndarray]:
+    """Velas de [since, until) como {'ts': int64 ms, columna: float64} (incluye la vela en curso)."""
+    label, res = RESOLUTIONS[_level(resolution)]
+    since_ms = db.to_ms(since) if since is not None else 0
+    until_ms = db.to_ms(until) if until is not None else 2 ** 62
+    rows = _load(label, pair, side, since_ms, until_ms)
+    if include_open:
+        if engine is None:
+            from core.ram_window import get_global
+            engine = get_global().candles
+        pending = [(start * 1000, *c) for start, c in engine.open_candles(pair, side, label)
+                   if since_ms <= start * 1000 < until_ms]
+        if pending:
+            starts = {r[0] for r in pending}
+            rows = [r for r in rows if r[0] not in starts] + pending
+    arr = np.array(rows, dtype=np.float64).reshape(len(rows), len(COLUMNS) + 1)
+    out = {'ts': arr[:, 0].astype(np.int64)}
+    for i, col in enumerate(COLUMNS, start=1):
+        out[col] = arr[:, i]
+    return out
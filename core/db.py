@@ -3,12 +3,85 @@ import json
 from pathlib import Path
 from datetime import datetime, timezone, timedelta
 
+from core import partitions, writer
+
 DB_PATH = Path("data/p2p_data.db")
 
+# rutas ya inicializadas en este proceso (evita repetir los CREATE en cada escritura)
+_READY_PATHS = set()
+
+# columnas de tiempo ISO TEXT sustituidas por epoch-ms INTEGER (ver scripts/maintain_db.py)
+LEGACY_TIME_COLUMNS = (
+    ("snapshots", "timestamp_utc", "ts"),
+    ("aggregated_prices", "bucket_start", "bucket_ts"),
+    ("events", "timestamp", "ts"),
+    ("market_metrics_history", "timestamp", "ts"),
+    ("spread_analysis", "timestamp", "ts"),
+    ("merchant_history", "timestamp", "ts"),
+    ("bot_usage_logs", "timestamp", "ts"),
+)
+
+# velas OHLC por resolución (core.candles): una tabla compacta por etiqueta
+CANDLE_RESOLUTIONS = (("1m", 60), ("5m", 300), ("15m", 900), ("1h", 3600), ("1d", 86400))
+CANDLE_COLUMNS = (
+    "best_open", "best_high", "best_low", "best_close",
+    "top_open", "top_high", "top_low", "top_close",
+    "spread_open", "spread_high", "spread_low", "spread_close",
+    "volume", "n",
+)
+
+# columnas añadidas después del esquema inicial (ver scripts/maintain_db.py)
+REQUIRED_COLUMNS = (
+    ("aggregated_prices", "resolution"),
+)
+
+
+def to_ms(value) -> int:
+    """datetime / ISO string / epoch-ms -> epoch milliseconds (UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(round(value.timestamp() * 1000))
+
+
+def ms_to_iso(ms) -> str:
+    if ms is None:
+        return None
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).isoformat()
+
+
+def now_ms() -> int:
+    return to_ms(datetime.now(timezone.utc))
+
+
+def _check_legacy_schema(conn):
+    for table, old, new in LEGACY_TIME_COLUMNS:
+        cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        if old in cols and new not in cols:
+            raise RuntimeError(
+                f"La tabla {table} usa el esquema antiguo ({old} TEXT). Ejecuta scripts/maintain_db.py para migrar.")
+    for table, col in REQUIRED_COLUMNS:
+        cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+        if cols and col not in cols:
+            raise RuntimeError(
+                f"La tabla {table} no tiene la columna {col}. Ejecuta scripts/maintain_db.py para migrar.")
+
 
 def _ensure_db():
+    if str(DB_PATH) in _READY_PATHS and DB_PATH.exists():
+        return
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
+    try:
+        _check_legacy_schema(conn)
+    finally:
+        conn.close()
+    conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     cur.execute(
         """
@@ -22,6 +95,34 @@ def _ensure_db():
         )
         """
     )
+    # archivo compacto de respuestas crudas (ver core/raw_archive.py)
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS raw_archive_blocks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts_ms INTEGER NOT NULL,
+            exchange TEXT NOT NULL,
+            pair TEXT NOT NULL,
+            trade_type TEXT NOT NULL,
+            n_ads INTEGER,
+            codec TEXT NOT NULL,
+            payload BLOB NOT NULL
+        )
+        """
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_raw_archive_pair_ts ON raw_archive_blocks(pair, trade_type, ts_ms)")
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS raw_archive_dict (
+            kind TEXT NOT NULL,
+            code INTEGER NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (kind, code),
+            UNIQUE (kind, value)
+        )
+        """
+    )
     conn.commit()
     conn.close()
 
@@ -32,7 +133,7 @@ def _ensure_db():
         """
         CREATE TABLE IF NOT EXISTS snapshots (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp_utc TEXT NOT NULL,
+            ts INTEGER NOT NULL,
             pair TEXT NOT NULL,
             rows_fetched INTEGER,
             avg_price_simple REAL,
@@ -57,16 +158,15 @@ def _ensure_db():
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_snapshots_pair ON snapshots(pair)")
-    cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_snapshots_ts ON snapshots(timestamp_utc)")
-    # aggregated prices table (10-minute buckets)
+        "CREATE INDEX IF NOT EXISTS idx_snapshots_pair_ts ON snapshots(pair, ts)")
+    # aggregated prices table (buckets alineados al reloj; resolution en segundos)
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS aggregated_prices (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             pair TEXT NOT NULL,
-            bucket_start TEXT NOT NULL,
+            bucket_ts INTEGER NOT NULL,
+            resolution INTEGER NOT NULL DEFAULT 600,
             avg_price REAL,
             min_price REAL,
             max_price REAL,
@@ -77,8 +177,28 @@ def _ensure_db():
         )
         """
     )
+    # un bucket por (pair, resolution, bucket_ts): reprocesar es un upsert, no un duplicado
+    cur.execute("DROP INDEX IF EXISTS idx_agg_pair_bucket")
+    cur.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_agg_pair_res_bucket ON aggregated_prices(pair, resolution, bucket_ts)")
+    # t-digest de precios por bucket de rollup (core.sketches)
     cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_agg_pair_bucket ON aggregated_prices(pair, bucket_start)")
+        """
+        CREATE TABLE IF NOT EXISTS price_sketches (
+            pair TEXT NOT NULL,
+            side TEXT NOT NULL,
+            bucket_ts INTEGER NOT NULL,
+            n INTEGER,
+            digest BLOB,
+            PRIMARY KEY (pair, side, bucket_ts)
+        )
+        """
+    )
+    for label, _ in CANDLE_RESOLUTIONS:
+        cols = ", ".join(f"{c} INTEGER" if c == "n" else f"{c} REAL" for c in CANDLE_COLUMNS)
+        cur.execute(
+            f"CREATE TABLE IF NOT EXISTS candles_{label} (pair TEXT NOT NULL, side TEXT NOT NULL, "
+            f"ts INTEGER NOT NULL, {cols}, PRIMARY KEY (pair, side, ts)) WITHOUT ROWID")
     # events table (simple signals/anomalies)
     cur.execute(
         """
@@ -86,13 +206,14 @@ def _ensure_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             event_type TEXT NOT NULL,
             pair TEXT,
-            timestamp TEXT NOT NULL,
+            ts INTEGER NOT NULL,
             severity INTEGER,
             details TEXT
         )
         """
     )
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_type_pair_ts ON events(event_type, pair, ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_events_ts ON events(ts)")
 
     # Tabla de métricas históricas (para /spread dia, /volume, /depth)
     cur.execute(
@@ -102,15 +223,13 @@ def _ensure_db():
             pair TEXT NOT NULL,
             metric_name TEXT NOT NULL,
             value REAL NOT NULL,
-            timestamp TEXT NOT NULL,
+            ts INTEGER NOT NULL,
             details TEXT
         )
         """
     )
     cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_metrics_name_ts ON market_metrics_history(metric_name, timestamp)")
-    cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_metrics_pair ON market_metrics_history(pair)")
+        "CREATE INDEX IF NOT EXISTS idx_metrics_pair_name_ts ON market_metrics_history(pair, metric_name, ts)")
 
     # Tabla para persistencia de /spread (Mapa de calor y análisis histórico)
     cur.execute(
@@ -118,7 +237,7 @@ def _ensure_db():
         CREATE TABLE IF NOT EXISTS spread_analysis (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             pair TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
+            ts INTEGER NOT NULL,
             avg_cost REAL,
             avg_revenue REAL,
             spread_pct REAL,
@@ -126,8 +245,25 @@ def _ensure_db():
         )
         """
     )
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_spread_ts ON spread_analysis(timestamp)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_spread_pair ON spread_analysis(pair)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_spread_pair_ts ON spread_analysis(pair, ts)")
+    # Mapa de calor de spread pre-agregado por hora local (core.heatmap): suma y conteo por bucket
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS spread_heatmap (
+            pair TEXT NOT NULL,
+            tz TEXT NOT NULL,
+            bucket_ts INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            dow INTEGER NOT NULL,
+            hour INTEGER NOT NULL,
+            total REAL NOT NULL,
+            n INTEGER NOT NULL,
+            PRIMARY KEY (pair, tz, bucket_ts)
+        ) WITHOUT ROWID
+        """
+    )
+    # zonas horarias ya reconstruidas desde spread_analysis (a partir de ahí, solo incremental)
+    cur.execute("CREATE TABLE IF NOT EXISTS spread_heatmap_state (tz TEXT PRIMARY KEY, built_ts INTEGER NOT NULL)")
 
     # Tabla para registro de donaciones / pagos (TTPay)
     cur.execute(
@@ -158,12 +294,11 @@ def _ensure_db():
             price REAL NOT NULL,
             position INTEGER,
             volume REAL,
-            timestamp TEXT NOT NULL
+            ts INTEGER NOT NULL
         )
         """
     )
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_merchant_id ON merchant_history(merchant_id)")
-    cur.execute("CREATE INDEX IF NOT EXISTS idx_merchant_ts ON merchant_history(timestamp)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_merchant_id_ts ON merchant_history(merchant_id, ts)")
 
     # Tabla para perfiles persistentes y scores de automatización
     cur.execute(
@@ -178,6 +313,8 @@ def _ensure_db():
         )
         """
     )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_registry_score ON merchant_registry(automation_score)")
     
     # Tabla legacy/analytics para promedios por hora necesarios en /merchant
     cur.execute("""
@@ -196,6 +333,7 @@ def _ensure_db():
 
     conn.commit()
     conn.close()
+    _READY_PATHS.add(str(DB_PATH))
 
 
 def init_db():
@@ -203,34 +341,28 @@ def init_db():
 
 
 def save_raw_response(exchange: str, fiat: str, trade_type: str, raw):
-    """Guarda la respuesta cruda (lista/dict) como JSON en la DB."""
+    """Guarda la respuesta cruda (lista de anuncios) en el archivo compacto."""
+    from core import raw_archive
+
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    payload = json.dumps(raw, ensure_ascii=False)
-    timestamp = datetime.now(timezone.utc).isoformat()
-    cur.execute(
-        "INSERT INTO raw_responses (timestamp_utc, exchange, fiat, trade_type, raw_json) VALUES (?,?,?,?,?)",
-        (timestamp, exchange, fiat, trade_type, payload),
-    )
-    conn.commit()
-    conn.close()
+    raw_list = raw if isinstance(raw, list) else (raw or {}).get("data", []) if isinstance(raw, dict) else []
+    raw_archive.append_block(exchange, f"USDT-{fiat}", trade_type, raw_list)
 
 
 def save_snapshot_summary(pair: str, summary: dict):
     """Guarda un snapshot resumido en la tabla `snapshots`.
 
     `summary` se espera que contenga claves compatibles con el antiguo CSV.
+    El insert va por el writer por lotes.
     """
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = summary.get("timestamp_utc") or datetime.now(timezone.utc).isoformat()
-    raw = json.dumps(summary, ensure_ascii=False)
-    cur.execute(
+    ts = to_ms(summary.get("timestamp_utc")) or now_ms()
+    # raw_json ya no se escribe: los lectores reconstruyen el resumen desde las columnas
+    writer.execute(
+        DB_PATH,
         """
         INSERT INTO snapshots (
-            timestamp_utc, pair, rows_fetched, avg_price_simple,
+            ts, pair, rows_fetched, avg_price_simple,
             avg_price_weighted, spread_pct, coef_var, total_exposed_volume,
             top1_price, top1_vol, top1_nick, top3_prices,
             arb_estimate_cop_to_ves_pct, arb_estimate_ves_to_cop_pct, raw_json
@@ -251,11 +383,9 @@ def save_snapshot_summary(pair: str, summary: dict):
             summary.get("top3_prices"),
             summary.get("arb_estimate_cop_to_ves_pct"),
             summary.get("arb_estimate_ves_to_cop_pct"),
-            raw,
+            None,
         ),
     )
-    conn.commit()
-    conn.close()
 
 
 def init_merchant_stats_table():
@@ -278,50 +408,82 @@ def init_merchant_stats_table():
     conn.close()
 
 
+_SNAPSHOT_COLUMNS = (
+    "ts", "pair", "rows_fetched", "avg_price_simple", "avg_price_weighted",
+    "spread_pct", "coef_var", "total_exposed_volume", "top1_price", "top1_vol",
+    "top1_nick", "top3_prices", "arb_estimate_cop_to_ves_pct", "arb_estimate_ves_to_cop_pct",
+)
+_SNAPSHOT_SELECT = "SELECT " + ", ".join(_SNAPSHOT_COLUMNS) + ", raw_json FROM snapshots"
+
+
+def _snapshot_row(row):
+    """Convierte una fila de `snapshots` al formato {timestamp_utc, pair, raw}."""
+    summary = dict(zip(_SNAPSHOT_COLUMNS, row[:-1]))
+    summary["timestamp_utc"] = ms_to_iso(summary.pop("ts"))
+    raw = summary
+    if row[-1]:
+        # filas antiguas con la copia JSON
+        try:
+            raw = json.loads(row[-1])
+        except Exception:
+            raw = row[-1]
+    return {"timestamp_utc": summary["timestamp_utc"], "pair": summary["pair"], "raw": raw}
+
+
 def fetch_latest_snapshots(limit: int = 10):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cur.execute(
-        "SELECT timestamp_utc, pair, raw_json FROM snapshots ORDER BY id DESC LIMIT ?", (limit,))
+    cur.execute(_SNAPSHOT_SELECT + " ORDER BY ts DESC LIMIT ?", (limit,))
     rows = cur.fetchall()
     conn.close()
-    results = []
-    for ts, pair, raw in rows:
-        try:
-            parsed = json.loads(raw)
-        except Exception:
-            parsed = raw
-        results.append({"timestamp_utc": ts, "pair": pair, "raw": parsed})
-    return results
+    return [_snapshot_row(r) for r in rows]
 
 
 def save_aggregated_price(pair: str, bucket_start: str, avg_price: float = None, min_price: float = None,
                           max_price: float = None, volume: float = None, spread_pct: float = None,
-                          volatility: float = None, sample_count: int = None):
+                          volatility: float = None, sample_count: int = None, resolution: int = 600):
+    """Upsert del bucket (pair, resolution, bucket_start): recalcularlo lo reemplaza."""
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO aggregated_prices (pair, bucket_start, avg_price, min_price, max_price, volume, spread_pct, volatility, sample_count) VALUES (?,?,?,?,?,?,?,?,?)",
-        (pair, bucket_start, avg_price, min_price, max_price,
+    writer.execute(
+        DB_PATH,
+        """INSERT INTO aggregated_prices (pair, bucket_ts, resolution, avg_price, min_price, max_price, volume, spread_pct, volatility, sample_count)
+           VALUES (?,?,?,?,?,?,?,?,?,?)
+           ON CONFLICT(pair, resolution, bucket_ts) DO UPDATE SET
+               avg_price = excluded.avg_price, min_price = excluded.min_price, max_price = excluded.max_price,
+               volume = excluded.volume, spread_pct = excluded.spread_pct, volatility = excluded.volatility,
+               sample_count = excluded.sample_count""",
+        (pair, to_ms(bucket_start), int(resolution), avg_price, min_price, max_price,
          volume, spread_pct, volatility, sample_count),
     )
-    conn.commit()
-    conn.close()
 
 
-def fetch_recent_aggregates(pair: str, limit: int = 50):
+def last_aggregated_buckets(resolution: int = 600, flush: bool = False) -> dict:
+    """{pair: bucket_ts (epoch ms)} del último bucket persistido de cada par (`flush`: espera la cola del writer)."""
+    _ensure_db()
+    if flush:
+        writer.flush()
+    conn = sqlite3.connect(DB_PATH)
+    try:
+        rows = conn.execute(
+            "SELECT pair, MAX(bucket_ts) FROM aggregated_prices WHERE resolution = ? GROUP BY pair",
+            (int(resolution),)).fetchall()
+    finally:
+        conn.close()
+    return {pair: ts for pair, ts in rows}
+
+
+def fetch_recent_aggregates(pair: str, limit: int = 50, resolution: int = 600):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cur.execute("SELECT bucket_start, avg_price, min_price, max_price, volume, spread_pct, volatility, sample_count FROM aggregated_prices WHERE pair = ? ORDER BY id DESC LIMIT ?", (pair, limit))
+    cur.execute("SELECT bucket_ts, avg_price, min_price, max_price, volume, spread_pct, volatility, sample_count FROM aggregated_prices WHERE pair = ? AND resolution = ? ORDER BY bucket_ts DESC LIMIT ?", (pair, int(resolution), limit))
     rows = cur.fetchall()
     conn.close()
     out = []
     for row in rows:
         out.append({
-            'bucket_start': row[0],
+            'bucket_start': ms_to_iso(row[0]),
             'avg_price': row[1],
             'min_price': row[2],
             'max_price': row[3],
@@ -335,67 +497,37 @@ def fetch_recent_aggregates(pair: str, limit: int = 50):
 
 def save_event(event_type: str, pair: str, timestamp: str, details: dict = None, severity: int = 1):
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
     payload = json.dumps(details or {}, ensure_ascii=False)
-    cur.execute("INSERT INTO events (event_type, pair, timestamp, severity, details) VALUES (?,?,?,?,?)",
-                (event_type, pair, timestamp, severity, payload))
-    conn.commit()
-    conn.close()
+    ts = to_ms(timestamp) or now_ms()
+    table = partitions.table_for_write("events", ts)
+    writer.execute(DB_PATH, f"INSERT INTO {table} (event_type, pair, ts, severity, details) VALUES (?,?,?,?,?)",
+                   (event_type, pair, ts, severity, payload))
 
 
 def recent_event_exists(event_type: str, pair: str, within_seconds: int = 300, match_details: dict = None) -> bool:
     """Return True if a recent event of same type/pair exists within `within_seconds`.
 
-    If `match_details` is provided, the function will compare the stored event `details`
-    JSON and require that all keys in `match_details` match exactly.
+    Answered from the in-memory dedup cache (`core.event_dedup`), warmed from
+    `events` on first use. If `match_details` is provided, only events with the
+    same values for those keys count.
     """
-    _ensure_db()
-    import datetime
-
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    # fetch recent events of this type/pair (limit to reasonable number)
-    cur.execute("SELECT timestamp, details FROM events WHERE event_type = ? AND pair = ? ORDER BY id DESC LIMIT 200", (event_type, pair))
-    rows = cur.fetchall()
-    conn.close()
+    from core import event_dedup
 
-    now = datetime.datetime.now(datetime.timezone.utc)
-    for ts_str, details_json in rows:
-        try:
-            ts = datetime.datetime.fromisoformat(ts_str)
-        except Exception:
-            # fallback: skip unparsable timestamps
-            continue
-        delta = (now - ts).total_seconds()
-        if delta <= within_seconds:
-            if match_details:
-                try:
-                    parsed = json.loads(details_json or "{}")
-                except Exception:
-                    parsed = {}
-                ok = True
-                for k, v in match_details.items():
-                    if parsed.get(k) != v:
-                        ok = False
-                        break
-                if ok:
-                    return True
-                else:
-                    continue
-            else:
-                return True
-    return False
+    return event_dedup.seen_recently(event_type, pair, within_seconds, match=match_details)
 
 
 def save_event_dedup(event_type: str, pair: str, timestamp: str, details: dict = None, severity: int = 1, dedup_seconds: int = 300, match_details: dict = None):
     """Save event only if a similar recent event does not exist.
 
-    `match_details` is forwarded to `recent_event_exists` to compare specific fields (e.g., merchant).
+    The check-and-mark is an O(1) lookup in `core.event_dedup`; `match_details`
+    narrows the key to specific fields (e.g., merchant).
     """
-    if recent_event_exists(event_type, pair, within_seconds=dedup_seconds, match_details=match_details):
+    from core import event_dedup
+
+    ts = to_ms(timestamp) or now_ms()
+    if not event_dedup.check_and_mark(event_type, pair, dedup_seconds, match=match_details, ts_ms=ts):
         return False
-    save_event(event_type, pair, timestamp, details=details, severity=severity)
+    save_event(event_type, pair, ts, details=details, severity=severity)
     return True
 
 
@@ -404,18 +536,12 @@ def get_latest_snapshot_for_pair(pair: str):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cur.execute(
-        "SELECT timestamp_utc, raw_json FROM snapshots WHERE pair = ? ORDER BY id DESC LIMIT 1", (pair,))
+    cur.execute(_SNAPSHOT_SELECT + " WHERE pair = ? ORDER BY ts DESC LIMIT 1", (pair,))
     row = cur.fetchone()
     conn.close()
     if not row:
         return None
-    ts, raw = row
-    try:
-        parsed = json.loads(raw)
-    except Exception:
-        parsed = raw
-    return {"timestamp_utc": ts, "pair": pair, "raw": parsed}
+    return _snapshot_row(row)
 
 
 def query_snapshots(pair: str = None, since: str = None, limit: int = 100):
@@ -428,34 +554,37 @@ def query_snapshots(pair: str = None, since: str = None, limit: int = 100):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    q = "SELECT timestamp_utc, pair, raw_json FROM snapshots"
+    q = _SNAPSHOT_SELECT
     conds = []
     params = []
     if pair:
         conds.append("pair = ?")
         params.append(pair)
     if since:
-        conds.append("timestamp_utc >= ?")
-        params.append(since)
+        conds.append("ts >= ?")
+        params.append(to_ms(since))
     if conds:
         q += " WHERE " + " AND ".join(conds)
-    q += " ORDER BY id DESC LIMIT ?"
+    q += " ORDER BY ts DESC LIMIT ?"
     params.append(limit)
     cur.execute(q, params)
     rows = cur.fetchall()
     conn.close()
-    out = []
-    for ts, p, raw in rows:
-        try:
-            parsed = json.loads(raw)
-        except Exception:
-            parsed = raw
-        out.append({"timestamp_utc": ts, "pair": p, "raw": parsed})
-    return out
+    return [_snapshot_row(r) for r in rows]
 
 
 def fetch_latest_raw(exchange: str = None, fiat: str = None, trade_type: str = None, limit: int = 10):
+    """Últimas respuestas crudas; lee el archivo compacto y cae a `raw_responses` (legacy)."""
+    from core import raw_archive
+
     _ensure_db()
+    blocks = raw_archive.read_blocks(
+        pair=f"USDT-{fiat}" if fiat else None, trade_type=trade_type, exchange=exchange,
+        limit=limit, latest_first=True)
+    if blocks:
+        return [{"timestamp_utc": b.timestamp_utc, "exchange": b.exchange, "fiat": b.fiat,
+                 "trade_type": b.trade_type, "raw": b.to_raw()} for b in blocks]
+
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     q = "SELECT timestamp_utc, exchange, fiat, trade_type, raw_json FROM raw_responses"
@@ -488,19 +617,16 @@ def fetch_latest_raw(exchange: str = None, fiat: str = None, trade_type: str = N
     return results
 
 
-def save_market_metric(pair: str, metric_name: str, value: float, details: dict = None):
-    """Guarda una métrica de mercado histórica."""
+def save_market_metric(pair: str, metric_name: str, value: float, details: dict = None, ts=None):
+    """Guarda una métrica de mercado histórica (`ts` por defecto: ahora)."""
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = datetime.now(timezone.utc).isoformat()
+    ts = to_ms(ts) if ts is not None else now_ms()
     det_json = json.dumps(details, ensure_ascii=False) if details else None
-    cur.execute(
-        "INSERT INTO market_metrics_history (pair, metric_name, value, timestamp, details) VALUES (?,?,?,?,?)",
+    writer.execute(
+        DB_PATH,
+        f"INSERT INTO {partitions.table_for_write('market_metrics_history', ts)} (pair, metric_name, value, ts, details) VALUES (?,?,?,?,?)",
         (pair, metric_name, value, ts, det_json)
     )
-    conn.commit()
-    conn.close()
 
 
 def fetch_metrics_history(pair: str, metric_name: str, since_hours: int = 24):
@@ -508,47 +634,67 @@ def fetch_metrics_history(pair: str, metric_name: str, since_hours: int = 24):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cutoff = datetime.now(timezone.utc).replace(microsecond=0)
-    import datetime as dt_mod
-    cutoff = (cutoff - dt_mod.timedelta(hours=since_hours)).isoformat()
-
+    cutoff = now_ms() - since_hours * 3600 * 1000
+    src = partitions.source(conn, "market_metrics_history", since=cutoff,
+                            columns="pair, metric_name, ts, value, details")
     cur.execute(
-        "SELECT timestamp, value, details FROM market_metrics_history WHERE pair = ? AND metric_name = ? AND timestamp >= ? ORDER BY timestamp ASC",
+        f"SELECT ts, value, details FROM {src} WHERE pair = ? AND metric_name = ? AND ts >= ? ORDER BY ts ASC",
         (pair, metric_name, cutoff)
     )
     rows = cur.fetchall()
     conn.close()
-    return [{"timestamp": r[0], "value": r[1], "details": json.loads(r[2]) if r[2] else None} for r in rows]
+    return [{"timestamp": ms_to_iso(r[0]), "value": r[1], "details": json.loads(r[2]) if r[2] else None} for r in rows]
 
 
-def save_spread_entry(pair: str, cost: float, revenue: float, spread: float, details: dict = None):
+def save_spread_entry(pair: str, cost: float, revenue: float, spread: float, details: dict = None, ts=None):
     """Guarda una entrada en el historial de spread para persistencia a largo plazo."""
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = datetime.now(timezone.utc).isoformat()
+    ts = to_ms(ts) if ts is not None else now_ms()
     det_json = json.dumps(details, ensure_ascii=False) if details else None
-    cur.execute(
-        "INSERT INTO spread_analysis (pair, timestamp, avg_cost, avg_revenue, spread_pct, details) VALUES (?,?,?,?,?,?)",
+    writer.execute(
+        DB_PATH,
+        f"INSERT INTO {partitions.table_for_write('spread_analysis', ts)} (pair, ts, avg_cost, avg_revenue, spread_pct, details) VALUES (?,?,?,?,?,?)",
         (pair, ts, cost, revenue, spread, det_json)
     )
-    conn.commit()
-    conn.close()
+    if spread is not None:
+        from core import heatmap
+
+        heatmap.record(pair, ts, spread)
 
 
 def cleanup_old_data(days: int = 30):
-    """Elimina datos antiguos para mantener la DB ligera (retención de 30 días)."""
+    """Elimina datos antiguos para mantener la DB ligera (retención de 30 días).
+
+    Las tablas particionadas se recortan borrando particiones diarias completas.
+    """
+    from core import app_config
+
     _ensure_db()
+    cutoff = partitions.cutoff_days_ago(days)
+    history_days = app_config.DETECTORS.get('merchant_intelligence', {}).get('history_days', 7)
+    retention = {
+        "raw_archive_blocks": cutoff,
+        "events": cutoff,
+        "market_metrics_history": cutoff,
+        "spread_analysis": cutoff,
+        "merchant_history": partitions.cutoff_days_ago(history_days),
+    }
+    for base, base_cutoff in retention.items():
+        try:
+            partitions.drop_older_than(base, base_cutoff)
+        except Exception:
+            pass
+
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
     try:
-        # Limpiar spreads antiguos
-        cur.execute("DELETE FROM spread_analysis WHERE timestamp < ?", (cutoff,))
-        # Limpiar métricas antiguas
-        cur.execute("DELETE FROM market_metrics_history WHERE timestamp < ?", (cutoff,))
+        cur.execute("DELETE FROM raw_responses WHERE timestamp_utc < ?", (cutoff.isoformat(),))
         # Limpiar logs de uso antiguos
-        cur.execute("DELETE FROM bot_usage_logs WHERE timestamp < ?", (cutoff,))
+        cur.execute("DELETE FROM bot_usage_logs WHERE ts < ?", (to_ms(cutoff),))
+        cur.execute("DELETE FROM price_sketches WHERE bucket_ts < ?", (to_ms(cutoff),))
+        # velas de 1 m: las resoluciones mayores ya las resumen
+        cur.execute("DELETE FROM candles_1m WHERE ts < ?", (to_ms(cutoff),))
+        cur.execute("DELETE FROM spread_heatmap WHERE bucket_ts < ?", (to_ms(cutoff),))
         conn.commit()
     except Exception:
         pass
@@ -561,29 +707,32 @@ def fetch_spread_analysis(pair: str, hours: int = 24):
     _ensure_db()
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
-    cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    cutoff = now_ms() - hours * 3600 * 1000
+    src = partitions.source(conn, "spread_analysis", since=cutoff,
+                            columns="pair, ts, spread_pct, avg_cost, avg_revenue")
     cur.execute(
-        "SELECT timestamp, spread_pct, avg_cost, avg_revenue FROM spread_analysis "
-        "WHERE pair = ? AND timestamp >= ? ORDER BY timestamp ASC",
+        f"SELECT ts, spread_pct, avg_cost, avg_revenue FROM {src} "
+        "WHERE pair = ? AND ts >= ? ORDER BY ts ASC",
         (pair, cutoff)
     )
     rows = cur.fetchall()
     conn.close()
-    return [{"timestamp": r[0], "value": r[1], "cost": r[2], "revenue": r[3]} for r in rows]
+    return [{"timestamp": ms_to_iso(r[0]), "value": r[1], "cost": r[2], "revenue": r[3]} for r in rows]
 
 
 def save_spread_analysis(pair: str, spread_pct: float, avg_cost: float, avg_revenue: float, details: str = ""):
     """Guarda un punto de datos de análisis de spread."""
     _ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = datetime.now(timezone.utc).isoformat()
-    cur.execute(
-        "INSERT INTO spread_analysis (pair, timestamp, spread_pct, avg_cost, avg_revenue, details) VALUES (?,?,?,?,?,?)",
+    ts = now_ms()
+    writer.execute(
+        DB_PATH,
+        f"INSERT INTO {partitions.table_for_write('spread_analysis', ts)} (pair, ts, spread_pct, avg_cost, avg_revenue, details) VALUES (?,?,?,?,?,?)",
         (pair, ts, spread_pct, avg_cost, avg_revenue, details)
     )
-    conn.commit()
-    conn.close()
+    if spread_pct is not None:
+        from core import heatmap
+
+        heatmap.record(pair, ts, spread_pct)
 
 
 def save_donation(user_id: str, amount: float, out_trade_no: str, currency: str = 'USDT'):
@@ -0,0 +1,47 @@
+"""Base de los detectores incrementales.
+
+Un detector mantiene su propio estado por par, actualizado con `on_snapshot`
+(al entrar un snapshot en la ventana) y `on_evict` (al salir). `evaluate` decide
+con ese estado si emite un evento, sin recorrer la ventana. El runner
+(`core.detectors.runner`) mide el tiempo de cada llamada y aplica el presupuesto
+de CPU (`budget_ms`) declarado en `app_config.DETECTORS`.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class SnapshotDelta:
+    pair: str
+    snapshot: Any
+    # eventos de ciclo de vida (core.ad_lifecycle) de este snapshot
+    ad_events: List[Any] = field(default_factory=list)
+
+
+class Detector:
+    name = ""
+
+    def __init__(self, cfg: Dict[str, Any], ram_window=None):
+        self.cfg = cfg
+        self.ram_window = ram_window
+        self._states: Dict[str, Any] = {}
+
+    def new_state(self) -> Any:
+        """Estado incremental vacío para un par."""
+        return None
+
+    def state(self, pair: str) -> Any:
+        st = self._states.get(pair)
+        if st is None:
+            st = self._states[pair] = self.new_state()
+        return st
+
+    def on_snapshot(self, delta: SnapshotDelta):
+        """Actualiza el estado con el snapshot que entra (barato, siempre se ejecuta)."""
+
+    def on_evict(self, pair: str, snapshot):
+        """Descuenta del estado un snapshot que sale de la ventana."""
+
+    def evaluate(self, delta: SnapshotDelta) -> Optional[dict]:
+        """Emite (y persiste) un evento si el estado lo justifica."""
+        return None
@@ -2,12 +2,16 @@
 
 Detecta bajos volúmenes agregados o desequilibrios entre sides y persiste
 eventos en la tabla `events` usando `core.db.save_event`.
+
+`LiquidityDetector` (plugin del runner) lleva los volúmenes por lado de la
+ventana como sumas que suben con cada snapshot y bajan al evictarlo.
 """
 from datetime import datetime, timezone
 from typing import Optional
 
 from core import app_config
 from core import db
+from core.detectors.base import Detector
 
 
 def detect_liquidity(ram_window, pair: str) -> Optional[dict]:
@@ -16,9 +20,10 @@ def detect_liquidity(ram_window, pair: str) -> Optional[dict]:
         return None
 
     vols = ram_window.get_liquidity(pair)
-    buy_vol = float(vols.get('buy_volume') or 0.0)
-    sell_vol = float(vols.get('sell_volume') or 0.0)
+    return _evaluate(cfg, pair, float(vols.get('buy_volume') or 0.0), float(vols.get('sell_volume') or 0.0))
+
 
+def _evaluate(cfg, pair: str, buy_vol: float, sell_vol: float) -> Optional[dict]:
     buy_thresh = float(cfg.get('buy_volume_threshold', 10.0) or 10.0)
     sell_thresh = float(cfg.get('sell_volume_threshold', 10.0) or 10.0)
     imbalance_ratio_thr = float(cfg.get('imbalance_ratio', 10.0) or 10.0)
@@ -53,3 +58,26 @@ def detect_liquidity(ram_window, pair: str) -> Optional[dict]:
             return {'timestamp': now, 'pair': pair, 'event': 'liquidity_imbalance', 'severity': severity, 'details': details}
 
     return None
+
+
+class LiquidityDetector(Detector):
+    name = "liquidity"
+
+    def new_state(self):
+        return {'buy': 0.0, 'sell': 0.0}
+
+    def _apply(self, pair, snapshot, sign):
+        st = self.state(pair)
+        for ad in snapshot.ads:
+            if ad.side in st:
+                st[ad.side] = max(0.0, st[ad.side] + sign * ad.quantity)
+
+    def on_snapshot(self, delta):
+        self._apply(delta.pair, delta.snapshot, 1.0)
+
+    def on_evict(self, pair, snapshot):
+        self._apply(pair, snapshot, -1.0)
+
+    def evaluate(self, delta):
+        st = self.state(delta.pair)
+        return _evaluate(self.cfg, delta.pair, st['buy'], st['sell'])
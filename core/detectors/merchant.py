@@ -3,16 +3,22 @@
 Comprueba si un `merchant` publica muchas ofertas en la ventana reciente y
 registra un evento `merchant_activity` en la tabla `events`.
 
-Usa un debouncer en memoria para evitar eventos repetidos frecuentes.
+El debounce por merchant lo resuelve `core.event_dedup` (compartido con el
+resto de detectores).
+
+`MerchantActivityDetector` (plugin del runner) lee los infractores de los
+contadores deslizantes globales que `RamWindow` ya mantiene
+(`ram_window.merchant_activity`, todos los pares, como `get_merchant_activity`)
+y solo recorre los que superan el umbral y aparecen en el snapshot del par, en
+lugar de consultar la actividad de cada merchant del snapshot.
 """
 from datetime import datetime, timezone
-from typing import Optional, Dict
+from typing import Optional
 
 from core import app_config
 from core import db
-
-# simple in-memory debouncer: merchant -> last event ISO timestamp
-_last_event: Dict[str, str] = {}
+from core import event_dedup
+from core.detectors.base import Detector
 
 
 def _now_iso() -> str:
@@ -24,9 +30,7 @@ def detect_merchant_activity(ram_window, pair: str, latest_snapshot=None) -> Opt
     if not cfg.get('enabled', True):
         return None
 
-    thresh = int(cfg.get('activity_count_threshold', 20) or 20)
     window_seconds = int(cfg.get('activity_window_seconds', 300) or 300)
-    debounce = int(cfg.get('debounce_seconds', 300) or 300)
 
     # Focus on merchants present in the latest snapshot if provided, otherwise scan all merchants
     merchants = set()
@@ -36,22 +40,23 @@ def detect_merchant_activity(ram_window, pair: str, latest_snapshot=None) -> Opt
     else:
         merchants = set(ram_window.merchant_index.keys())
 
+    return _evaluate(cfg, ram_window, pair, merchants,
+                     lambda m: ram_window.get_merchant_activity(m, seconds=window_seconds), latest_snapshot)
+
+
+def _evaluate(cfg, ram_window, pair: str, merchants, activity, latest_snapshot=None) -> Optional[dict]:
+    thresh = int(cfg.get('activity_count_threshold', 20) or 20)
+    window_seconds = int(cfg.get('activity_window_seconds', 300) or 300)
+    debounce = int(cfg.get('debounce_seconds', 300) or 300)
+
     for m in merchants:
-        stats = ram_window.get_merchant_activity(m, seconds=window_seconds)
+        stats = activity(m)
         count = int(stats.get('count', 0) or 0)
         if count >= thresh:
-            last_ts = _last_event.get(m)
-            now = datetime.now(timezone.utc)
-            now_iso = now.isoformat()
-            if last_ts:
-                try:
-                    last_dt = datetime.fromisoformat(last_ts)
-                    delta = (now - last_dt).total_seconds()
-                    if delta < debounce:
-                        # skip due to debounce
-                        continue
-                except Exception:
-                    pass
+            # skip due to debounce (O(1), sin consultar la DB)
+            if event_dedup.seen_recently('merchant_activity', pair, debounce, match={'merchant': m}):
+                continue
+            now_iso = datetime.now(timezone.utc).isoformat()
 
             # severity proportional to how many times threshold was exceeded
             mult = count / thresh if thresh > 0 else 1.0
@@ -69,6 +74,14 @@ def detect_merchant_activity(ram_window, pair: str, latest_snapshot=None) -> Opt
                 'sell': stats.get('sell', 0),
                 'window_seconds': window_seconds,
             }
+            # repricing/relists reales del tracker de ciclo de vida (sin coste en DB)
+            tracker = getattr(ram_window, 'ad_tracker', None)
+            ident = next((ad.merchant_id for ad in (latest_snapshot.ads if latest_snapshot else [])
+                          if ad.merchant == m and ad.merchant_id != 'N/A'), m)
+            if tracker is not None:
+                life = tracker.merchant_stats(ident, seconds=window_seconds)
+                details.update(reprices=life['reprices'], relists=life['relists'],
+                               avg_relist_latency_s=life['avg_relist_latency_s'])
             # include source snapshot timestamp if available
             if latest_snapshot is not None:
                 try:
@@ -77,10 +90,22 @@ def detect_merchant_activity(ram_window, pair: str, latest_snapshot=None) -> Opt
                     pass
 
             ts_iso = now_iso
-            dedup = int(cfg.get('debounce_seconds', 300) or 300)
             # match by merchant so we don't duplicate same-merchant events
-            db.save_event_dedup('merchant_activity', pair, ts_iso, details=details, severity=severity, dedup_seconds=dedup, match_details={'merchant': m})
-            _last_event[m] = ts_iso
+            db.save_event_dedup('merchant_activity', pair, ts_iso, details=details, severity=severity, dedup_seconds=debounce, match_details={'merchant': m})
             return {'timestamp': ts_iso, 'pair': pair, 'merchant': m, 'severity': severity, 'details': details}
 
     return None
+
+
+class MerchantActivityDetector(Detector):
+    name = "merchant"
+
+    def evaluate(self, delta):
+        rw = self.ram_window
+        counters = rw.merchant_activity
+        present = {ad.merchant for ad in delta.snapshot.ads}
+        with rw.lock:
+            counters.advance(datetime.now(timezone.utc).timestamp())
+            # solo los merchants sobre el umbral (de mayor a menor) presentes en este par
+            stats = {m: counters.get(m) for m, _ in counters.offenders() if m in present}
+        return _evaluate(self.cfg, rw, delta.pair, list(stats), stats.__getitem__, delta.snapshot)
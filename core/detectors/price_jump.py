@@ -0,0 +1,150 @@
+"""Detector de saltos de precio y cambios de régimen del spread.
+
+Por cada snapshot guarda mejor bid, mejor ask, mid del top-N y spread % en un
+`core.series.SeriesStore` compartido por todos los pares. Cada `eval_seconds`
+evalúa todos los pares en una sola pasada vectorizada:
+
+- `price_jump`: |z| del último valor frente a 1 m / 5 m / 30 m >= `z_threshold`
+  y movimiento >= `min_move_pct`.
+- `spread_regime`: CUSUM bilateral del spread, referenciado a la media y
+  desviación del horizonte más largo; al superar `cusum_h` se emite y reinicia.
+
+Los eventos pasan por `db.save_event_dedup` como el resto de detectores.
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+import numpy as np
+
+from core import db
+from core.detectors.base import Detector
+from core.series import SeriesStore, cusum_step, rolling_zscores
+
+METRICS = ("best_bid", "best_ask", "mid_top", "spread_pct")
+_JUMP_METRICS = 3  # las tres primeras son precios
+
+
+def book_metrics(ads, top_n: int = 10):
+    """(best_bid, best_ask, mid_top, spread_pct); NaN si falta un lado."""
+    asks = np.array([ad.price for ad in ads if ad.side == 'buy'], dtype=np.float64)
+    bids = np.array([ad.price for ad in ads if ad.side == 'sell'], dtype=np.float64)
+    if not len(asks) or not len(bids):
+        return (np.nan,) * len(METRICS)
+    best_ask = asks.min()
+    best_bid = bids.max()
+    n_a = min(top_n, len(asks))
+    n_b = min(top_n, len(bids))
+    top_asks = np.partition(asks, n_a - 1)[:n_a]
+    top_bids = -np.partition(-bids, n_b - 1)[:n_b]
+    mid = (top_asks.mean() + top_bids.mean()) / 2
+    spread = (best_ask - best_bid) / best_bid * 100 if best_bid > 0 else np.nan
+    return best_bid, best_ask, mid, spread
+
+
+def _severity(z: float, threshold: float) -> int:
+    mult = abs(z) / threshold
+    return 3 if mult >= 2 else 2 if mult >= 1.5 else 1
+
+
+class PriceJumpDetector(Detector):
+    name = "price_jump"
+
+    def __init__(self, cfg, ram_window=None):
+        super().__init__(cfg, ram_window)
+        self.horizons = tuple(int(h) for h in str(cfg.get('horizons', '60,300,1800')).split(',') if h.strip())
+        self.store = SeriesStore(METRICS, capacity=int(cfg.get('capacity', 512)))
+        self._s_pos = np.zeros(0)
+        self._s_neg = np.zeros(0)
+        self._cusum_ts = np.zeros(0)
+        self._last_eval = None
+
+    def on_snapshot(self, delta):
+        ts = delta.snapshot.timestamp.timestamp()
+        self.store.append(delta.pair, ts, book_metrics(delta.snapshot.ads, int(self.cfg.get('top_n', 10))))
+
+    def evaluate(self, delta) -> Optional[dict]:
+        now = delta.snapshot.timestamp.timestamp()
+        every = float(self.cfg.get('eval_seconds', 30) or 0)
+        if self._last_eval is not None and now - self._last_eval < every:
+            return None
+        self._last_eval = now
+        events = self.evaluate_all()
+        return events[0] if events else None
+
+    def evaluate_all(self):
+        """Una pasada sobre todos los pares; devuelve los eventos emitidos."""
+        cfg = self.cfg
+        z_thr = float(cfg.get('z_threshold', 4.0))
+        min_samples = int(cfg.get('min_samples', 5))
+        debounce = int(cfg.get('debounce_seconds', 600) or 600)
+        pairs = self.store.pairs()
+        z, n, mean, std = rolling_zscores(self.store, self.horizons)
+        last_ts, last_vals = self.store.latest()
+        emitted = []
+
+        # saltos: cualquier (horizonte, par, métrica de precio) sobre el umbral y con un
+        # movimiento relativo mínimo (una serie casi plana da z enormes por ticks triviales)
+        min_move = float(cfg.get('min_move_pct', 0.3)) / 100
+        with np.errstate(invalid='ignore', divide='ignore'):
+            move = np.abs(last_vals[None, :, :_JUMP_METRICS] / mean[:, :, :_JUMP_METRICS] - 1)
+        hits = np.argwhere((np.abs(np.nan_to_num(z[:, :, :_JUMP_METRICS])) >= z_thr)
+                           & (n[:, :, :_JUMP_METRICS] >= min_samples)
+                           & (np.nan_to_num(move) >= min_move))
+        for h, p, m in hits:
+            zz = float(z[h, p, m])
+            details = {
+                'metric': METRICS[m],
+                'horizon_s': self.horizons[h],
+                'z': round(zz, 2),
+                'value': float(last_vals[p, m]),
+                'mean': float(mean[h, p, m]),
+                'std': float(std[h, p, m]),
+                'samples': int(n[h, p, m]),
+                'direction': 'up' if zz > 0 else 'down',
+            }
+            ev = self._emit('price_jump', pairs[p], last_ts[p], details, _severity(zz, z_thr), debounce,
+                            {'metric': METRICS[m], 'horizon_s': self.horizons[h]})
+            if ev:
+                emitted.append(ev)
+
+        # CUSUM del spread: un paso por par con muestra nueva
+        P = len(pairs)
+        if len(self._s_pos) < P:
+            grow = P - len(self._s_pos)
+            self._s_pos = np.append(self._s_pos, np.zeros(grow))
+            self._s_neg = np.append(self._s_neg, np.zeros(grow))
+            self._cusum_ts = np.append(self._cusum_ts, np.full(grow, -np.inf))
+        if P:
+            s = METRICS.index('spread_pct')
+            fresh = last_ts > self._cusum_ts
+            ref_ok = n[-1, :, s] >= min_samples
+            s_pos, s_neg = cusum_step(self._s_pos, self._s_neg, last_vals[:, s], mean[-1, :, s], std[-1, :, s],
+                                      float(cfg.get('cusum_k', 0.5)))
+            step = fresh & ref_ok
+            self._s_pos = np.where(step, s_pos, self._s_pos)
+            self._s_neg = np.where(step, s_neg, self._s_neg)
+            self._cusum_ts = np.where(fresh, last_ts, self._cusum_ts)
+            h_thr = float(cfg.get('cusum_h', 5.0))
+            for p in np.flatnonzero((self._s_pos > h_thr) | (self._s_neg > h_thr)):
+                widening = self._s_pos[p] > h_thr
+                details = {
+                    'direction': 'widening' if widening else 'narrowing',
+                    'spread_pct': float(last_vals[p, s]),
+                    'ref_mean': float(mean[-1, p, s]),
+                    'ref_std': float(std[-1, p, s]),
+                    'cusum': round(float(self._s_pos[p] if widening else self._s_neg[p]), 2),
+                    'horizon_s': self.horizons[-1],
+                }
+                self._s_pos[p] = self._s_neg[p] = 0.0
+                ev = self._emit('spread_regime', pairs[p], last_ts[p], details, 2, debounce,
+                                {'direction': details['direction']})
+                if ev:
+                    emitted.append(ev)
+        return emitted
+
+    def _emit(self, event_type, pair, ts, details, severity, debounce, match):
+        ts_iso = datetime.fromtimestamp(float(ts), tz=timezone.utc).isoformat()
+        if not db.save_event_dedup(event_type, pair, ts_iso, details=details, severity=severity,
+                                   dedup_seconds=debounce, match_details=match):
+            return None
+        return {'timestamp': ts_iso, 'pair': pair, 'event': event_type, 'severity': severity, 'details': details}
@@ -0,0 +1,173 @@
+"""Runner de detectores registrados en `app_config.DETECTORS`.
+
+Cada entrada con clave `plugin` ("modulo:Clase") se instancia una vez por
+RamWindow. Un único hilo consume una cola de snapshots/evicciones en orden, así
+el estado por par de cada detector no necesita locks propios.
+
+Presupuesto: si `evaluate` tarda más de `budget_ms`, el detector se salta las
+siguientes evaluaciones (1, 2, 4… hasta 32 snapshots) mientras siga excedido;
+`on_snapshot`/`on_evict` se ejecutan siempre para no desincronizar el estado.
+"""
+import importlib
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from core import app_config
+from core.detectors.base import Detector, SnapshotDelta
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+_MAX_BACKOFF = 32
+
+
+class _Timing:
+    __slots__ = ("calls", "total_ms", "max_ms", "overruns", "skipped", "backoff", "skip_left", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.overruns = 0
+        self.skipped = 0
+        self.backoff = 0
+        self.skip_left = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'errors': self.errors,
+        }
+
+
+def load_detectors(ram_window=None, detectors_cfg: Dict[str, Dict[str, Any]] = None) -> List[Detector]:
+    """Instancia los detectores habilitados que declaran `plugin` en la config."""
+    out = []
+    for name, cfg in (detectors_cfg or app_config.DETECTORS).items():
+        if not isinstance(cfg, dict) or not cfg.get('plugin') or not cfg.get('enabled', True):
+            continue
+        try:
+            module_name, cls_name = cfg['plugin'].split(':', 1)
+            cls = getattr(importlib.import_module(module_name), cls_name)
+            det = cls(cfg, ram_window)
+            det.name = det.name or name
+            out.append(det)
+        except Exception as e:
+            logger.error("No se pudo cargar el detector %s (%s): %s", name, cfg.get('plugin'), e)
+    return out
+
+
+class DetectorRunner:
+    def __init__(self, ram_window=None, detectors: List[Detector] = None):
+        self.ram_window = ram_window
+        self.detectors = detectors if detectors is not None else load_detectors(ram_window)
+        self._timings: Dict[str, _Timing] = {d.name: _Timing() for d in self.detectors}
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    # --- encolado (llamado desde RamWindow con su lock tomado: solo put) ---
+
+    def submit_snapshot(self, delta: SnapshotDelta):
+        if self.detectors:
+            self._ensure_thread()
+            self._queue.put(('snapshot', delta))
+
+    def submit_evict(self, pair: str, snapshot):
+        if self.detectors:
+            self._ensure_thread()
+            self._queue.put(('evict', (pair, snapshot)))
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="detector-runner", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                kind, payload = item
+                if kind == 'snapshot':
+                    self.process_snapshot(payload)
+                else:
+                    self.process_evict(*payload)
+            finally:
+                self._queue.task_done()
+
+    # --- ejecución (síncrona; el hilo la usa y los tests pueden llamarla directo) ---
+
+    def process_snapshot(self, delta: SnapshotDelta) -> List[dict]:
+        events = []
+        for det in self.detectors:
+            t = self._timings[det.name]
+            try:
+                det.on_snapshot(delta)
+            except Exception as e:
+                t.errors += 1
+                logger.exception("Detector %s (on_snapshot): %s", det.name, e)
+                continue
+            if t.skip_left > 0:
+                t.skip_left -= 1
+                t.skipped += 1
+                continue
+            budget_ms = float(det.cfg.get('budget_ms', 50) or 50)
+            start = time.thread_time()
+            try:
+                ev = det.evaluate(delta)
+                if ev:
+                    events.append(ev)
+            except Exception as e:
+                t.errors += 1
+                logger.exception("Detector %s (evaluate): %s", det.name, e)
+            elapsed_ms = (time.thread_time() - start) * 1000
+            t.calls += 1
+            t.total_ms += elapsed_ms
+            t.max_ms = max(t.max_ms, elapsed_ms)
+            if elapsed_ms > budget_ms:
+                t.overruns += 1
+                t.backoff = min(_MAX_BACKOFF, max(1, t.backoff * 2))
+                t.skip_left = t.backoff
+                logger.warning("Detector %s excedió su presupuesto (%.1f ms > %.1f ms); se omite %d snapshots",
+                               det.name, elapsed_ms, budget_ms, t.backoff)
+            else:
+                t.backoff = 0
+        return events
+
+    def process_evict(self, pair: str, snapshot):
+        for det in self.detectors:
+            try:
+                det.on_evict(pair, snapshot)
+            except Exception as e:
+                self._timings[det.name].errors += 1
+                logger.exception("Detector %s (on_evict): %s", det.name, e)
+
+    def join(self, timeout: float = 5.0) -> bool:
+        """Espera a que la cola quede vacía (tests / apagado)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def stop(self, timeout: float = 2.0):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: t.as_dict() for name, t in self._timings.items()}
@@ -2,12 +2,18 @@
 
 Lee umbrales desde `core.app_config.DETECTORS['volatility']` y persiste eventos
 usando `core.db.save_event`.
+
+`VolatilityDetector` (plugin del runner) mantiene media y varianza de los
+precios de la ventana con Welford incremental/decremental, en O(anuncios del
+snapshot) por tick.
 """
+import math
 from datetime import datetime, timezone
 from typing import Optional
 
 from core import app_config
 from core import db
+from core.detectors.base import Detector
 
 
 def _compute_mean_and_count(ram_window, pair: str):
@@ -34,6 +40,10 @@ def detect_volatility(ram_window, pair: str) -> Optional[dict]:
 
     stddev = ram_window.get_volatility(pair)
     mean, count = _compute_mean_and_count(ram_window, pair)
+    return _evaluate(cfg, pair, stddev, mean, count)
+
+
+def _evaluate(cfg, pair: str, stddev, mean, count) -> Optional[dict]:
     min_samples = int(cfg.get('min_samples', 50) or 50)
     if stddev is None or mean is None or count < min_samples:
         return None
@@ -67,3 +77,51 @@ def detect_volatility(ram_window, pair: str) -> Optional[dict]:
         return {'timestamp': ts, 'pair': pair, 'severity': severity, 'details': details}
 
     return None
+
+
+class _Welford:
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x: float):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        delta = x - self.mean
+        self.n -= 1
+        self.mean -= delta / self.n
+        self.m2 = max(0.0, self.m2 - delta * (x - self.mean))
+
+    def stddev(self) -> Optional[float]:
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n >= 2 else None
+
+
+class VolatilityDetector(Detector):
+    name = "volatility"
+
+    def new_state(self):
+        return _Welford()
+
+    def on_snapshot(self, delta):
+        st = self.state(delta.pair)
+        for ad in delta.snapshot.ads:
+            st.add(ad.price)
+
+    def on_evict(self, pair, snapshot):
+        st = self.state(pair)
+        for ad in snapshot.ads:
+            st.remove(ad.price)
+
+    def evaluate(self, delta):
+        st = self.state(delta.pair)
+        return _evaluate(self.cfg, delta.pair, st.stddev(), st.mean if st.n else None, st.n)
@@ -0,0 +1,139 @@
+"""In-memory dedup/debounce for detector events.
+
+Keys are `(event_type, pair, match values)`; each holds the epoch-ms of the last
+emitted event. A check is one dict lookup and never touches the database. On
+first use the cache is warmed from recent `events` rows so a restart does not
+re-emit events that are still inside their debounce window.
+"""
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from core import app_config, db, partitions
+
+# campos de `details` que identifican un evento al recargar desde la DB. Todo tipo que use
+# `match_details` debe declararse aquí: el warm-up corre antes de cualquier evento del proceso
+MATCH_FIELDS: Dict[str, Tuple[str, ...]] = {
+    'merchant_activity': ('merchant',),
+    'price_jump': ('horizon_s', 'metric'),
+    'spread_regime': ('direction',),
+}
+
+
+def _match_key(event_type: str, match: Optional[dict]) -> tuple:
+    if not match:
+        return ()
+    fields = MATCH_FIELDS.get(event_type) or tuple(sorted(match))
+    return tuple((f, repr(match.get(f))) for f in fields)
+
+
+def _warm_seconds() -> int:
+    debounces = [int(c.get('debounce_seconds', 300) or 300)
+                 for c in app_config.DETECTORS.values() if isinstance(c, dict)]
+    return max(debounces or [300])
+
+
+class EventDeduper:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> ts (ms) del último evento, ordenado por ts para podar por el frente
+        self._last: "OrderedDict[tuple, int]" = OrderedDict()
+        self._max_ttl_ms = 0
+        self._warmed_path = None
+
+    def _key(self, event_type: str, pair: str, match: Optional[dict]) -> tuple:
+        return (event_type, pair, _match_key(event_type, match))
+
+    def _mark_locked(self, key: tuple, ts_ms: int):
+        self._last[key] = ts_ms
+        self._last.move_to_end(key)
+
+    def _prune_locked(self, now_ms: int):
+        horizon = now_ms - self._max_ttl_ms
+        while self._last:
+            key, ts = next(iter(self._last.items()))
+            if ts >= horizon:
+                break
+            self._last.popitem(last=False)
+
+    def warm(self, since_seconds: int = None):
+        """Load recent events from the DB (once per DB path)."""
+        since_seconds = since_seconds or _warm_seconds()
+        since = db.now_ms() - since_seconds * 1000
+        db.init_db()
+        conn = sqlite3.connect(db.DB_PATH)
+        try:
+            src = partitions.source(conn, "events", since=since, columns="event_type, pair, ts, details")
+            rows = conn.execute(
+                f"SELECT event_type, pair, ts, details FROM {src} WHERE ts >= ? ORDER BY ts ASC", (since,)).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            for event_type, pair, ts, details_json in rows:
+                match = None
+                if event_type in MATCH_FIELDS:
+                    try:
+                        match = json.loads(details_json or "{}")
+                    except Exception:
+                        match = {}
+                self._mark_locked(self._key(event_type, pair, match), ts)
+            self._max_ttl_ms = max(self._max_ttl_ms, since_seconds * 1000)
+            self._warmed_path = str(db.DB_PATH)
+
+    def _ensure_warm(self):
+        if self._warmed_path != str(db.DB_PATH):
+            try:
+                self.warm()
+            except Exception:
+                # sin DB legible seguimos solo con memoria
+                self._warmed_path = str(db.DB_PATH)
+
+    def seen_recently(self, event_type: str, pair: str, within_seconds: int,
+                      match: Optional[dict] = None, now_ms: int = None) -> bool:
+        self._ensure_warm()
+        now_ms = now_ms if now_ms is not None else db.now_ms()
+        with self._lock:
+            last = self._last.get(self._key(event_type, pair, match))
+        return last is not None and now_ms - last < within_seconds * 1000
+
+    def check_and_mark(self, event_type: str, pair: str, within_seconds: int,
+                       match: Optional[dict] = None, ts_ms: int = None) -> bool:
+        """True (and records the event) if no equal event was emitted within `within_seconds`."""
+        self._ensure_warm()
+        now_ms = db.now_ms()
+        ts_ms = ts_ms if ts_ms is not None else now_ms
+        key = self._key(event_type, pair, match)
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now_ms - last < within_seconds * 1000:
+                return False
+            self._mark_locked(key, ts_ms)
+            self._max_ttl_ms = max(self._max_ttl_ms, within_seconds * 1000)
+            self._prune_locked(now_ms)
+            return True
+
+    def size(self) -> int:
+        return len(self._last)
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+            self._warmed_path = None
+
+
+_DEDUP = EventDeduper()
+
+
+def get_deduper() -> EventDeduper:
+    return _DEDUP
+
+
+def check_and_mark(event_type: str, pair: str, within_seconds: int, match: Optional[dict] = None,
+                   ts_ms: int = None) -> bool:
+    return _DEDUP.check_and_mark(event_type, pair, within_seconds, match=match, ts_ms=ts_ms)
+
+
+def seen_recently(event_type: str, pair: str, within_seconds: int, match: Optional[dict] = None) -> bool:
+    return _DEDUP.seen_recently(event_type, pair, within_seconds, match=match)
@@ -0,0 +1,187 @@
+"""Mapa de calor de spread por hora local (/spread dia, /spread semana, /spread perfil).
+
+Cada entrada de `spread_analysis` suma su spread en el bucket de su hora local en
+`spread_heatmap` (pair, tz, bucket_ts), con el día, el día de la semana y la hora ya
+resueltos: un reporte lee como mucho 24·7 filas por par, sin importar cuánta historia
+haya. La primera consulta de una zona horaria reconstruye sus filas desde
+`spread_analysis` con `aggregate` (NumPy, offsets resueltos una vez por hora UTC);
+`aggregate` también es la ruta de respaldo para series sin tabla pre-agregada.
+"""
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pytz
+
+from core import db, partitions, writer
+
+HOUR_MS = 3600 * 1000
+
+_UPSERT_SQL = (
+    "INSERT INTO spread_heatmap (pair, tz, bucket_ts, day, dow, hour, total, n) VALUES (?,?,?,?,?,?,?,?) "
+    "ON CONFLICT(pair, tz, bucket_ts) DO UPDATE SET total = total + excluded.total, n = n + excluded.n"
+)
+
+
+def _tz_name(tz_name: Optional[str] = None) -> str:
+    if tz_name:
+        return tz_name
+    from core.app_config import DEFAULT_TZ
+    return DEFAULT_TZ
+
+
+def local_hours(ts_ms, tz_name: str) -> np.ndarray:
+    """Inicio (epoch ms) de la hora local de cada `ts_ms`; el offset se calcula una vez por hora UTC."""
+    ts = np.asarray(ts_ms, dtype=np.int64)
+    if not ts.size:
+        return ts
+    tz = pytz.timezone(tz_name)
+    utc_hours, inv = np.unique(ts // HOUR_MS, return_inverse=True)
+    offsets = np.array([
+        int(datetime.fromtimestamp(int(h) * 3600, tz=timezone.utc).astimezone(tz).utcoffset().total_seconds() * 1000)
+        for h in utc_hours], dtype=np.int64)[inv]
+    return (ts + offsets) // HOUR_MS * HOUR_MS - offsets
+
+
+def bucket_fields(bucket_ts: int, tz_name: str) -> Tuple[str, int, int]:
+    """(día local 'YYYY-MM-DD', día de la semana 0=lunes, hora local) de un bucket."""
+    local = datetime.fromtimestamp(bucket_ts / 1000, tz=timezone.utc).astimezone(pytz.timezone(tz_name))
+    return local.strftime("%Y-%m-%d"), local.weekday(), local.hour
+
+
+def aggregate(ts_ms, values, tz_name: str) -> Dict[str, np.ndarray]:
+    """Agrupa muestras por hora local: {'bucket_ts', 'total', 'n'} ordenado por bucket."""
+    ts = np.asarray(ts_ms, dtype=np.int64)
+    vals = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(vals)
+    buckets, inv = np.unique(local_hours(ts[ok], tz_name), return_inverse=True)
+    return {
+        'bucket_ts': buckets,
+        'total': np.bincount(inv, weights=vals[ok], minlength=len(buckets)),
+        'n': np.bincount(inv, minlength=len(buckets)),
+    }
+
+
+def record(pair: str, ts_ms: int, value: float, tz_name: str = None):
+    """Suma una entrada de spread en su bucket de hora local (vía el writer por lotes)."""
+    tz_name = _tz_name(tz_name)
+    bucket = int(local_hours([ts_ms], tz_name)[0])
+    writer.execute(db.DB_PATH, _UPSERT_SQL, (pair, tz_name, bucket, *bucket_fields(bucket, tz_name), float(value), 1))
+
+
+def build(tz_name: str = None, flush: bool = False) -> int:
+    """Reconstruye `spread_heatmap` de la zona desde `spread_analysis`; devuelve los buckets escritos.
+
+    Lee y reescribe dentro de una misma transacción de escritura: las entradas aún en la
+    cola del writer suman su bucket al confirmarse, así que no hace falta esperarlas
+    (`flush=True` las incluye antes, para mantenimiento y tests).
+    """
+    tz_name = _tz_name(tz_name)
+    db.init_db()
+    if flush:
+        writer.flush()
+    conn = sqlite3.connect(db.DB_PATH, timeout=30)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        src = partitions.source(conn, "spread_analysis", columns="pair, ts, spread_pct")
+        rows = conn.execute(
+            f"SELECT pair, ts, spread_pct FROM {src} WHERE spread_pct IS NOT NULL ORDER BY pair").fetchall()
+        out = []
+        if rows:
+            pairs = np.array([r[0] for r in rows])
+            ts = np.array([r[1] for r in rows], dtype=np.int64)
+            vals = np.array([r[2] for r in rows], dtype=np.float64)
+            for pair in np.unique(pairs):
+                mask = pairs == pair
+                agg = aggregate(ts[mask], vals[mask], tz_name)
+                for b, total, n in zip(agg['bucket_ts'], agg['total'], agg['n']):
+                    out.append((str(pair), tz_name, int(b), *bucket_fields(int(b), tz_name), float(total), int(n)))
+        with conn:
+            conn.execute("DELETE FROM spread_heatmap WHERE tz = ?", (tz_name,))
+            conn.executemany(
+                "INSERT INTO spread_heatmap (pair, tz, bucket_ts, day, dow, hour, total, n) VALUES (?,?,?,?,?,?,?,?)",
+                out)
+            conn.execute("INSERT OR REPLACE INTO spread_heatmap_state (tz, built_ts) VALUES (?, ?)",
+                         (tz_name, db.now_ms()))
+        return len(out)
+    finally:
+        conn.close()
+
+
+def _ensure_built(conn, tz_name: str):
+    if conn.execute("SELECT 1 FROM spread_heatmap_state WHERE tz = ?", (tz_name,)).fetchone() is None:
+        build(tz_name)
+
+
+def hourly(pair: str, since_ms: int, tz_name: str = None) -> List[dict]:
+    """Buckets horarios de `pair` desde `since_ms`: [{'bucket_ts', 'day', 'dow', 'hour', 'avg', 'n'}]."""
+    tz_name = _tz_name(tz_name)
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        _ensure_built(conn, tz_name)
+        rows = conn.execute(
+            "SELECT bucket_ts, day, dow, hour, total, n FROM spread_heatmap "
+            "WHERE pair = ? AND tz = ? AND bucket_ts >= ? ORDER BY bucket_ts ASC",
+            (pair, tz_name, since_ms)).fetchall()
+    finally:
+        conn.close()
+    return [{'bucket_ts': b, 'day': d, 'dow': w, 'hour': h, 'avg': t / n, 'n': n} for b, d, w, h, t, n in rows if n]
+
+
+def weekday_profile(pair: str, days: int = 28, tz_name: str = None) -> np.ndarray:
+    """Spread medio por (día de la semana, hora local) de los últimos `days` días: matriz 7×24 (NaN sin datos)."""
+    tz_name = _tz_name(tz_name)
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        _ensure_built(conn, tz_name)
+        rows = conn.execute(
+            "SELECT dow, hour, SUM(total), SUM(n) FROM spread_heatmap "
+            "WHERE pair = ? AND tz = ? AND bucket_ts >= ? GROUP BY dow, hour",
+            (pair, tz_name, db.now_ms() - days * 24 * HOUR_MS)).fetchall()
+    finally:
+        conn.close()
+    out = np.full((7, 24), np.nan)
+    for dow, hour, total, n in rows:
+        if n:
+            out[dow, hour] = total / n
+    return out
+
+
+def blocks(buckets: List[dict], period: str) -> List[Tuple[str, float]]:
+    """Etiquetas del mapa: 'dia' -> una por hora local ('%H:00'), 'semana' -> una por día ('%a %d')."""
+    if period == 'dia':
+        return [(f"{b['hour']:02d}:00", b['avg']) for b in buckets]
+    days: Dict[str, list] = {}
+    for b in buckets:
+        acc = days.setdefault(b['day'], [0.0, 0])
+        acc[0] += b['avg'] * b['n']
+        acc[1] += b['n']
+    return [(datetime.strptime(day, "%Y-%m-%d").strftime("%a %d"), total / n) for day, (total, n) in days.items()]
+
+
+def period_start(period: str, now_ms: int = None, tz_name: str = None) -> int:
+    """Primer bucket del periodo: 24 horas locales ('dia') o 7 días locales completos ('semana') hasta hoy."""
+    tz_name = _tz_name(tz_name)
+    now_ms = db.now_ms() if now_ms is None else now_ms
+    current = int(local_hours([now_ms], tz_name)[0])
+    if period == 'dia':
+        return current - 23 * HOUR_MS
+    _, _, hour = bucket_fields(current, tz_name)
+    return current - (hour + 6 * 24) * HOUR_MS
+
+
+def from_samples(samples: List[dict], since_ms: int, tz_name: str = None) -> List[dict]:
+    """Ruta de respaldo: buckets de `hourly` a partir de muestras {'timestamp', 'value'} (p. ej. métricas)."""
+    tz_name = _tz_name(tz_name)
+    ts = np.array([db.to_ms(s['timestamp']) for s in samples], dtype=np.int64)
+    vals = np.array([s['value'] if s['value'] is not None else np.nan for s in samples], dtype=np.float64)
+    keep = ts >= since_ms
+    agg = aggregate(ts[keep], vals[keep], tz_name)
+    out = []
+    for b, total, n in zip(agg['bucket_ts'], agg['total'], agg['n']):
+        day, dow, hour = bucket_fields(int(b), tz_name)
+        out.append({'bucket_ts': int(b), 'day': day, 'dow': dow, 'hour': hour, 'avg': total / n, 'n': int(n)})
+    return out
@@ -0,0 +1,231 @@
+"""Rankings de merchants por par, mantenidos al ingerir (/merchant top|buy|sell|grandes|bots|estables).
+
+Por par se acumula, para la última `window_seconds` hasta su último snapshot, el
+volumen visible, la suma de precios y el número de avisos de cada merchant por lado.
+Cada snapshot suma su aporte y resta el de los snapshots del par que salen de la
+ventana; solo los merchants tocados se reubican en los rankings (listas ordenadas
+con bisect), así que leer un top-k es O(k):
+
+- volumen: por lado ('buy', 'sell') y total (None), mayor primero;
+- automatización: score del motor en memoria (`merchant_scores`) por lado, mayor primero;
+- estabilidad: |precio medio compra - venta| / venta en %, menor primero (ambos lados).
+
+Los rankings de un par solo cambian en `append_snapshot` de ese par, que también sube
+`RamWindow.versions[pair]`: las respuestas cacheadas por versión se invalidan con ellos.
+El aporte del snapshot y los scores se calculan con `prepare` fuera del lock de la
+ventana; bajo el lock, `apply` solo suma, descuenta y reubica.
+"""
+from bisect import bisect_left, insort
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core import merchant_scores
+
+SIDES = ('buy', 'sell')
+STABLE_MIN_ADS = 4
+
+
+class Ranking:
+    """Claves ordenadas por puntaje: actualizar es bisect + memmove, leer el top-k es O(k)."""
+
+    def __init__(self, descending: bool = True):
+        self._sign = -1.0 if descending else 1.0
+        self._order: List[Tuple[float, str]] = []
+        self._score: Dict[str, float] = {}
+
+    def set(self, key: str, score: float):
+        old = self._score.get(key)
+        if old == score:
+            return
+        if old is not None:
+            self._remove(key, old)
+        self._score[key] = score
+        insort(self._order, (self._sign * score, key))
+
+    def get(self, key: str) -> Optional[float]:
+        return self._score.get(key)
+
+    def discard(self, key: str):
+        old = self._score.pop(key, None)
+        if old is not None:
+            self._remove(key, old)
+
+    def _remove(self, key: str, score: float):
+        item = (self._sign * score, key)
+        i = bisect_left(self._order, item)
+        del self._order[i]
+
+    def iter(self) -> Iterator[Tuple[str, float]]:
+        for s, key in self._order:
+            yield key, self._sign * s
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return [(key, self._sign * s) for s, key in self._order[:k]]
+
+    def __len__(self):
+        return len(self._order)
+
+
+class _Stats:
+    __slots__ = ('vol', 'sum_price', 'count', 'merchant_id', 'last_side')
+
+    def __init__(self):
+        # por lado: índice 0 = 'buy', 1 = 'sell'
+        self.vol = [0.0, 0.0]
+        self.sum_price = [0.0, 0.0]
+        self.count = [0, 0]
+        self.merchant_id = None
+        self.last_side = None
+
+
+class _PairBoards:
+    def __init__(self):
+        self.stats: Dict[str, _Stats] = {}
+        # (ts, {(merchant, lado): [vol, suma precios, avisos]}) de cada snapshot en la ventana
+        self.contribs: deque = deque()
+        self.volume = {None: Ranking(), 'buy': Ranking(), 'sell': Ranking()}
+        self.automation = {'buy': Ranking(), 'sell': Ranking()}
+        self.stability = Ranking(descending=False)
+
+
+class Leaderboards:
+    def __init__(self, window_seconds: int = 3600):
+        self.window_seconds = window_seconds
+        self._pairs: Dict[str, _PairBoards] = {}
+
+    def prepare(self, snap) -> tuple:
+        """Aporte del snapshot por (merchant, lado) y score de automatización de sus merchants.
+
+        No toca los rankings (se llama fuera del lock de la ventana); el resultado va a `apply`.
+        """
+        contrib: Dict[Tuple[str, int], list] = {}
+        ids: Dict[str, str] = {}
+        for ad in snap.ads:
+            if ad.side not in SIDES:
+                continue
+            acc = contrib.setdefault((ad.merchant, SIDES.index(ad.side)), [0.0, 0.0, 0, ad.side])
+            acc[0] += ad.quantity
+            acc[1] += ad.price
+            acc[2] += 1
+            ids[ad.merchant] = ad.merchant_id
+        engine = merchant_scores.running_engine()
+        scores: Dict[str, float] = {}
+        if engine is not None:
+            for merchant, m_id in ids.items():
+                if m_id:
+                    scores[merchant] = engine.score(m_id)['score']
+        return snap.pair, snap.timestamp.timestamp(), contrib, ids, scores
+
+    def apply(self, prepared: tuple):
+        """Suma el aporte preparado, descuenta los snapshots que salen de la ventana y reubica a los tocados."""
+        pair, ts, contrib, ids, scores = prepared
+        boards = self._pairs.get(pair)
+        if boards is None:
+            boards = self._pairs[pair] = _PairBoards()
+        touched = set()
+        boards.contribs.append((ts, contrib))
+        self._apply(boards, contrib, 1, touched)
+        while boards.contribs and boards.contribs[0][0] < ts - self.window_seconds:
+            _, old = boards.contribs.popleft()
+            self._apply(boards, old, -1, touched)
+
+        for merchant, m_id in ids.items():
+            boards.stats[merchant].merchant_id = m_id
+        for merchant in touched:
+            self._rerank(boards, merchant, scores.get(merchant))
+
+    def add_snapshot(self, snap):
+        self.apply(self.prepare(snap))
+
+    @staticmethod
+    def _apply(boards: _PairBoards, contrib: dict, sign: int, touched: set):
+        for (merchant, i), (vol, sum_price, count, side) in contrib.items():
+            st = boards.stats.get(merchant)
+            if st is None:
+                st = boards.stats[merchant] = _Stats()
+            st.vol[i] += sign * vol
+            st.sum_price[i] += sign * sum_price
+            st.count[i] += sign * count
+            if sign > 0:
+                st.last_side = side
+            touched.add(merchant)
+
+    @staticmethod
+    def _rerank(boards: _PairBoards, merchant: str, score: Optional[float]):
+        st = boards.stats[merchant]
+        if not sum(st.count):
+            del boards.stats[merchant]
+            for ranking in (*boards.volume.values(), *boards.automation.values(), boards.stability):
+                ranking.discard(merchant)
+            return
+        if score is None:
+            # tocado solo por lo que sale de la ventana: conserva el score con que ya rankeaba
+            score = boards.automation['buy'].get(merchant)
+            if score is None:
+                score = boards.automation['sell'].get(merchant)
+        boards.volume[None].set(merchant, st.vol[0] + st.vol[1])
+        for i, side in enumerate(SIDES):
+            if st.count[i]:
+                boards.volume[side].set(merchant, st.vol[i])
+                if score is not None:
+                    boards.automation[side].set(merchant, score)
+            else:
+                boards.volume[side].discard(merchant)
+                boards.automation[side].discard(merchant)
+        if st.count[0] and st.count[1] and sum(st.count) >= STABLE_MIN_ADS:
+            buy_avg = st.sum_price[0] / st.count[0]
+            sell_avg = st.sum_price[1] / st.count[1]
+            boards.stability.set(merchant, abs(buy_avg - sell_avg) / (sell_avg or 1) * 100)
+        else:
+            boards.stability.discard(merchant)
+
+    # --- lecturas (el llamador toma el lock de la ventana) ---
+
+    def _row(self, boards: _PairBoards, merchant: str, side: Optional[str]) -> tuple:
+        st = boards.stats[merchant]
+        if side is None:
+            vol, count, sum_price = sum(st.vol), sum(st.count), sum(st.sum_price)
+            side = st.last_side
+        else:
+            i = SIDES.index(side)
+            vol, count, sum_price = st.vol[i], st.count[i], st.sum_price[i]
+        return merchant, vol, sum_price / count if count else 0.0, side, count
+
+    def top_volume(self, pair: str, side: Optional[str] = None, limit: int = 10) -> List[tuple]:
+        """[(merchant, volumen, precio medio, lado, avisos)] del par, mayor volumen primero."""
+        boards = self._pairs.get(pair)
+        if boards is None:
+            return []
+        return [self._row(boards, m, side) for m, _ in boards.volume[side].top(limit)]
+
+    def iter_volume(self, pair: str, side: Optional[str] = None) -> Iterator[tuple]:
+        """Como `top_volume`, perezoso (para filtrar sin recorrer todo el ranking)."""
+        boards = self._pairs.get(pair)
+        if boards is None:
+            return
+        for m, _ in boards.volume[side].iter():
+            yield self._row(boards, m, side)
+
+    def top_automation(self, pair: str, side: Optional[str] = None, limit: int = 10,
+                       min_score: float = 0.0) -> List[Tuple[str, Optional[str], float]]:
+        """[(merchant, merchant_id, score)] con score > `min_score`; sin lado, mezcla ambos lados."""
+        boards = self._pairs.get(pair)
+        if boards is None:
+            return []
+        out, seen = [], set()
+        rankings = [boards.automation[side]] if side else list(boards.automation.values())
+        merged = sorted((item for r in rankings for item in r.top(limit)), key=lambda x: -x[1])
+        for merchant, score in merged:
+            if score <= min_score or len(out) >= limit:
+                break
+            if merchant not in seen:
+                seen.add(merchant)
+                out.append((merchant, boards.stats[merchant].merchant_id, score))
+        return out
+
+    def top_stable(self, pair: str, limit: int = 10) -> List[Tuple[str, float, float]]:
+        """[(merchant, spread % compra-venta, volumen total)] con menor spread primero."""
+        boards = self._pairs.get(pair)
+        if boards is None:
+            return []
+        return [(m, spread, sum(boards.stats[m].vol)) for m, spread in boards.stability.top(limit)]
@@ -0,0 +1,381 @@
+"""Streaming automation-score engine for merchant_intel.
+
+Keeps, per merchant, a ring of fixed time buckets covering the last 24 h with
+the number of sightings, top-3 hits and price changes. Each ad sighting updates
+the ring in O(1) (amortised eviction), so a score no longer needs to re-read
+24 h of `merchant_history`. Registry upserts are batched and flushed every
+`registry_flush_seconds` through the batch writer.
+
+`score_from_counts` is the single place where counts turn into a score; the
+SQL-based `_quick_calculate_score`, `calculate_automation_score` and the
+vectorised batch job `rescore_all` use the same profile from
+`DETECTORS['merchant_intelligence']`.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from core import app_config, db, partitions, writer
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = 24 * 3600
+
+
+@dataclass(frozen=True)
+class ScoreProfile:
+    change_norm: float      # cambios de precio que cuentan como 100% (F)
+    activity_norm: float    # apariciones que cuentan como 100% (V)
+    bot_threshold: float
+    active_threshold: float
+
+
+def get_profile() -> ScoreProfile:
+    """Perfil único de normalización/umbrales (antes /40-/48 en el rápido y /50-/40 en /merchant)."""
+    cfg = app_config.DETECTORS.get('merchant_intelligence', {})
+    return ScoreProfile(
+        change_norm=cfg.get('change_norm', 50),
+        activity_norm=cfg.get('activity_norm', 40),
+        bot_threshold=cfg.get('bot_threshold', 70),
+        active_threshold=cfg.get('active_threshold', 40),
+    )
+
+
+def _weights() -> Tuple[float, float, float]:
+    cfg = app_config.DETECTORS.get('merchant_intelligence', {})
+    return (cfg.get('weight_frequency', 0.4), cfg.get('weight_persistence', 0.3), cfg.get('weight_relist', 0.3))
+
+
+def score_from_counts(changes: int, top3: int, sightings: int, profile: ScoreProfile = None,
+                      weights: Tuple[float, float, float] = None) -> dict:
+    """Weighted F/P/V score from 24 h counts."""
+    profile = profile or get_profile()
+    w_f, w_p, w_v = weights or _weights()
+    if sightings <= 0:
+        return {'score': 0, 'classification': 'HUMANO'}
+    f_score = min(100, (changes / profile.change_norm) * 100)
+    p_score = (top3 / sightings) * 100
+    v_score = min(100, (sightings / profile.activity_norm) * 100)
+    final = (w_f * f_score) + (w_p * p_score) + (w_v * v_score)
+
+    cl = "HUMANO"
+    if final > profile.bot_threshold:
+        cl = "BOT/ALGORITMO"
+    elif final > profile.active_threshold:
+        cl = "ACTIVO"
+    return {'score': round(final, 2), 'classification': cl}
+
+
+def full_score(changes: int, top3: int, sightings: int, weights=None) -> dict:
+    """Score de /merchant con sus métricas de 24h."""
+    out = score_from_counts(changes, top3, sightings, None, weights)
+    out['metrics'] = {
+        'changes_24h': changes,
+        'persistence_top3_pct': round((top3 / sightings) * 100, 2) if sightings else 0,
+        'active_snaps_24h': sightings,
+    }
+    return out
+
+
+class _Ring:
+    __slots__ = ('buckets', 'last_price', 'sightings', 'top3', 'changes', 'nickname', 'last_seen')
+
+    def __init__(self):
+        # cada bucket: [bucket_id, sightings, top3, changes, [(ts, top3, changed), ...]]
+        self.buckets = deque()
+        self.last_price = None
+        self.sightings = 0
+        self.top3 = 0
+        self.changes = 0
+        self.nickname = None
+        self.last_seen = None
+
+
+class ScoreEngine:
+    def __init__(self, window_seconds: int = WINDOW_SECONDS, bucket_seconds: int = 60):
+        self.window_ms = int(window_seconds * 1000)
+        self.bucket_ms = int(bucket_seconds * 1000)
+        self._lock = threading.Lock()
+        self._rings: Dict[str, _Ring] = {}
+        self._dirty: Dict[str, Tuple[str, str]] = {}  # merchant_id -> (nickname, last_seen ISO)
+        self._last_flush = time.monotonic()
+        self._warmed_path = None
+
+    # -- actualización ------------------------------------------------------
+    def observe(self, merchant_id: str, price: float, position: int, ts_ms: int,
+                nickname: str = None, last_seen: str = None):
+        with self._lock:
+            ring = self._rings.get(merchant_id)
+            if ring is None:
+                ring = self._rings[merchant_id] = _Ring()
+            changed = 1 if (ring.last_price is not None and price != ring.last_price) else 0
+            top3 = 1 if position is not None and position <= 3 else 0
+            b = ts_ms // self.bucket_ms
+            if ring.buckets and ring.buckets[-1][0] == b:
+                bucket = ring.buckets[-1]
+                bucket[1] += 1
+                bucket[2] += top3
+                bucket[3] += changed
+                bucket[4].append((ts_ms, top3, changed))
+            else:
+                ring.buckets.append([b, 1, top3, changed, [(ts_ms, top3, changed)]])
+            ring.sightings += 1
+            ring.top3 += top3
+            ring.changes += changed
+            ring.last_price = price
+            if nickname is not None:
+                ring.nickname = nickname
+            if last_seen is not None:
+                ring.last_seen = last_seen
+            self._evict_locked(ring, ts_ms)
+            self._dirty[merchant_id] = (ring.nickname, ring.last_seen)
+
+    def _evict_locked(self, ring: _Ring, now_ms: int):
+        # ventana (now - 24h, now]: fuera los buckets cuyo último ms cae en o antes del corte
+        cutoff = now_ms - self.window_ms
+        while ring.buckets and (ring.buckets[0][0] + 1) * self.bucket_ms - 1 <= cutoff:
+            _, s, t, c, _ = ring.buckets.popleft()
+            ring.sightings -= s
+            ring.top3 -= t
+            ring.changes -= c
+        # el bucket que cruza el corte pierde solo los avistamientos con ts <= corte (como el SQL)
+        if ring.buckets and ring.buckets[0][0] * self.bucket_ms <= cutoff:
+            bucket = ring.buckets[0]
+            entries = bucket[4]
+            k = 0
+            while k < len(entries) and entries[k][0] <= cutoff:
+                _, t, c = entries[k]
+                bucket[1] -= 1
+                bucket[2] -= t
+                bucket[3] -= c
+                ring.sightings -= 1
+                ring.top3 -= t
+                ring.changes -= c
+                k += 1
+            if k:
+                del entries[:k]
+                if not entries:
+                    ring.buckets.popleft()
+
+    # -- lectura -------------------------------------------------------------
+    def counts(self, merchant_id: str, now_ms: int = None) -> Tuple[int, int, int]:
+        """(price changes, top-3 hits, sightings) in the window ending at `now_ms`."""
+        now_ms = now_ms if now_ms is not None else db.now_ms()
+        with self._lock:
+            ring = self._rings.get(merchant_id)
+            if ring is None:
+                return 0, 0, 0
+            self._evict_locked(ring, now_ms)
+            if not ring.buckets:
+                return 0, 0, 0
+            # el cambio del primer avistamiento vivo se midió contra uno ya expirado
+            changes = ring.changes - ring.buckets[0][4][0][2]
+            return changes, ring.top3, ring.sightings
+
+    def score(self, merchant_id: str, profile: ScoreProfile = None, weights=None, now_ms: int = None) -> dict:
+        changes, top3, sightings = self.counts(merchant_id, now_ms=now_ms)
+        return score_from_counts(changes, top3, sightings, profile, weights)
+
+    def automation_score(self, merchant_id: str, weights=None, now_ms: int = None) -> dict:
+        changes, top3, sightings = self.counts(merchant_id, now_ms=now_ms)
+        return full_score(changes, top3, sightings, weights)
+
+    def merchants(self):
+        with self._lock:
+            return list(self._rings.keys())
+
+    # -- warm-up y persistencia ------------------------------------------------
+    def warm_from_db(self):
+        """Replay the last 24 h of `merchant_history` (once per DB path)."""
+        if self._warmed_path == str(db.DB_PATH):
+            return
+        db.init_db()
+        since = db.now_ms() - self.window_ms
+        conn = sqlite3.connect(db.DB_PATH)
+        try:
+            src = partitions.source(conn, 'merchant_history', since=since,
+                                    columns="merchant_id, merchant_name, price, position, ts")
+            rows = conn.execute(
+                f"SELECT merchant_id, merchant_name, price, position, ts FROM {src} WHERE ts > ? ORDER BY ts ASC",
+                (since,)).fetchall()
+        finally:
+            conn.close()
+        for m_id, name, price, pos, ts in rows:
+            self.observe(m_id, price, pos, ts, nickname=name, last_seen=db.ms_to_iso(ts))
+        with self._lock:
+            # lo recargado ya está en el registro
+            self._dirty.clear()
+        self._warmed_path = str(db.DB_PATH)
+
+    def flush_registry(self, force: bool = False, every_seconds: float = None) -> int:
+        """Batch-upsert dirty merchants into `merchant_registry`. Returns rows queued."""
+        if every_seconds is None:
+            every_seconds = app_config.DETECTORS.get('merchant_intelligence', {}).get('registry_flush_seconds', 60)
+        if not force and time.monotonic() - self._last_flush < every_seconds:
+            return 0
+        now_ms = db.now_ms()
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+            # merchants sin avistamientos en 24h: liberar su anillo
+            for m_id in [m for m, r in self._rings.items() if m not in dirty]:
+                ring = self._rings[m_id]
+                self._evict_locked(ring, now_ms)
+                if not ring.buckets:
+                    del self._rings[m_id]
+        rows = []
+        for m_id, (nickname, last_seen) in dirty.items():
+            s = self.score(m_id, now_ms=now_ms)
+            rows.append((m_id, nickname, last_seen, s['score'], s['classification']))
+        # misma sentencia que rescore_all: el writer aplica ambos en orden de cola
+        writer.execute_many(db.DB_PATH, _UPSERT_SCORE_SQL, rows)
+        return len(dirty)
+
+
+_ENGINE: Optional[ScoreEngine] = None
+_ENGINE_LOCK = threading.Lock()
+
+
+def get_engine() -> ScoreEngine:
+    global _ENGINE
+    if _ENGINE is None:
+        with _ENGINE_LOCK:
+            if _ENGINE is None:
+                engine = ScoreEngine()
+                try:
+                    engine.warm_from_db()
+                except Exception:
+                    pass
+                _ENGINE = engine
+    return _ENGINE
+
+
+def running_engine() -> Optional[ScoreEngine]:
+    """The engine if the worker already created it in this process (never creates one)."""
+    return _ENGINE
+
+
+def flush_registry(force: bool = False) -> int:
+    return _ENGINE.flush_registry(force=force) if _ENGINE is not None else 0
+
+
+_UPSERT_SCORE_SQL = """
+    INSERT INTO merchant_registry (merchant_id, nickname, last_seen, automation_score, classification)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(merchant_id) DO UPDATE SET
+        nickname = excluded.nickname,
+        last_seen = excluded.last_seen,
+        automation_score = excluded.automation_score,
+        classification = excluded.classification
+"""
+
+
+def score_arrays(merchant_codes: np.ndarray, prices: np.ndarray, positions: np.ndarray, ts: np.ndarray,
+                 n_merchants: int, profile: ScoreProfile = None, weights=None):
+    """Vectorised counts and scores for every merchant in one pass.
+
+    Inputs are parallel arrays of sightings; returns dict of per-merchant arrays
+    (changes, top3, sightings, score, classification code 0=HUMANO 1=ACTIVO 2=BOT,
+    last row index).
+    """
+    profile = profile or get_profile()
+    w_f, w_p, w_v = weights or _weights()
+    # orden (merchant, ts) con un único argsort sobre una clave empaquetada (más rápido que lexsort)
+    rel = ts - ts.min() if len(ts) else ts
+    ts_bits = int(rel.max()).bit_length() if len(rel) else 0
+    if ts_bits + int(n_merchants).bit_length() < 63:
+        order = np.argsort((merchant_codes.astype(np.int64) << ts_bits) | rel, kind='stable')
+    else:
+        order = np.lexsort((ts, merchant_codes))
+    codes = merchant_codes[order]
+    px = prices[order]
+    same = codes[1:] == codes[:-1]
+    changed = same & (px[1:] != px[:-1])
+    changes = np.bincount(codes[1:][changed], minlength=n_merchants)
+    sightings = np.bincount(codes, minlength=n_merchants)
+    top3 = np.bincount(codes, weights=(positions[order] <= 3), minlength=n_merchants).astype(np.int64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        f = np.minimum(100.0, changes / profile.change_norm * 100.0)
+        p = np.where(sightings > 0, top3 / np.maximum(sightings, 1) * 100.0, 0.0)
+        v = np.minimum(100.0, sightings / profile.activity_norm * 100.0)
+    score = np.round(w_f * f + w_p * p + w_v * v, 2)
+    score[sightings == 0] = 0.0
+    cls = np.where(score > profile.bot_threshold, 2, np.where(score > profile.active_threshold, 1, 0))
+
+    # última fila (por ts) de cada merchant -> nickname / last_seen
+    is_last = np.append(~same, True)
+    last_rows = np.full(n_merchants, -1, dtype=np.int64)
+    last_rows[codes[is_last]] = order[is_last]
+    return {'changes': changes, 'top3': top3, 'sightings': sightings, 'score': score,
+            'classification': cls, 'last_row': last_rows}
+
+
+_CLASS_NAMES = np.array(["HUMANO", "ACTIVO", "BOT/ALGORITMO"], dtype=object)
+
+
+def _iso_ms(value) -> Optional[int]:
+    """`last_seen` (ISO con cualquier offset/precisión) en epoch-ms; None si no se puede leer."""
+    try:
+        return db.to_ms(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def rescore_all(now_ms: int = None) -> Dict[str, float]:
+    """Batch job: one scan of 24 h of merchant_history, vectorised scoring and a bulk registry upsert.
+
+    Registry writes go through the batch writer, which applies them in queue order with the
+    engine's own upserts (`flush_registry` uses the same `_UPSERT_SCORE_SQL`).
+    """
+    db.init_db()
+    started = time.perf_counter()
+    now_ms = now_ms if now_ms is not None else db.now_ms()
+    since = now_ms - WINDOW_SECONDS * 1000
+    conn = sqlite3.connect(db.DB_PATH, timeout=30)
+    try:
+        src = partitions.source(conn, 'merchant_history', since=since,
+                                columns="merchant_id, merchant_name, price, position, ts")
+        rows = conn.execute(
+            f"SELECT merchant_id, merchant_name, price, position, ts FROM {src} WHERE ts > ? AND ts <= ?",
+            (since, now_ms)).fetchall()
+        loaded = time.perf_counter()
+
+        stats = {'rows': len(rows), 'merchants': 0}
+        if rows:
+            m_ids, names, prices, positions, ts = zip(*rows)
+            index: Dict[str, int] = {}
+            codes = np.fromiter((index.setdefault(m, len(index)) for m in m_ids), dtype=np.int64, count=len(m_ids))
+            res = score_arrays(codes, np.asarray(prices, dtype=np.float64),
+                               np.asarray(positions, dtype=np.int64), np.asarray(ts, dtype=np.int64), len(index))
+            scored = time.perf_counter()
+
+            labels = _CLASS_NAMES[res['classification']]
+            scores = res['score'].tolist()
+            payload = []
+            for m_id, code in index.items():
+                last = res['last_row'][code]
+                payload.append((m_id, names[last], db.ms_to_iso(ts[last]), scores[code], labels[code]))
+            # sin avistamientos en 24h: score a cero (last_seen comparado en epoch-ms, no como texto)
+            stale = [(m_id,) for m_id, last_seen in conn.execute(
+                "SELECT merchant_id, last_seen FROM merchant_registry WHERE automation_score > 0")
+                if m_id not in index and ((seen := _iso_ms(last_seen)) is None or seen <= since)]
+            writer.execute_many(db.DB_PATH, _UPSERT_SCORE_SQL, payload)
+            if stale:
+                writer.execute_many(
+                    db.DB_PATH,
+                    "UPDATE merchant_registry SET automation_score = 0, classification = 'HUMANO' "
+                    "WHERE merchant_id = ? AND automation_score > 0", stale)
+            stats.update(merchants=len(index), stale=len(stale), load_ms=(loaded - started) * 1000,
+                         score_ms=(scored - loaded) * 1000)
+    finally:
+        conn.close()
+    stats['total_ms'] = (time.perf_counter() - started) * 1000
+    logger.info("Rescoring: %s merchants / %s filas en %.0f ms", stats['merchants'], stats['rows'], stats['total_ms'])
+    return stats
@@ -1,51 +1,80 @@
-import sqlite3
-from datetime import datetime
-from core.db import DB_PATH
-
-def store_hourly_merchant_stats(pair: str):
-    """Guarda estadísticas de la última hora para todos los merchants."""
-    from core.ram_window import get_global
-    
-    rw = get_global()
-    if not rw:
-        return
-    
-    now = datetime.utcnow()
-    current_hour = now.hour
-    today_str = now.strftime("%Y-%m-%d")
-    
-    cutoff = now.timestamp() - 3600
-    
-    stats = {}
-    
-    with rw.lock:
-        for merchant, ads_list in rw.merchant_index.items():
-            for ts, ad in ads_list:
-                if ts.timestamp() < cutoff:
-                    continue
-                
-                key = (merchant, ad.side)
-                if key not in stats:
-                    stats[key] = {'vol': 0.0, 'sum_price': 0.0, 'count': 0}
-                
-                usdt_vol = ad.quantity / ad.price if ad.price > 0 else 0
-                stats[key]['vol'] += usdt_vol
-                stats[key]['sum_price'] += ad.price
-                stats[key]['count'] += 1
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    for (merchant, side), data in stats.items():
-        avg_price = data['sum_price'] / data['count'] if data['count'] > 0 else 0
-        c.execute("""
-            INSERT OR REPLACE INTO merchant_stats
-            (merchant, pair, side, volume_usdt, avg_price, ad_count, hour, date)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            merchant, pair, side, data['vol'], avg_price,
-            data['count'], current_hour, today_str
-        ))
-    
-    conn.commit()
-    conn.close()
\ No newline at end of file
+"""Estadísticas horarias por merchant (tabla `merchant_stats`).
+
+Los acumuladores por (pair, hora, merchant, side) se actualizan en la ingesta
+(`observe`, llamado por `RamWindow.append_snapshot`); el job horario solo vuelca
+los del par pedido con un upsert por lotes, en O(merchants activos).
+"""
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Tuple
+
+from core import db, writer
+
+_UPSERT_SQL = """
+    INSERT INTO merchant_stats (merchant, pair, side, volume_usdt, avg_price, ad_count, hour, date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(merchant, pair, side, date, hour) DO UPDATE SET
+        volume_usdt = excluded.volume_usdt,
+        avg_price = excluded.avg_price,
+        ad_count = excluded.ad_count
+"""
+
+
+class HourlyAccumulators:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (pair, hora UTC en epoch s) -> (merchant, side) -> [volumen USDT, suma precios, anuncios]
+        self._hours: Dict[Tuple[str, int], Dict[Tuple[str, str], list]] = {}
+
+    def observe(self, snap):
+        hour = int(snap.timestamp.timestamp()) // 3600 * 3600
+        with self._lock:
+            acc = self._hours.setdefault((snap.pair, hour), {})
+            for ad in snap.ads:
+                row = acc.get((ad.merchant, ad.side))
+                if row is None:
+                    row = acc[(ad.merchant, ad.side)] = [0.0, 0.0, 0]
+                # tradableQuantity ya viene en USDT
+                row[0] += ad.quantity
+                row[1] += ad.price
+                row[2] += 1
+
+    def flush(self, pair: str = None, now: datetime = None) -> int:
+        """Upsert de los acumuladores de `pair` (todos si None); las horas cerradas se liberan."""
+        current_hour = int((now or datetime.now(timezone.utc)).timestamp()) // 3600 * 3600
+        with self._lock:
+            keys = [k for k in self._hours if pair is None or k[0] == pair]
+            batch = []
+            for key in keys:
+                acc_pair, hour = key
+                if hour < current_hour:
+                    acc = self._hours.pop(key)
+                else:
+                    acc = {mk: list(v) for mk, v in self._hours[key].items()}
+                batch.append((acc_pair, hour, acc))
+        rows = []
+        for acc_pair, hour, acc in batch:
+            dt = datetime.fromtimestamp(hour, tz=timezone.utc)
+            date_str = dt.strftime("%Y-%m-%d")
+            for (merchant, side), (vol, sum_price, count) in acc.items():
+                rows.append((merchant, acc_pair, side, vol, sum_price / count if count else 0, count, dt.hour, date_str))
+        if rows:
+            db.init_db()
+            writer.execute_many(db.DB_PATH, _UPSERT_SQL, rows)
+        return len(rows)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._hours.values())
+
+
+_ACC = HourlyAccumulators()
+
+
+def observe(snap):
+    _ACC.observe(snap)
+
+
+def store_hourly_merchant_stats(pair: str = None) -> int:
+    """Guarda las estadísticas horarias acumuladas de `pair` en `merchant_stats`."""
+    return _ACC.flush(pair)
@@ -0,0 +1,132 @@
+"""Daily partitions for the high-volume history tables.
+
+Rows go to `<base>_pYYYYMMDD` tables whose schema is copied from the base table
+declared in `core/db.py`. Reads that span days go through `source()`, which
+builds a `UNION ALL` over the partitions in range (plus the base table, which
+only holds rows written before partitioning). Retention drops whole partitions
+instead of running range DELETEs over large tables.
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from core import db
+
+# tabla base -> (columna de tiempo en epoch-ms, índices por partición)
+PARTITIONED = {
+    'raw_archive_blocks': ('ts_ms', [('pair', 'trade_type', 'ts_ms')]),
+    'merchant_history': ('ts', [('merchant_id', 'ts')]),
+    'events': ('ts', [('event_type', 'pair', 'ts'), ('ts',)]),
+    'market_metrics_history': ('ts', [('pair', 'metric_name', 'ts')]),
+    'spread_analysis': ('ts', [('pair', 'ts')]),
+}
+
+_lock = threading.Lock()
+_known = set()  # (db_path, partition) ya creadas en este proceso
+
+
+def _to_datetime(ts) -> datetime:
+    if ts is None:
+        return datetime.now(timezone.utc)
+    return datetime.fromtimestamp(db.to_ms(ts) / 1000, tz=timezone.utc)
+
+
+def partition_name(base: str, ts=None) -> str:
+    return f"{base}_p{_to_datetime(ts):%Y%m%d}"
+
+
+def _day_of(base: str, name: str) -> Optional[str]:
+    m = re.fullmatch(re.escape(base) + r"_p(\d{8})", name)
+    return m.group(1) if m else None
+
+
+def _create_partition(conn, base: str, name: str):
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (base,)).fetchone()
+    if not row:
+        raise ValueError(f"Tabla base desconocida: {base}")
+    ddl = re.sub(r'^CREATE TABLE\s+("?)' + re.escape(base) + r'\1', f'CREATE TABLE IF NOT EXISTS "{name}"', row[0], count=1)
+    conn.execute(ddl)
+    ensure_indexes(conn, base, name)
+
+
+def ensure_indexes(conn, base: str, name: str):
+    for cols in PARTITIONED[base][1]:
+        conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{name}_{"_".join(cols)}" ON "{name}"({", ".join(cols)})')
+
+
+def table_for_write(base: str, ts=None) -> str:
+    """Partition name for a row stamped `ts`, created synchronously on first use."""
+    name = partition_name(base, ts)
+    key = (str(db.DB_PATH), name)
+    if key in _known:
+        return name
+    with _lock:
+        if key not in _known:
+            db.init_db()
+            conn = sqlite3.connect(db.DB_PATH, timeout=30)
+            try:
+                with conn:
+                    _create_partition(conn, base, name)
+            finally:
+                conn.close()
+            _known.add(key)
+    return name
+
+
+def list_partitions(conn, base: str) -> List[Tuple[str, str]]:
+    """Sorted (YYYYMMDD, table) pairs for `base`."""
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (base + "_p%",)).fetchall()
+    out = []
+    for (name,) in rows:
+        day = _day_of(base, name)
+        if day:
+            out.append((day, name))
+    out.sort()
+    return out
+
+
+def source(conn, base: str, since=None, until=None, columns: str = "*") -> str:
+    """FROM-clause subquery covering `base` rows in [since, until).
+
+    Only partitions whose day overlaps the range are included; the caller still
+    filters on the time column.
+    """
+    lo = f"{_to_datetime(since):%Y%m%d}" if since is not None else None
+    hi = f"{_to_datetime(until):%Y%m%d}" if until is not None else None
+    tables = [base]
+    for day, name in list_partitions(conn, base):
+        if lo and day < lo:
+            continue
+        if hi and day > hi:
+            continue
+        tables.append(name)
+    union = " UNION ALL ".join(f'SELECT {columns} FROM "{t}"' for t in tables)
+    return f"({union})"
+
+
+def drop_older_than(base: str, cutoff) -> int:
+    """Drop partitions entirely older than `cutoff`; legacy base rows are deleted by range."""
+    ts_col = PARTITIONED[base][0]
+    cutoff_dt = _to_datetime(cutoff)
+    cutoff_day = f"{cutoff_dt:%Y%m%d}"
+    dropped = 0
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH, timeout=30)
+    try:
+        with conn:
+            for day, name in list_partitions(conn, base):
+                if day < cutoff_day:
+                    conn.execute(f'DROP TABLE IF EXISTS "{name}"')
+                    _known.discard((str(db.DB_PATH), name))
+                    dropped += 1
+            conn.execute(f"DELETE FROM {base} WHERE {ts_col} < ?", (db.to_ms(cutoff_dt),))
+    finally:
+        conn.close()
+    return dropped
+
+
+def cutoff_days_ago(days: int) -> datetime:
+    return datetime.now(timezone.utc) - timedelta(days=days)
@@ -1,6 +1,11 @@
 import math
 import statistics
-from core import db
+import threading
+
+import numpy as np
+
+from core import db, raw_archive, rates
+from core.rates import RatesEngine
 from datetime import datetime, timezone
 
 
@@ -9,6 +14,9 @@ def _extract_prices_and_vols(raw_list):
     volums = []
     if not raw_list:
         return precios, volums
+    if hasattr(raw_list, "prices"):
+        # columnas del archivo compacto (raw_archive.RawList): sin construir los dicts
+        return np.nan_to_num(raw_list.prices).tolist(), np.nan_to_num(raw_list.volumes).tolist()
     try:
         for item in raw_list:
             # item expected to be a Binance 'adv' dict inside the data list
@@ -71,53 +79,58 @@ def _analyze_list(precios, volums, config):
     }
 
 
-def _build_data_structure(cop_buy, cop_sell, ves_buy, ves_sell, config):
-    # Para tasas usamos una ventana profunda (posiciones 40-60)
-    start, end = 40, 60
+def _extract_prices_deep(lista):
+    """Precios de la ventana profunda de las tasas (posiciones 40-60, o 10-30 si el libro es corto)."""
+    start, end = rates.DEEP_START, rates.DEEP_END
+    try:
+        if hasattr(lista, 'prices'):
+            prices = lista.prices
+            sub = prices[start:end] if len(prices) > start else prices[10:30]
+            return [float(p) for p in sub]
+
+        # Si es lista de Snapshots (Ads), convertirlas a formato dummy compatible o extraer directo
+        # Si es lista de ads de RAM:
+        if lista and hasattr(lista[0], 'price'):
+            sub_list = lista[start:end] or lista[10:30]
+            return [float(x.price) for x in sub_list]
 
-    def extract_prices_deep(lista):
-        try:
-            # Si es lista de Snapshots (Ads), convertirlas a formato dummy compatible o extraer directo
-            # Si es lista de ads de RAM:
-            if lista and hasattr(lista[0], 'price'):
-                sub_list = lista[start:end] or lista[10:30]
-                return [float(x.price) for x in sub_list]
+        # Si es lista de dicts (fetch_latest_raw):
+        sub_list = lista[start:end] or lista[10:30]
+        prices = [float(x.get("adv", {}).get("price"))
+                  for x in sub_list if (x and x.get("adv"))]
+        return prices
+    except Exception:
+        return []
 
-            # Si es lista de dicts (fetch_latest_raw):
-            sub_list = lista[start:end] or lista[10:30]
-            prices = [float(x.get("adv", {}).get("price"))
-                      for x in sub_list if (x and x.get("adv"))]
-            return prices
-        except Exception:
-            return []
 
-    precios_cop_buy = extract_prices_deep(cop_buy)
-    precios_cop_sell = extract_prices_deep(cop_sell)
-    precios_ves_buy = extract_prices_deep(ves_buy)
-    precios_ves_sell = extract_prices_deep(ves_sell)
+def _stable_avg(lista):
+    prices = _extract_prices_deep(lista)
+    if not prices:
+        return None
+    return statistics.median(prices)
 
-    def get_stable_avg(prices):
-        if not prices:
-            return None
-        return statistics.median(prices)
 
-    avg_cop_buy = get_stable_avg(precios_cop_buy)
-    avg_cop_sell = get_stable_avg(precios_cop_sell)
-    avg_ves_buy = get_stable_avg(precios_ves_buy)
-    avg_ves_sell = get_stable_avg(precios_ves_sell)
+def _build_data_structure(cop_buy, cop_sell, ves_buy, ves_sell, config, rates_engine: RatesEngine = None):
+    """Estructura de tasas/arbitraje COP-VES; `rates_engine` (opcional) aporta la matriz de todos los fiats."""
+    avg_cop_buy = _stable_avg(cop_buy)
+    avg_cop_sell = _stable_avg(cop_sell)
+    avg_ves_buy = _stable_avg(ves_buy)
+    avg_ves_sell = _stable_avg(ves_sell)
 
-    tasa_cop_ves_5 = (avg_cop_buy / avg_ves_sell *
-                      1.05) if avg_cop_buy and avg_ves_sell else None
-    tasa_cop_ves_10 = (avg_cop_buy / avg_ves_sell *
-                       1.10) if avg_cop_buy and avg_ves_sell else None
-    tasa_ves_cop_5 = (avg_ves_buy / avg_cop_sell *
-                      1.05) if avg_ves_buy and avg_cop_sell else None
+    if rates_engine is None:
+        rates_engine = RatesEngine.from_prices({"COP": (avg_cop_buy, avg_cop_sell), "VES": (avg_ves_buy, avg_ves_sell)})
+
+    tasa_cop_ves_5 = rates_engine.reference("COP", "VES", 0.05)
+    tasa_cop_ves_10 = rates_engine.reference("COP", "VES", 0.10)
+    tasa_ves_cop_5 = rates_engine.reference("VES", "COP", 0.05)
 
     # análisis profundo (usando helpers que ya aceptan dicts)
     # Si son Ads de RAM, convertirlos a dicts para compatibilidad temporal o actualizar helpers
     def to_raw(lista):
         if not lista:
             return []
+        if hasattr(lista, 'prices'):
+            return lista
         if hasattr(lista[0], 'price'):
             return [{"adv": {"price": x.price, "dynamicMaxSingleTransAmount": x.quantity}} for x in lista]
         return lista
@@ -143,18 +156,11 @@ def _build_data_structure(cop_buy, cop_sell, ves_buy, ves_sell, config):
     # Arbitraje Cross-Border (COP <-> VES)
     # Tasa implícita TAKER/MAKER: Compro USDT con COP, Vendo USDT por VES
     # Incluimos comisión de Binance (0.16% por cada operación)
-    fee = 0.0016
-    tasa_p2p_cop_ves = None
-    if avg_cop_buy and avg_ves_sell:
-        # Costo unitario aumentado por fee / Recibo unitario disminuido por fee
-        tasa_p2p_cop_ves = (avg_cop_buy * (1 + fee)) / \
-            (avg_ves_sell * (1 - fee))
+    tasa_p2p_cop_ves = rates_engine.rate("COP", "VES")
 
     # Eficiencia comparada con nuestra tasa preferencial (+5%)
-    eficiencia_cop_ves = None
-    if tasa_p2p_cop_ves and tasa_cop_ves_5:
-        # Si P2P es 6.50 y nuestra tasa es 6.80, P2P es mas eficiente para el que envia (-4.4%)
-        eficiencia_cop_ves = (tasa_p2p_cop_ves / tasa_cop_ves_5 - 1) * 100
+    # Si P2P es 6.50 y nuestra tasa es 6.80, P2P es mas eficiente para el que envia (-4.4%)
+    eficiencia_cop_ves = rates_engine.efficiency("COP", "VES", 0.05)
 
     return {
         "timestamps": {"utc": datetime.now(timezone.utc).isoformat()},
@@ -184,6 +190,9 @@ def _build_data_structure(cop_buy, cop_sell, ves_buy, ves_sell, config):
             "eficiencia_pct": eficiencia_cop_ves,
             "orientacion": "P2P más barato" if eficiencia_cop_ves and eficiencia_cop_ves < 0 else "Remesa más barata"
         },
+        # todos los fiats disponibles: tasas cruzadas, eficiencia y ciclos triangulares
+        "matriz": rates_engine.as_dict(),
+        "triangulares": rates_engine.triangles(),
         "raw": {
             "cop_buy_raw": cop_buy,
             "cop_sell_raw": cop_sell,
@@ -194,34 +203,96 @@ def _build_data_structure(cop_buy, cop_sell, ves_buy, ves_sell, config):
 
 
 def build_data_from_db(config: dict):
-    """Construye el mismo diccionario de salida que antes, pero leyendo la última entrada guardada."""
+    """Construye el mismo diccionario de salida que antes, pero leyendo la última entrada guardada.
+
+    Los bloques del archivo compacto se leen con una conexión y se reutilizan por fila;
+    `data['raw']` son listas perezosas que solo construyen los dicts si alguien las recorre.
+    """
     fiats = list(config.get("monedas", {}).keys()) or ["COP", "VES"]
+    latest = raw_archive.latest_blocks([(f"USDT-{fiat}", tt) for fiat in fiats for tt in ("BUY", "SELL")])
     fetched = {}
     for fiat in fiats:
         for tt in ("BUY", "SELL"):
+            block = latest.get((f"USDT-{fiat}", tt))
+            if block is not None:
+                fetched[f"{fiat}_{tt}"] = raw_archive.RawList(block)
+                continue
+            # sin archivo: raw_responses (legacy)
             rows = db.fetch_latest_raw(
                 exchange=None, fiat=fiat, trade_type=tt, limit=1)
             fetched[f"{fiat}_{tt}"] = rows[0]["raw"] if rows else []
 
+    rates_engine = RatesEngine.from_prices(
+        {fiat: (_stable_avg(fetched[f"{fiat}_BUY"]), _stable_avg(fetched[f"{fiat}_SELL"])) for fiat in fiats})
     return _build_data_structure(
         fetched.get("COP_BUY", []), fetched.get("COP_SELL", []),
         fetched.get("VES_BUY", []), fetched.get("VES_SELL", []),
-        config
+        config, rates_engine
     )
 
 
+class _SingleFlight:
+    """Memo de un solo valor: lo calcula una vez por clave aunque lo pidan varios hilos a la vez."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key = None
+        self._value = None
+        self._inflight = {}
+
+    def get(self, key, compute):
+        with self._lock:
+            if self._key == key:
+                return self._value
+            done = self._inflight.get(key)
+            leader = done is None
+            if leader:
+                done = self._inflight[key] = threading.Event()
+        if not leader:
+            done.wait()
+            with self._lock:
+                if self._key == key:
+                    return self._value
+            # el cálculo del otro hilo falló: reintentar por cuenta propia
+            return compute()
+        try:
+            value = compute()
+            with self._lock:
+                self._key, self._value = key, value
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+
+_RAM_DATA = _SingleFlight()
+_RAM_PAIRS = ('USDT-COP', 'USDT-VES')
+
+
 def build_data_from_ram(config: dict):
+    """Estructura de /tasa, /cop, /ves y /arbitraje desde el último snapshot de cada par.
+
+    Se calcula una vez por combinación de versiones de los snapshots de todos los pares (y parámetros
+    de `config`) y se comparte entre usuarios y comandos: el resultado es de solo lectura.
+    """
     from core.ram_window import get_global
     rw = get_global()
     if not rw:
         return None
 
     with rw.lock:
+        latest = {pair: (rw.pair_index[pair][-1] if rw.pair_index.get(pair) else None) for pair in _RAM_PAIRS}
+        # la matriz de tasas depende de todos los pares: se copia con las mismas versiones
+        versions = tuple(sorted(rw.versions.items()))
+        rates_engine = rw.rates.copy()
+    key = (id(rw), versions, config.get("ponderacion_volumen", False), config.get("limite_outlier", 0.025))
+
+    def compute():
         def get_ads(pair, side):
-            dq = rw.pair_index.get(pair)
-            if not dq:
+            snap = latest[pair]
+            if snap is None:
                 return []
-            snap = dq[-1]
             return [a for a in snap.ads if a.side == side]
 
         cb = get_ads('USDT-COP', 'buy')
@@ -231,4 +302,6 @@ def build_data_from_ram(config: dict):
 
         if not cb and not vb:
             return None
-        return _build_data_structure(cb, cs, vb, vs, config)
+        return _build_data_structure(cb, cs, vb, vs, config, rates_engine)
+
+    return _RAM_DATA.get(key, compute)
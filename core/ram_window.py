@@ -4,26 +4,18 @@ from collections import deque
 from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Optional, Callable, Tuple
-import threading
-import traceback
-
-# detectors (optional imports)
-try:
-    from core.detectors.volatility import detect_volatility
-except Exception:
-    detect_volatility = None
-try:
-    from core.detectors.liquidity import detect_liquidity
-except Exception:
-    detect_liquidity = None
-try:
-    from core.detectors.merchant import detect_merchant_activity
-except Exception:
-    detect_merchant_activity = None
-try:
-    from core.detectors.merchant_intel import detect_merchant_intel
-except Exception:
-    detect_merchant_intel = None
+
+from core import app_config, merchant_stats
+from core.activity_counters import SlidingCounters
+from core.ad_lifecycle import AdTracker
+from core.book import BookView
+from core.candles import CandleEngine
+from core.leaderboards import Leaderboards
+from core.rates import RatesEngine
+from core.series import PositionRings
+from core.snapshot import SnapshotSummarizer
+from core.detectors.base import SnapshotDelta
+from core.sketches import QuantileWindow
 
 
 @dataclass
@@ -44,6 +36,14 @@ class Snapshot:
     pair: str
     exchange: str = "binance"
     ads: List[Ad] = field(default_factory=list)
+    _book: Optional[BookView] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def book(self) -> BookView:
+        """Libro ordenado por lado (se construye una vez por snapshot)."""
+        if self._book is None:
+            self._book = BookView(self.ads)
+        return self._book
 
 
 @dataclass
@@ -94,12 +94,36 @@ class RamWindow:
         self.window_seconds = window_seconds
         self.snapshots: deque[Snapshot] = deque()
         self.pair_index: Dict[str, deque[Snapshot]] = {}
+        # contador por par, +1 en cada snapshot (clave de los resultados memoizados)
+        self.versions: Dict[str, int] = {}
         self.merchant_index: Dict[str, deque[Tuple[datetime, Ad]]] = {}
         self.cache_metrics: Dict[str, MetricsCache] = {}
         self.lock = threading.RLock()
         self._stop_event = threading.Event()
         self._compaction_interval = 60
         self._aggregator_thread: Optional[threading.Thread] = None
+        # ciclo de vida de anuncios (appear/disappear/reprice/relist) entre snapshots
+        self.ad_tracker = AdTracker()
+        # detectores incrementales registrados en app_config.DETECTORS (se cargan al primer snapshot)
+        self._detectors = None
+        # t-digest por minuto y (pair, side): percentiles de precio de cualquier ventana
+        self.price_sketches = QuantileWindow(window_seconds=window_seconds)
+        # velas OHLC 1m..1d por (pair, side), persistidas al cerrar cada una
+        self.candles = CandleEngine()
+        # matriz de tasas cruzadas entre los fiats de los pares USDT-<FIAT> (fila/columna por snapshot)
+        self.rates = RatesEngine()
+        # resumen por par en la tabla `snapshots` (como mucho uno por intervalo)
+        self.summaries = SnapshotSummarizer()
+        # matrices circulares tiempo × posición (top K) por par para /spread >X
+        self.positions = PositionRings()
+        # rankings de merchants por par (volumen, automatización, estabilidad) de la última hora
+        self.leaderboards = Leaderboards()
+        # conteo de avisos por merchant en la ventana de actividad del detector
+        # (global, todos los pares); el umbral alimenta `offenders()` para MerchantActivityDetector
+        merchant_cfg = app_config.DETECTORS.get('merchant', {})
+        self.merchant_activity = SlidingCounters(
+            window_seconds=int(merchant_cfg.get('activity_window_seconds', 300) or 300),
+            threshold=int(merchant_cfg.get('activity_count_threshold', 20) or 20))
 
     def append_snapshot(self, pair: str, ads: List[dict], timestamp: Optional[datetime] = None, **kwargs):
         ts = timestamp or datetime.now(timezone.utc)
@@ -121,55 +145,49 @@ class RamWindow:
                 continue
 
         snap = Snapshot(timestamp=ts, pair=pair, exchange=kwargs.get('exchange', 'binance'), ads=ad_objs)
+        # las velas tienen su propio lock y pueden leer/escribir la DB: fuera del lock de la ventana
+        self.candles.add_snapshot(snap)
+        # libro ordenado, fila de posiciones y aporte a los rankings (con sus scores) también fuera:
+        # bajo el lock solo se insertan los resultados
+        positions_row = self.positions.row(snap)
+        board_update = self.leaderboards.prepare(snap)
 
         with self.lock:
             self.snapshots.append(snap)
             self.pair_index.setdefault(pair, deque()).append(snap)
+            self.versions[pair] = self.versions.get(pair, 0) + 1
+            ts_s = ts.timestamp()
             for ad in ad_objs:
                 self.merchant_index.setdefault(ad.merchant, deque()).append((ts, ad))
+                self.merchant_activity.add(ts_s, ad.merchant, ad.side)
             # update metrics cache
             mc = self.cache_metrics.setdefault(pair, MetricsCache())
             mc.update_with_snapshot(snap)
+            ad_events = self.ad_tracker.observe(snap)
+            # acumuladores horarios de merchant_stats (se vuelcan en el job horario)
+            merchant_stats.observe(snap)
+            self.price_sketches.add_snapshot(snap)
+            self.rates.update_from_snapshot(snap)
+            self.positions.push(pair, positions_row)
+            self.leaderboards.apply(board_update)
+            # detectors run on their own thread (queue) so ingestion is not blocked
+            self.detectors.submit_snapshot(SnapshotDelta(pair, snap, ad_events))
             self._evict_old_locked()
-            # run detectors in background to avoid blocking ingestion
-            try:
-                t = threading.Thread(target=self._run_detectors, args=(pair, ts, snap), daemon=True)
-                t.start()
-            except Exception:
-                pass
+        # resumen persistido (writer) con la matriz de tasas ya actualizada
+        self.summaries.observe(snap, self.rates)
 
-    def _run_detectors(self, pair: str, ts: datetime, snap: Snapshot):
-        # Run available detectors; each detector should be robust and use core.db.save_event
-        try:
-            if detect_volatility:
-                try:
-                    detect_volatility(self, pair)
-                except Exception:
-                    traceback.print_exc()
-            if detect_liquidity:
-                try:
-                    detect_liquidity(self, pair)
-                except Exception:
-                    traceback.print_exc()
-            if detect_merchant_activity:
-                try:
-                    # optionally pass the latest snapshot for merchant detector
-                    detect_merchant_activity(self, pair, latest_snapshot=snap)
-                except Exception:
-                    traceback.print_exc()
-            if detect_merchant_intel:
-                try:
-                    detect_merchant_intel(self, pair, snap)
-                except Exception:
-                    traceback.print_exc()
-        except Exception:
-            # defensive: do not let detector failures bubble up
-            traceback.print_exc()
+    @property
+    def detectors(self):
+        if self._detectors is None:
+            from core.detectors.runner import DetectorRunner
+            self._detectors = DetectorRunner(self)
+        return self._detectors
 
     def _evict_old_locked(self):
         cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.window_seconds)
         while self.snapshots and self.snapshots[0].timestamp < cutoff:
             old = self.snapshots.popleft()
+            self.detectors.submit_evict(old.pair, old)
             # remove from pair_index
             dq = self.pair_index.get(old.pair)
             if dq:
@@ -197,8 +215,13 @@ class RamWindow:
             return mc.top_sell_price - mc.top_buy_price
 
     def get_merchant_activity(self, merchant: str, seconds: int = 300) -> Dict[str, int]:
-        cutoff = datetime.now(timezone.utc) - timedelta(seconds=seconds)
+        now = datetime.now(timezone.utc)
+        cutoff = now - timedelta(seconds=seconds)
         with self.lock:
+            if seconds == self.merchant_activity.window_seconds:
+                # O(1): contadores deslizantes mantenidos en append
+                self.merchant_activity.advance(now.timestamp())
+                return self.merchant_activity.get(merchant)
             dq = self.merchant_index.get(merchant, deque())
             count = 0
             buy = 0
@@ -260,6 +283,8 @@ class RamWindow:
 
     def stop(self):
         self._stop_event.set()
+        if self._detectors is not None:
+            self._detectors.stop()
         if self._aggregator_thread:
             self._aggregator_thread.join(timeout=1)
 
@@ -0,0 +1,158 @@
+"""Matriz de tasas cruzadas P2P entre N fiats (vía USDT).
+
+Por fiat se guarda el precio de compra de USDT (`buy`, pestaña Compra) y el de
+venta (`sell`, pestaña Venta). Con comisión `fee` por tramo:
+
+- cross[i, j] = buy_i·(1+fee) / (sell_j·(1-fee)): unidades de i por unidad de j
+  (comprar USDT con i y venderlo por j).
+- reference(i, j, margen) = buy_i / sell_j · (1+margen): tasa de remesa.
+- gain[i, j] = 1 / cross[i, j]; ida y vuelta i→j→i = gain[i, j]·gain[j, i] y los
+  ciclos triangulares i→j→k→i multiplican tres tramos.
+
+Actualizar un fiat recalcula solo su fila y su columna (O(n)).
+"""
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+FEE = 0.0016  # comisión de Binance por operación
+DEEP_START, DEEP_END = 40, 60  # ventana profunda de las tasas (posiciones 40-60)
+
+
+def deep_median(prices) -> Optional[float]:
+    """Mediana de las posiciones 40-60 (o 10-30 si el libro es corto); None si no hay precios."""
+    prices = list(prices)
+    sub = prices[DEEP_START:DEEP_END] or prices[10:30]
+    if not sub:
+        return None
+    return float(np.median(sub))
+
+
+class RatesEngine:
+    def __init__(self, fee: float = FEE):
+        self.fee = fee
+        self._lock = threading.Lock()
+        self.fiats: List[str] = []
+        self._idx: Dict[str, int] = {}
+        self.buy = np.empty(0)
+        self.sell = np.empty(0)
+        self.cross = np.empty((0, 0))
+
+    @classmethod
+    def from_prices(cls, prices: Dict[str, tuple], fee: float = FEE) -> "RatesEngine":
+        """Motor a partir de {fiat: (buy, sell)}."""
+        eng = cls(fee)
+        for fiat, (buy, sell) in prices.items():
+            eng.update(fiat, buy, sell)
+        return eng
+
+    def copy(self) -> "RatesEngine":
+        """Copia independiente de las matrices (lecturas consistentes mientras el original se actualiza)."""
+        eng = RatesEngine(self.fee)
+        with self._lock:
+            eng.fiats = list(self.fiats)
+            eng._idx = dict(self._idx)
+            eng.buy = self.buy.copy()
+            eng.sell = self.sell.copy()
+            eng.cross = self.cross.copy()
+        return eng
+
+    def _grow(self, fiat: str) -> int:
+        i = self._idx[fiat] = len(self.fiats)
+        self.fiats.append(fiat)
+        self.buy = np.append(self.buy, np.nan)
+        self.sell = np.append(self.sell, np.nan)
+        cross = np.full((i + 1, i + 1), np.nan)
+        cross[:i, :i] = self.cross
+        self.cross = cross
+        return i
+
+    def update(self, fiat: str, buy: float = None, sell: float = None):
+        """Nuevos precios de `fiat` (None = sin dato); recalcula solo su fila y su columna."""
+        with self._lock:
+            i = self._idx.get(fiat)
+            if i is None:
+                i = self._grow(fiat)
+            self.buy[i] = np.nan if buy is None else buy
+            self.sell[i] = np.nan if sell is None else sell
+            cost = self.buy * (1 + self.fee)
+            proceeds = self.sell * (1 - self.fee)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self.cross[i, :] = cost[i] / proceeds
+                self.cross[:, i] = cost / proceeds[i]
+
+    def update_from_snapshot(self, snap):
+        """Actualiza el fiat de un snapshot `USDT-<FIAT>` con la mediana profunda de cada lado."""
+        asset, _, fiat = snap.pair.partition('-')
+        if asset != 'USDT' or not fiat:
+            return
+        buy = deep_median(a.price for a in snap.ads if a.side == 'buy')
+        sell = deep_median(a.price for a in snap.ads if a.side == 'sell')
+        self.update(fiat, buy, sell)
+
+    # --- consultas (matrices completas, vectorizadas) ---
+
+    def _get(self, arr, src: str, dst: str) -> Optional[float]:
+        i, j = self._idx.get(src), self._idx.get(dst)
+        if i is None or j is None:
+            return None
+        v = float(arr[i, j])
+        return v if v == v else None
+
+    def rate(self, src: str, dst: str) -> Optional[float]:
+        """Unidades de `src` por unidad de `dst` vía P2P, comisiones incluidas."""
+        with self._lock:
+            return self._get(self.cross, src, dst)
+
+    def reference_matrix(self, margin: float = 0.05) -> np.ndarray:
+        with self._lock, np.errstate(invalid='ignore', divide='ignore'):
+            return np.outer(self.buy, 1 / self.sell) * (1 + margin)
+
+    def reference(self, src: str, dst: str, margin: float = 0.05) -> Optional[float]:
+        return self._get(self.reference_matrix(margin), src, dst)
+
+    def efficiency_matrix(self, margin: float = 0.05) -> np.ndarray:
+        """(P2P / remesa - 1)·100: negativo = el corredor P2P es más barato."""
+        ref = self.reference_matrix(margin)
+        with self._lock, np.errstate(invalid='ignore', divide='ignore'):
+            return (self.cross / ref - 1) * 100
+
+    def efficiency(self, src: str, dst: str, margin: float = 0.05) -> Optional[float]:
+        return self._get(self.efficiency_matrix(margin), src, dst)
+
+    def round_trip_matrix(self) -> np.ndarray:
+        """Ganancia % de i→j→i (solo comisiones y spreads: normalmente negativa)."""
+        with self._lock, np.errstate(invalid='ignore', divide='ignore'):
+            gain = 1 / self.cross
+            return (gain * gain.T - 1) * 100
+
+    def triangles(self, min_pct: float = 0.0, limit: int = 5) -> List[dict]:
+        """Ciclos i→j→k→i (fiats distintos) con ganancia % >= `min_pct`, mejores primero."""
+        with self._lock, np.errstate(invalid='ignore', divide='ignore'):
+            gain = 1 / self.cross
+            fiats = list(self.fiats)
+        n = len(fiats)
+        if n < 3:
+            return []
+        pct = (np.einsum('ij,jk,ki->ijk', gain, gain, gain) - 1) * 100
+        i, j, k = np.indices((n, n, n))
+        ok = (i != j) & (j != k) & (i != k) & (i < j) & (i < k) & ~np.isnan(pct) & (pct >= min_pct)
+        out = [{'cycle': [fiats[a], fiats[b], fiats[c], fiats[a]], 'profit_pct': float(pct[a, b, c])}
+               for a, b, c in np.argwhere(ok)]
+        out.sort(key=lambda x: x['profit_pct'], reverse=True)
+        return out[:limit]
+
+    def as_dict(self, margin: float = 0.05) -> dict:
+        """Matriz serializable: {'fiats', 'p2p', 'eficiencia_pct', 'ida_vuelta_pct'} con None donde falta."""
+        eff = self.efficiency_matrix(margin)
+        trip = self.round_trip_matrix()
+        with self._lock:
+            fiats = list(self.fiats)
+            cross = self.cross.copy()
+
+        def nested(m):
+            return {a: {b: (float(m[i, j]) if i != j and m[i, j] == m[i, j] else None)
+                        for j, b in enumerate(fiats)} for i, a in enumerate(fiats)}
+
+        return {'fiats': fiats, 'p2p': nested(cross), 'eficiencia_pct': nested(eff), 'ida_vuelta_pct': nested(trip)}
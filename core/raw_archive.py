@@ -0,0 +1,433 @@
+"""Compact ad-level archive for raw exchange responses.
+
+Replaces the `raw_responses` JSON blobs. Each fetch (exchange, pair, trade type)
+becomes one block: numeric columns (price, quantities, limits) stored as
+little-endian float64 arrays, merchants and banks dictionary-coded against the
+`raw_archive_dict` table, and the whole payload compressed with zstd when the
+`zstandard` package is installed or zlib otherwise.
+
+Reader API: `read_blocks(pair, trade_type, since, until)` and `read_latest(...)`
+return `ArchiveBlock` objects that decode lazily to arrays or to Binance-like
+dicts (`to_raw()`) for the pipeline helpers. `latest_blocks(keys)` serves the
+DB fallback of the pipeline from an LRU of decoded blocks keyed by row.
+"""
+import sqlite3
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Sequence as _SequenceABC
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import db, partitions, writer
+
+try:
+    import zstandard as _zstd
+except Exception:
+    _zstd = None
+
+_MAGIC = b"RA1"
+_F8 = np.dtype("<f8")
+_U4 = np.dtype("<u4")
+_U2 = np.dtype("<u2")
+
+# columnas numéricas en el orden del payload
+NUMERIC_FIELDS = (
+    "price",
+    "tradableQuantity",
+    "surplusAmount",
+    "minSingleTransAmount",
+    "dynamicMaxSingleTransAmount",
+)
+
+
+def _compress(data: bytes):
+    if _zstd is not None:
+        return "zstd", _zstd.ZstdCompressor(level=9).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        if _zstd is None:
+            raise RuntimeError("Bloque zstd en el archivo pero 'zstandard' no está instalado")
+        return _zstd.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _num(v) -> float:
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class _Dictionary:
+    """Process-wide cache of the merchant/bank dictionaries (value <-> code)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._path = None
+        self._codes: Dict[str, Dict[str, int]] = {}
+        self._values: Dict[str, Dict[int, str]] = {}
+
+    def _load_locked(self):
+        if self._path == str(db.DB_PATH):
+            return
+        self._codes, self._values = {}, {}
+        conn = sqlite3.connect(db.DB_PATH)
+        try:
+            for kind, code, value in conn.execute("SELECT kind, code, value FROM raw_archive_dict"):
+                self._codes.setdefault(kind, {})[value] = code
+                self._values.setdefault(kind, {})[code] = value
+        finally:
+            conn.close()
+        self._path = str(db.DB_PATH)
+
+    def encode(self, kind: str, values: Sequence[str]) -> List[int]:
+        with self._lock:
+            self._load_locked()
+            codes = self._codes.setdefault(kind, {})
+            missing = [v for v in dict.fromkeys(values) if v not in codes]
+            if missing:
+                # alta síncrona (rara tras el arranque) para que el bloque sea decodificable al persistirse
+                conn = sqlite3.connect(db.DB_PATH)
+                try:
+                    with conn:
+                        for v in missing:
+                            conn.execute(
+                                "INSERT OR IGNORE INTO raw_archive_dict (kind, code, value) "
+                                "SELECT ?, COALESCE(MAX(code), -1) + 1, ? FROM raw_archive_dict WHERE kind = ?",
+                                (kind, v, kind))
+                            code = conn.execute(
+                                "SELECT code FROM raw_archive_dict WHERE kind = ? AND value = ?", (kind, v)).fetchone()[0]
+                            codes[v] = code
+                            self._values.setdefault(kind, {})[code] = v
+                finally:
+                    conn.close()
+            return [codes[v] for v in values]
+
+    def decode(self, kind: str, code: int) -> str:
+        with self._lock:
+            self._load_locked()
+            value = self._values.get(kind, {}).get(code)
+            if value is None:
+                # otro proceso pudo haber añadido entradas: recargar una vez
+                self._path = None
+                self._load_locked()
+                value = self._values.get(kind, {}).get(code, "")
+            return value
+
+
+_DICT = _Dictionary()
+
+
+def encode_ads(raw_list) -> bytes:
+    """Encode a list of Binance `data` items into an uncompressed columnar payload."""
+    items = [it for it in (raw_list or []) if isinstance(it, dict)]
+    n = len(items)
+    cols = np.full((len(NUMERIC_FIELDS), n), np.nan, dtype=_F8)
+    merchants = []
+    bank_counts = np.zeros(n, dtype=_U2)
+    banks: List[str] = []
+    for i, item in enumerate(items):
+        adv = item.get("adv") or {}
+        advertiser = item.get("advertiser") or {}
+        for j, field in enumerate(NUMERIC_FIELDS):
+            cols[j, i] = _num(adv.get(field))
+        user_no = str(advertiser.get("userNo") or "N/A")
+        nick = str(advertiser.get("nickName") or advertiser.get("nick") or "N/A")
+        merchants.append(f"{user_no}\t{nick}")
+        methods = [str(m.get("tradeMethodName") or "") for m in (adv.get("tradeMethods") or []) if isinstance(m, dict)]
+        bank_counts[i] = len(methods)
+        banks.extend(methods)
+
+    merchant_codes = np.asarray(_DICT.encode("merchant", merchants), dtype=_U4)
+    bank_codes = np.asarray(_DICT.encode("bank", banks), dtype=_U4)
+    return b"".join((
+        _MAGIC,
+        struct.pack("<II", n, len(banks)),
+        cols.tobytes(),
+        merchant_codes.tobytes(),
+        bank_counts.tobytes(),
+        bank_codes.tobytes(),
+    ))
+
+
+class ArchiveBlock:
+    """One archived fetch; columns are decoded on first access."""
+
+    def __init__(self, block_id: int, ts_ms: int, exchange: str, pair: str, trade_type: str,
+                 n_ads: int, codec: str, payload: bytes):
+        self.id = block_id
+        self.ts_ms = ts_ms
+        self.exchange = exchange
+        self.pair = pair
+        self.trade_type = trade_type
+        self.n_ads = n_ads
+        self._codec = codec
+        self._payload = payload
+        self._decoded = None
+
+    @property
+    def timestamp_utc(self) -> str:
+        return datetime.fromtimestamp(self.ts_ms / 1000, tz=timezone.utc).isoformat()
+
+    @property
+    def fiat(self) -> str:
+        return self.pair.split("-")[-1]
+
+    def _decode(self):
+        if self._decoded is not None:
+            return self._decoded
+        buf = _decompress(self._codec, self._payload)
+        if buf[:3] != _MAGIC:
+            raise ValueError(f"Bloque {self.id}: formato desconocido")
+        n, n_banks = struct.unpack_from("<II", buf, 3)
+        off = 3 + 8
+        cols = np.frombuffer(buf, dtype=_F8, count=len(NUMERIC_FIELDS) * n, offset=off).reshape(len(NUMERIC_FIELDS), n)
+        off += cols.nbytes
+        merchant_codes = np.frombuffer(buf, dtype=_U4, count=n, offset=off)
+        off += merchant_codes.nbytes
+        bank_counts = np.frombuffer(buf, dtype=_U2, count=n, offset=off)
+        off += bank_counts.nbytes
+        bank_codes = np.frombuffer(buf, dtype=_U4, count=n_banks, offset=off)
+        self._decoded = (cols, merchant_codes, bank_counts, bank_codes)
+        self._payload = None
+        return self._decoded
+
+    def column(self, field: str) -> np.ndarray:
+        cols = self._decode()[0]
+        return cols[NUMERIC_FIELDS.index(field)]
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self.column("price")
+
+    @property
+    def volumes(self) -> np.ndarray:
+        # mismo campo que usa el pipeline para ponderar (dynamicMaxSingleTransAmount)
+        return self.column("dynamicMaxSingleTransAmount")
+
+    def merchants(self) -> List[tuple]:
+        codes = self._decode()[1]
+        out = []
+        for c in codes:
+            user_no, _, nick = _DICT.decode("merchant", int(c)).partition("\t")
+            out.append((user_no, nick))
+        return out
+
+    def banks(self) -> List[List[str]]:
+        _, _, counts, codes = self._decode()
+        out = []
+        pos = 0
+        for c in counts:
+            out.append([_DICT.decode("bank", int(x)) for x in codes[pos:pos + int(c)]])
+            pos += int(c)
+        return out
+
+    def to_raw(self) -> List[dict]:
+        """Rebuild Binance-like `data` items with the archived fields only."""
+        cols = self._decode()[0]
+        merchants = self.merchants()
+        banks = self.banks()
+        asset = self.pair.split("-")[0]
+        out = []
+        for i in range(cols.shape[1]):
+            adv = {"asset": asset, "fiatUnit": self.fiat, "tradeType": self.trade_type}
+            for j, field in enumerate(NUMERIC_FIELDS):
+                v = cols[j, i]
+                if v == v:  # NaN = campo ausente en la respuesta original
+                    adv[field] = float(v)
+            adv["tradeMethods"] = [{"tradeMethodName": b} for b in banks[i]]
+            user_no, nick = merchants[i]
+            out.append({"adv": adv, "advertiser": {"userNo": user_no, "nickName": nick}})
+        return out
+
+
+def append_block(exchange: str, pair: str, trade_type: str, raw_list, timestamp=None):
+    """Archive one fetch. The insert goes through the batch writer."""
+    db.init_db()
+    ts_ms = db.to_ms(timestamp) or db.now_ms()
+    payload = encode_ads(raw_list)
+    codec, blob = _compress(payload)
+    n = struct.unpack_from("<I", payload, 3)[0]
+    writer.execute(
+        db.DB_PATH,
+        f"INSERT INTO {partitions.table_for_write('raw_archive_blocks', ts_ms)} (ts_ms, exchange, pair, trade_type, n_ads, codec, payload) VALUES (?,?,?,?,?,?,?)",
+        (ts_ms, exchange, pair, trade_type.upper(), n, codec, sqlite3.Binary(blob)),
+    )
+
+
+def read_blocks(pair: str = None, trade_type: str = None, since=None, until=None,
+                exchange: str = None, limit: int = None, latest_first: bool = False,
+                flush: bool = False) -> List[ArchiveBlock]:
+    """Blocks for `pair`/`trade_type` with `since <= ts < until` (datetimes, ISO strings or epoch ms).
+
+    Reads committed rows only; `flush=True` first waits for the writer queue
+    (maintenance jobs that need their own recent blocks).
+    """
+    db.init_db()
+    if flush:
+        writer.flush()
+    conn = sqlite3.connect(db.DB_PATH)
+    cols = "id, ts_ms, exchange, pair, trade_type, n_ads, codec, payload"
+    src = partitions.source(conn, "raw_archive_blocks", since=db.to_ms(since), until=db.to_ms(until), columns=cols)
+    q = f"SELECT {cols} FROM {src}"
+    conds, params = [], []
+    if pair:
+        conds.append("pair = ?")
+        params.append(pair)
+    if trade_type:
+        conds.append("trade_type = ?")
+        params.append(trade_type.upper())
+    if exchange:
+        conds.append("exchange = ?")
+        params.append(exchange)
+    if since is not None:
+        conds.append("ts_ms >= ?")
+        params.append(db.to_ms(since))
+    if until is not None:
+        conds.append("ts_ms < ?")
+        params.append(db.to_ms(until))
+    if conds:
+        q += " WHERE " + " AND ".join(conds)
+    q += " ORDER BY ts_ms DESC" if latest_first else " ORDER BY ts_ms ASC"
+    if limit:
+        q += " LIMIT ?"
+        params.append(int(limit))
+    try:
+        rows = conn.execute(q, params).fetchall()
+    finally:
+        conn.close()
+    return [ArchiveBlock(*r) for r in rows]
+
+
+def read_latest(pair: str, trade_type: str, exchange: str = None, flush: bool = False) -> Optional[ArchiveBlock]:
+    blocks = read_blocks(pair=pair, trade_type=trade_type, exchange=exchange, limit=1, latest_first=True,
+                         flush=flush)
+    return blocks[0] if blocks else None
+
+
+class RawList(_SequenceABC):
+    """Lazy `to_raw()` of a block: len and price/volume columns without building the dicts."""
+
+    def __init__(self, block: ArchiveBlock):
+        self.block = block
+        self._items = None
+
+    def __len__(self):
+        return self.block.n_ads
+
+    def __getitem__(self, i):
+        if self._items is None:
+            self._items = self.block.to_raw()
+        return self._items[i]
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self.block.prices
+
+    @property
+    def volumes(self) -> np.ndarray:
+        return self.block.volumes
+
+
+# bloques ya leídos, por (db, tabla, id): el id solo es único dentro de cada partición
+_BLOCK_CACHE_SIZE = 32
+_block_cache: "OrderedDict[tuple, ArchiveBlock]" = OrderedDict()
+_block_cache_lock = threading.Lock()
+
+
+def _cached_block(conn, table: str, header) -> ArchiveBlock:
+    key = (str(db.DB_PATH), table, header[0])
+    with _block_cache_lock:
+        block = _block_cache.get(key)
+        if block is not None:
+            _block_cache.move_to_end(key)
+            return block
+    payload = conn.execute(f'SELECT payload FROM "{table}" WHERE id = ?', (header[0],)).fetchone()[0]
+    block = ArchiveBlock(*header, payload)
+    with _block_cache_lock:
+        _block_cache[key] = block
+        while len(_block_cache) > _BLOCK_CACHE_SIZE:
+            _block_cache.popitem(last=False)
+    return block
+
+
+def latest_blocks(keys: Sequence[Tuple[str, str]], exchange: str = None,
+                  flush: bool = False) -> Dict[Tuple[str, str], Optional[ArchiveBlock]]:
+    """Latest committed block of each (pair, trade_type) over a single connection.
+
+    Partitions are probed newest first with an index seek on the header columns;
+    payloads are only read for blocks not already in the cache. Bot paths never
+    wait on the writer; `flush=True` is for callers that need read-your-writes.
+    """
+    db.init_db()
+    if flush:
+        writer.flush()
+    conn = sqlite3.connect(db.DB_PATH)
+    out = {}
+    try:
+        # la tabla base solo guarda filas anteriores al particionado
+        tables = [name for _, name in reversed(partitions.list_partitions(conn, "raw_archive_blocks"))]
+        tables.append("raw_archive_blocks")
+        for pair, trade_type in keys:
+            out[(pair, trade_type)] = None
+            params = [pair, trade_type.upper()]
+            cond = "pair = ? AND trade_type = ?"
+            if exchange:
+                cond += " AND exchange = ?"
+                params.append(exchange)
+            for t in tables:
+                header = conn.execute(
+                    f'SELECT id, ts_ms, exchange, pair, trade_type, n_ads, codec FROM "{t}" '
+                    f'WHERE {cond} ORDER BY ts_ms DESC LIMIT 1', params).fetchone()
+                if header:
+                    out[(pair, trade_type)] = _cached_block(conn, t, header)
+                    break
+    finally:
+        conn.close()
+    return out
+
+
+def migrate_legacy_raw_responses(batch: int = 200) -> int:
+    """Move `raw_responses` JSON rows into the archive partitions (synchronous). Returns rows migrated."""
+    import json
+
+    db.init_db()
+    migrated = 0
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT id, timestamp_utc, exchange, fiat, trade_type, raw_json FROM raw_responses ORDER BY id LIMIT ?",
+                (batch,)).fetchall()
+            if not rows:
+                break
+            out: Dict[str, list] = {}
+            for _id, ts, exch, fiat, tt, raw_json in rows:
+                try:
+                    raw = json.loads(raw_json)
+                except Exception:
+                    raw = []
+                payload = encode_ads(raw if isinstance(raw, list) else [])
+                codec, blob = _compress(payload)
+                n = struct.unpack_from("<I", payload, 3)[0]
+                ts_ms = db.to_ms(ts)
+                table = partitions.table_for_write("raw_archive_blocks", ts_ms)
+                out.setdefault(table, []).append(
+                    (ts_ms, exch, f"USDT-{fiat}", tt.upper(), n, codec, sqlite3.Binary(blob)))
+            with conn:
+                for table, values in out.items():
+                    conn.executemany(
+                        f"INSERT INTO {table} (ts_ms, exchange, pair, trade_type, n_ads, codec, payload) VALUES (?,?,?,?,?,?,?)",
+                        values)
+                conn.execute("DELETE FROM raw_responses WHERE id <= ?", (rows[-1][0],))
+            migrated += len(rows)
+    finally:
+        conn.close()
+    return migrated
@@ -1,13 +1,16 @@
 import logging
 from datetime import datetime
-from core import fetcher, snapshot
+from core import fetcher
 
 log = logging.getLogger(__name__)
 
 
-def start_scheduler(config, fetch_interval: int = 300, snapshot_interval: int = 300):
-    """Start a background scheduler for periodic fetch and snapshot.
+def start_scheduler(config, fetch_interval: int = 300):
+    """Start a background scheduler for periodic fetch and maintenance jobs.
     If `apscheduler` is not available, return a dummy scheduler with `shutdown()`.
+
+    Snapshot summaries are not a job anymore: the RAM window writes them on ingest
+    (`core.snapshot.SnapshotSummarizer`).
     """
     try:
         from apscheduler.schedulers.background import BackgroundScheduler
@@ -29,13 +32,6 @@ def start_scheduler(config, fetch_interval: int = 300, snapshot_interval: int =
         except Exception as e:
             log.exception(f"Error en job_fetch: {e}")
 
-    def job_snapshot():
-        log.info(f"[{datetime.utcnow().isoformat()}] Scheduler: Ejecutando create_and_store_snapshots")
-        try:
-            snapshot.create_and_store_snapshots(config)
-        except Exception as e:
-            log.exception(f"Error en job_snapshot: {e}")
-
     def job_merchant_stats():
         log.info("Scheduler: Actualizando merchant_stats...")
         try:
@@ -45,6 +41,13 @@ def start_scheduler(config, fetch_interval: int = 300, snapshot_interval: int =
         except Exception as e:
             log.exception(f"Error en job_merchant_stats: {e}")
 
+    def job_merchant_rescore():
+        try:
+            from core.merchant_scores import rescore_all
+            rescore_all()
+        except Exception as e:
+            log.exception(f"Error en job_merchant_rescore: {e}")
+
     def job_cleanup_db():
         log.info("Scheduler: Ejecutando limpieza de DB (retención 30 días)...")
         try:
@@ -88,11 +91,14 @@ def start_scheduler(config, fetch_interval: int = 300, snapshot_interval: int =
             log.exception(f"Error en job_collect_spread: {e}")
 
     sched.add_job(job_fetch, "interval", seconds=fetch_interval, id="fetch_job")
-    sched.add_job(job_snapshot, "interval", seconds=snapshot_interval, id="snapshot_job")
-    sched.add_job(job_merchant_stats, "interval", hours=1, id="merchant_stats_job")
+    # al cambiar de hora: vuelca los acumuladores de la hora cerrada
+    sched.add_job(job_merchant_stats, "cron", minute=0, second=5, id="merchant_stats_job")
     sched.add_job(job_collect_spread, "interval", hours=1, id="spread_history_job")
+    from core.app_config import DETECTORS
+    rescore_minutes = DETECTORS.get('merchant_intelligence', {}).get('rescore_minutes', 15)
+    sched.add_job(job_merchant_rescore, "interval", minutes=rescore_minutes, id="merchant_rescore_job")
     sched.add_job(job_cleanup_db, "cron", hour=3, id="cleanup_job") # A las 3 AM
 
     sched.start()
-    log.info(f"Scheduler iniciado (fetch every {fetch_interval}s, snapshot every {snapshot_interval}s)")
+    log.info(f"Scheduler iniciado (fetch every {fetch_interval}s)")
     return sched
@@ -0,0 +1,169 @@
+"""Series por par en buffers circulares NumPy y estadísticos vectorizados.
+
+`SeriesStore` guarda, por par, una fila de `capacity` muestras × métricas con
+su timestamp. Las funciones de abajo operan sobre todas las filas a la vez:
+z-score del último valor frente a cada horizonte y un paso de CUSUM bilateral.
+"""
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+
+class SeriesStore:
+    def __init__(self, metrics: Sequence[str], capacity: int = 512):
+        self.metrics = tuple(metrics)
+        self.capacity = int(capacity)
+        self.rows: Dict[str, int] = {}
+        self.values = np.full((0, self.capacity, len(self.metrics)), np.nan)
+        self.ts = np.full((0, self.capacity), np.nan)
+        # posición de la última muestra de cada fila (-1 = vacía)
+        self.head = np.zeros(0, dtype=np.int64)
+
+    def _row(self, pair: str) -> int:
+        row = self.rows.get(pair)
+        if row is None:
+            row = self.rows[pair] = len(self.rows)
+            self.values = np.concatenate([self.values, np.full((1, self.capacity, len(self.metrics)), np.nan)])
+            self.ts = np.concatenate([self.ts, np.full((1, self.capacity), np.nan)])
+            self.head = np.append(self.head, -1)
+        return row
+
+    def append(self, pair: str, ts: float, values: Sequence[float]):
+        row = self._row(pair)
+        pos = (self.head[row] + 1) % self.capacity
+        self.values[row, pos] = values
+        self.ts[row, pos] = ts
+        self.head[row] = pos
+
+    def latest(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(ts, valores) de la última muestra de cada fila: shapes (P,) y (P, M)."""
+        idx = np.arange(len(self.head))
+        pos = np.maximum(self.head, 0)
+        return self.ts[idx, pos], self.values[idx, pos]
+
+    def pairs(self):
+        return sorted(self.rows, key=self.rows.get)
+
+
+def rolling_zscores(store: SeriesStore, horizons: Sequence[float]):
+    """z-score del último valor de cada fila/métrica frente a las muestras previas de cada horizonte.
+
+    Devuelve (z, n, mean, std) con shape (H, P, M); z es NaN donde no hay muestras
+    suficientes o la desviación es cero.
+    """
+    last_ts, last_vals = store.latest()
+    H, (P, _, M) = len(horizons), store.values.shape
+    z = np.full((H, P, M), np.nan)
+    n = np.zeros((H, P, M))
+    mean = np.full((H, P, M), np.nan)
+    std = np.full((H, P, M), np.nan)
+    if not P:
+        return z, n, mean, std
+    ts = store.ts
+    for h, seconds in enumerate(horizons):
+        # muestras anteriores a la última dentro del horizonte
+        mask = (ts < last_ts[:, None]) & (ts >= (last_ts - seconds)[:, None])
+        vals = np.where(mask[:, :, None], store.values, np.nan)
+        valid = ~np.isnan(vals)
+        cnt = valid.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mu = np.nansum(vals, axis=1) / cnt
+            var = np.nansum((vals - mu[:, None, :]) ** 2, axis=1) / (cnt - 1)
+            sd = np.sqrt(var)
+            zz = (last_vals - mu) / sd
+        zz[(cnt < 2) | ~(sd > 0)] = np.nan
+        z[h], n[h], mean[h], std[h] = zz, cnt, mu, sd
+    return z, n, mean, std
+
+
+def cusum_step(s_pos: np.ndarray, s_neg: np.ndarray, x: np.ndarray, mu: np.ndarray, sigma: np.ndarray,
+               k: float = 0.5):
+    """Un paso de CUSUM bilateral estandarizado; filas sin referencia válida no acumulan."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dev = (x - mu) / sigma
+    dev = np.where(np.isfinite(dev), dev, 0.0)
+    s_pos = np.maximum(0.0, s_pos + dev - k)
+    s_neg = np.maximum(0.0, s_neg - dev - k)
+    return s_pos, s_neg
+
+
+class PositionRings:
+    """Por par, matrices circulares tiempo × posición del top `k` de cada lado del libro.
+
+    Una fila por snapshot con precio y cantidad de asks ('buy') y bids ('sell'), el spread %
+    de cada posición (ask_i - bid_i) / bid_i y la cantidad acumulada ask+bid por posición, de
+    modo que el volumen de un rango de posiciones en cualquier ventana es una resta de columnas.
+    Las posiciones que faltan (libro más corto que `k`) quedan en NaN.
+    """
+
+    FIELDS = ('ask_price', 'ask_qty', 'bid_price', 'bid_qty', 'spread', 'cum_qty')
+
+    def __init__(self, k: int = 100, capacity: int = 720):
+        self.k = int(k)
+        self.capacity = int(capacity)
+        self._rings: Dict[str, dict] = {}
+
+    def _ring(self, pair: str) -> dict:
+        ring = self._rings.get(pair)
+        if ring is None:
+            ring = {f: np.full((self.capacity, self.k), np.nan) for f in self.FIELDS}
+            ring['ts'] = np.full(self.capacity, np.nan)
+            ring['head'] = -1
+            self._rings[pair] = ring
+        return ring
+
+    def row(self, snap) -> Dict[str, np.ndarray]:
+        """Fila de `snap` ({campo: (k,)} y 'ts'), calculada sin tocar los anillos."""
+        book = snap.book
+        out = {f: np.full(self.k, np.nan) for f in self.FIELDS}
+        na, nb = min(self.k, len(book.ask_prices)), min(self.k, len(book.bid_prices))
+        n = min(na, nb)
+        out['ask_price'][:na] = book.ask_prices[:na]
+        out['ask_qty'][:na] = book.ask_qty[:na]
+        out['bid_price'][:nb] = book.bid_prices[:nb]
+        out['bid_qty'][:nb] = book.bid_qty[:nb]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            out['spread'][:n] = (book.ask_prices[:n] - book.bid_prices[:n]) / book.bid_prices[:n] * 100
+        out['cum_qty'][:n] = np.cumsum(book.ask_qty[:n] + book.bid_qty[:n])
+        out['ts'] = snap.timestamp.timestamp()
+        return out
+
+    def push(self, pair: str, row: Dict[str, np.ndarray]):
+        """Escribe una fila de `row` en la siguiente posición del anillo del par."""
+        ring = self._ring(pair)
+        pos = (ring['head'] + 1) % self.capacity
+        for f in self.FIELDS:
+            ring[f][pos] = row[f]
+        ring['ts'][pos] = row['ts']
+        ring['head'] = pos
+
+    def add_snapshot(self, snap):
+        self.push(snap.pair, self.row(snap))
+
+    def window(self, pair: str, since_ts: float = None) -> Dict[str, np.ndarray]:
+        """Filas con ts >= `since_ts` en orden cronológico: {'ts': (T,), campo: (T, k)} (copias)."""
+        ring = self._rings.get(pair)
+        if ring is None or ring['head'] < 0:
+            return {'ts': np.empty(0), **{f: np.empty((0, self.k)) for f in self.FIELDS}}
+        order = np.roll(np.arange(self.capacity), -(ring['head'] + 1))
+        ts = ring['ts'][order]
+        keep = ~np.isnan(ts)
+        if since_ts is not None:
+            keep &= ts >= since_ts
+        order = order[keep]
+        return {'ts': ring['ts'][order], **{f: ring[f][order] for f in self.FIELDS}}
+
+
+def range_volume(cum_qty: np.ndarray, first: int, last: int) -> np.ndarray:
+    """Volumen ask+bid de las posiciones `first`..`last` (1-based) por fila; NaN si el libro no llega a `last`."""
+    if last > cum_qty.shape[1]:
+        return np.full(len(cum_qty), np.nan)
+    hi = cum_qty[:, last - 1]
+    return hi - cum_qty[:, first - 2] if first > 1 else hi
+
+
+def per_hour(ts: np.ndarray) -> float:
+    """Snapshots por hora según los timestamps reales (epoch s) de la ventana."""
+    if len(ts) < 2 or ts[-1] <= ts[0]:
+        return float(len(ts))
+    return (len(ts) - 1) * 3600.0 / float(ts[-1] - ts[0])
@@ -0,0 +1,246 @@
+"""Sketches de cuantiles (t-digest) fusionables para precios por par y lado.
+
+- `TDigest`: centroides (media, peso) comprimidos con la función de escala k1;
+  `quantile` es O(tamaño del sketch) y `TDigest.merge` combina varios.
+- `QuantileWindow`: un digest por minuto y (pair, side) sobre la ventana RAM;
+  cada `rollup` persiste los buckets cerrados (10 min) en `price_sketches`.
+- `price_quantiles`: p10/p50/p90 (o cualquier q) de cualquier ventana; lo que
+  excede la RAM se completa con los sketches persistidos.
+"""
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from core import db, writer
+
+ROLLUP_SECONDS = 600
+
+_HEADER = struct.Struct("<dIdd")  # compresión, n centroides, min, max
+
+
+class TDigest:
+    def __init__(self, compression: float = 100.0):
+        self.compression = float(compression)
+        self._means = np.empty(0)
+        self._weights = np.empty(0)
+        self._buffer: List[float] = []
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    # --- construcción ---
+
+    def add(self, x: float):
+        self._buffer.append(float(x))
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def add_many(self, values: Iterable[float]):
+        self._buffer.extend(float(v) for v in values)
+        if len(self._buffer) >= 10 * self.compression:
+            self._compress()
+
+    def _compress(self, extra_means=None, extra_weights=None):
+        parts_m = [self._means]
+        parts_w = [self._weights]
+        if self._buffer:
+            buf = np.asarray(self._buffer, dtype=np.float64)
+            self._buffer = []
+            parts_m.append(buf)
+            parts_w.append(np.ones(len(buf)))
+        if extra_means is not None:
+            parts_m.append(extra_means)
+            parts_w.append(extra_weights)
+        means = np.concatenate(parts_m)
+        weights = np.concatenate(parts_w)
+        if not len(means):
+            return
+        self.min = min(self.min, float(means.min()))
+        self.max = max(self.max, float(means.max()))
+        order = np.argsort(means, kind='stable')
+        means = means[order]
+        weights = weights[order]
+        total = weights.sum()
+        # q de cada centroide -> índice k1(q) = δ/2π·asin(2q-1); un bin por unidad de k
+        q = (np.cumsum(weights) - weights / 2) / total
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+        _, bins = np.unique(k, return_inverse=True)
+        w = np.bincount(bins, weights=weights)
+        self._means = np.bincount(bins, weights=means * weights) / w
+        self._weights = w
+
+    def _centroids(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._buffer:
+            self._compress()
+        return self._means, self._weights
+
+    @property
+    def count(self) -> float:
+        return float(self._weights.sum()) + len(self._buffer)
+
+    @classmethod
+    def merge(cls, digests: Sequence["TDigest"], compression: float = None) -> "TDigest":
+        out = cls(compression or (digests[0].compression if digests else 100.0))
+        means, weights = [], []
+        for d in digests:
+            m, w = d._centroids()
+            if len(m):
+                means.append(m)
+                weights.append(w)
+                out.min = min(out.min, d.min)
+                out.max = max(out.max, d.max)
+        if means:
+            out._compress(np.concatenate(means), np.concatenate(weights))
+        return out
+
+    # --- consultas ---
+
+    def quantile(self, q):
+        """Cuantil(es) interpolando entre centros de centroides; None si vacío."""
+        means, weights = self._centroids()
+        if not len(means):
+            return None
+        qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        if len(means) == 1:
+            res = np.full(len(qs), means[0])
+        else:
+            total = weights.sum()
+            centers = np.cumsum(weights) - weights / 2
+            xs = np.concatenate(([0.0], centers, [total]))
+            ys = np.concatenate(([self.min], means, [self.max]))
+            res = np.interp(qs * total, xs, ys)
+        return float(res[0]) if np.ndim(q) == 0 else res.tolist()
+
+    # --- serialización ---
+
+    def to_bytes(self) -> bytes:
+        means, weights = self._centroids()
+        header = _HEADER.pack(self.compression, len(means), self.min, self.max)
+        return zlib.compress(header + means.tobytes() + weights.tobytes())
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "TDigest":
+        raw = zlib.decompress(blob)
+        compression, n, lo, hi = _HEADER.unpack_from(raw)
+        off = _HEADER.size
+        d = cls(compression)
+        d._means = np.frombuffer(raw, dtype=np.float64, count=n, offset=off).copy()
+        d._weights = np.frombuffer(raw, dtype=np.float64, count=n, offset=off + 8 * n).copy()
+        d.min, d.max = lo, hi
+        return d
+
+
+class QuantileWindow:
+    def __init__(self, window_seconds: int = 6 * 3600, bucket_seconds: int = 60, compression: float = 100.0):
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.compression = compression
+        self._lock = threading.Lock()
+        # (pair, side) -> deque[(bucket_start epoch s, TDigest)]
+        self._buckets: Dict[Tuple[str, str], deque] = {}
+        # (pair, side) -> inicio del último rollup persistido
+        self._rolled: Dict[Tuple[str, str], int] = {}
+
+    def add_snapshot(self, snap):
+        ts = int(snap.timestamp.timestamp())
+        start = ts - ts % self.bucket_seconds
+        by_side: Dict[str, List[float]] = {}
+        for ad in snap.ads:
+            by_side.setdefault(ad.side, []).append(ad.price)
+        with self._lock:
+            for side, prices in by_side.items():
+                dq = self._buckets.setdefault((snap.pair, side), deque())
+                if not dq or dq[-1][0] < start:
+                    dq.append((start, TDigest(self.compression)))
+                dq[-1][1].add_many(prices)
+                horizon = ts - self.window_seconds
+                while dq and dq[0][0] + self.bucket_seconds <= horizon:
+                    dq.popleft()
+
+    def digest(self, pair: str, side: str, since: float = None, until: float = None) -> Optional[TDigest]:
+        with self._lock:
+            parts = [d for start, d in self._buckets.get((pair, side), ())
+                     if (since is None or start >= since - since % self.bucket_seconds)
+                     and (until is None or start < until)]
+            # bajo el lock: merge compacta los buffers del bucket abierto
+            return TDigest.merge(parts, self.compression) if parts else None
+
+    def oldest(self, pair: str, side: str) -> Optional[int]:
+        with self._lock:
+            dq = self._buckets.get((pair, side))
+            return dq[0][0] if dq else None
+
+    def rollup(self, bucket_seconds: int = ROLLUP_SECONDS, now: float = None) -> int:
+        """Persiste un sketch por cada bucket de `bucket_seconds` ya cerrado."""
+        now = int(now if now is not None else time.time())
+        closed_until = now - now % bucket_seconds
+        rows = []
+        with self._lock:
+            keys = list(self._buckets)
+        for pair, side in keys:
+            oldest = self.oldest(pair, side)
+            if oldest is None:
+                continue
+            start = self._rolled.get((pair, side))
+            if start is None:
+                # el primer bucket puede estar incompleto (arranque): no pisa el ya persistido
+                start = -(-oldest // bucket_seconds) * bucket_seconds
+            while start + bucket_seconds <= closed_until:
+                d = self.digest(pair, side, since=start, until=start + bucket_seconds)
+                if d is not None:
+                    rows.append((pair, side, start * 1000, int(d.count), d.to_bytes()))
+                start += bucket_seconds
+            self._rolled[(pair, side)] = start
+        if rows:
+            db.init_db()
+            writer.execute_many(db.DB_PATH, """
+                INSERT INTO price_sketches (pair, side, bucket_ts, n, digest) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(pair, side, bucket_ts) DO UPDATE SET n = excluded.n, digest = excluded.digest
+            """, rows)
+        return len(rows)
+
+
+def _stored_digests(pair: str, side: str, since_ms: int, until_ms: int, flush: bool = False) -> List[TDigest]:
+    import sqlite3
+    if flush:
+        writer.flush()
+    db.init_db()
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        rows = conn.execute(
+            "SELECT digest FROM price_sketches WHERE pair = ? AND side = ? AND bucket_ts >= ? AND bucket_ts < ?",
+            (pair, side, since_ms, until_ms)).fetchall()
+    finally:
+        conn.close()
+    return [TDigest.from_bytes(r[0]) for r in rows]
+
+
+def price_quantiles(pair: str, side: str, seconds: int, qs=(0.1, 0.5, 0.9), window: QuantileWindow = None,
+                    now: float = None, flush: bool = False):
+    """Cuantiles del precio en los últimos `seconds`; None si no hay datos.
+
+    Los rollups se leen tal como están confirmados; `flush=True` espera antes la cola del writer.
+    """
+    if window is None:
+        from core.ram_window import get_global
+        window = get_global().price_sketches
+    now = now if now is not None else time.time()
+    since = now - seconds
+    parts = []
+    oldest = window.oldest(pair, side)
+    ram_since = since
+    if oldest is None or since < oldest:
+        # tramo anterior a la RAM desde los rollups persistidos (buckets completos)
+        boundary = -(-int(oldest if oldest is not None else now) // ROLLUP_SECONDS) * ROLLUP_SECONDS
+        parts.extend(_stored_digests(pair, side, int(since * 1000), boundary * 1000, flush=flush))
+        ram_since = boundary
+    ram = window.digest(pair, side, since=ram_since)
+    if ram is not None:
+        parts.append(ram)
+    if not parts:
+        return None
+    return TDigest.merge(parts, window.compression).quantile(list(qs))
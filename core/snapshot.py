@@ -1,58 +1,82 @@
-from core import pipeline, db
-from config import log
+"""Resúmenes de snapshot (tabla `snapshots`) calculados desde la ventana RAM.
 
+Cada snapshot nuevo de la ventana pasa por `SnapshotSummarizer.observe`, que
+persiste como mucho un resumen por par cada `interval_seconds` a través del
+writer por lotes. El resumen sale del libro ya ordenado (`Snapshot.book`):
+no hay lectura de la DB, ni parseo de JSON, ni recálculo del pipeline.
+"""
+import statistics
+import threading
 
-def create_and_store_snapshots(config):
-    """Genera snapshots a partir del pipeline y los guarda en la DB.
+import numpy as np
 
-    Crea una entrada por par (USDT-COP y USDT-VES) con el formato esperado.
+from core import db
+from core.app_config import CONFIG
+from core.rates import deep_median
+
+
+def summarize(snap, rates=None) -> dict:
+    """Resumen de un snapshot de RAM con las columnas de `snapshots`.
+
+    Los campos de precio son del lado 'buy' (Tab Compra, mejor = menor precio),
+    como el resumen que se construía desde el pipeline.
     """
-    data = pipeline.build_data_from_db(config)
-    if not data:
-        log.warning("No hay datos para crear snapshot")
-        return
-
-    # para cada par guardamos un resumen
-    # COP
-    try:
-        cop_summary = {
-            "timestamp_utc": data["timestamps"]["utc"],
-            "pair": "USDT-COP",
-            "rows_fetched": data["COP"]["raw_count"],
-            "avg_price_simple": data["COP"]["promedio_buy_tasa"],
-            "avg_price_weighted": data["analisis"]["cop_buy"]["avg_ponderado"],
-            "spread_pct": data["analisis"]["cop_buy"]["coef_var"],
-            "coef_var": data["analisis"]["cop_buy"]["coef_var"],
-            "total_exposed_volume": None,
-            "top1_price": data["analisis"]["cop_buy"].get("min"),
-            "top1_vol": None,
-            "top1_nick": None,
-            "top3_prices": str([]),
-            "arb_estimate_cop_to_ves_pct": data["arbitraje"].get("eficiencia_pct") if data.get("arbitraje") else None,
-            "arb_estimate_ves_to_cop_pct": data["arbitraje"].get("tasa_p2p") if data.get("arbitraje") else None,
-        }
-        db.save_snapshot_summary("USDT-COP", cop_summary)
-    except Exception as e:
-        log.warning(f"Error guardando snapshot COP: {e}")
-
-    # VES
-    try:
-        ves_summary = {
-            "timestamp_utc": data["timestamps"]["utc"],
-            "pair": "USDT-VES",
-            "rows_fetched": data["VES"]["raw_count"],
-            "avg_price_simple": data["VES"]["promedio_buy_tasa"],
-            "avg_price_weighted": data["analisis"]["ves_buy"]["avg_ponderado"],
-            "spread_pct": data["analisis"]["ves_buy"]["coef_var"],
-            "coef_var": data["analisis"]["ves_buy"]["coef_var"],
-            "total_exposed_volume": None,
-            "top1_price": data["analisis"]["ves_buy"].get("min"),
-            "top1_vol": None,
-            "top1_nick": None,
-            "top3_prices": str([]),
-            "arb_estimate_cop_to_ves_pct": data["arbitraje"].get("eficiencia_pct") if data.get("arbitraje") else None,
-            "arb_estimate_ves_to_cop_pct": data["arbitraje"].get("tasa_p2p") if data.get("arbitraje") else None,
-        }
-        db.save_snapshot_summary("USDT-VES", ves_summary)
-    except Exception as e:
-        log.warning(f"Error guardando snapshot VES: {e}")
+    book = snap.book
+    asks = book.asks
+    prices = [a.price for a in snap.ads if a.side == 'buy']
+
+    avg_simple = deep_median(prices)
+    weighted = None
+    coef_var = None
+    if len(book.ask_prices):
+        mean = float(book.ask_prices.mean())
+        qty = book.ask_qty.sum()
+        weighted = (float((book.ask_prices * book.ask_qty).sum() / qty)
+                    if CONFIG.get("ponderacion_volumen", False) and qty > 0 else mean)
+        desv = statistics.stdev(prices) if len(prices) > 1 else 0
+        coef_var = round(desv / mean * 100, 4) if mean else 0
+    spread = None
+    if len(book.ask_prices) and len(book.bid_prices) and book.bid_prices[0] > 0:
+        spread = float((book.ask_prices[0] - book.bid_prices[0]) / book.bid_prices[0] * 100)
+
+    arb_cop_ves = arb_ves_cop = None
+    if rates is not None:
+        arb_cop_ves = rates.efficiency("COP", "VES", 0.05)
+        arb_ves_cop = rates.efficiency("VES", "COP", 0.05)
+
+    return {
+        "timestamp_utc": snap.timestamp.isoformat(),
+        "pair": snap.pair,
+        "rows_fetched": len(snap.ads),
+        "avg_price_simple": avg_simple,
+        "avg_price_weighted": round(weighted, 6) if weighted is not None else None,
+        "spread_pct": spread,
+        "coef_var": coef_var,
+        "total_exposed_volume": float(np.sum(book.quantities)),
+        "top1_price": asks[0].price if asks else None,
+        "top1_vol": asks[0].quantity if asks else None,
+        "top1_nick": asks[0].merchant if asks else None,
+        "top3_prices": str([a.price for a in asks[:3]]),
+        "arb_estimate_cop_to_ves_pct": arb_cop_ves,
+        "arb_estimate_ves_to_cop_pct": arb_ves_cop,
+    }
+
+
+class SnapshotSummarizer:
+    def __init__(self, interval_seconds: int = 600):
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        # pair -> epoch s del último resumen persistido
+        self._last = {}
+
+    def observe(self, snap, rates=None):
+        """Persiste el resumen de `snap` si pasó `interval_seconds` desde el último del par."""
+        ts = snap.timestamp.timestamp()
+        with self._lock:
+            last = self._last.get(snap.pair)
+            if last is not None and ts - last < self.interval_seconds:
+                return None
+            self._last[snap.pair] = ts
+        summary = summarize(snap, rates)
+        db.save_snapshot_summary(snap.pair, summary)
+        return summary
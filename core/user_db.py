@@ -1,9 +1,12 @@
 import sqlite3
 import json
+import threading
 from pathlib import Path
 from datetime import datetime, timezone
 import logging
 
+from core import writer
+
 DB_PATH = Path("data/p2p_data.db")
 logger = logging.getLogger(__name__)
 
@@ -12,12 +15,17 @@ def init_user_db():
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
+    cols = [r[1] for r in cur.execute("PRAGMA table_info(bot_usage_logs)")]
+    if "timestamp" in cols and "ts" not in cols:
+        conn.close()
+        raise RuntimeError(
+            "bot_usage_logs usa el esquema antiguo (timestamp TEXT). Ejecuta scripts/maintain_db.py para migrar.")
     cur.execute(
         """
         CREATE TABLE IF NOT EXISTS bot_usage_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id TEXT NOT NULL,
-            timestamp TEXT NOT NULL,
+            ts INTEGER NOT NULL,
             command TEXT NOT NULL,
             result TEXT NOT NULL,
             response_time REAL,
@@ -27,7 +35,9 @@ def init_user_db():
     )
     # Índices para búsquedas rápidas diarias
     cur.execute(
-        "CREATE INDEX IF NOT EXISTS idx_usage_user_ts ON bot_usage_logs(user_id, timestamp)")
+        "CREATE INDEX IF NOT EXISTS idx_usage_user_ts ON bot_usage_logs(user_id, ts)")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_usage_ts ON bot_usage_logs(ts)")
 
     cur.execute(
         """
@@ -93,23 +103,73 @@ def init_user_db():
     conn.close()
 
 
+def _day_range_ms(now: datetime = None):
+    """[inicio, fin) del día UTC actual en epoch-ms."""
+    now = now or datetime.now(timezone.utc)
+    start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    start_ms = int(start.timestamp() * 1000)
+    return start_ms, start_ms + 86_400_000
+
+
 def log_usage(user_id: str, command: str, result: str, response_time: float = 0.0, details: dict = None):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    ts = datetime.now(timezone.utc).isoformat()
+    ts = int(datetime.now(timezone.utc).timestamp() * 1000)
     det_json = json.dumps(details, ensure_ascii=False) if details else None
     try:
-        cur.execute(
-            "INSERT INTO bot_usage_logs (user_id, timestamp, command, result, response_time, details) VALUES (?,?,?,?,?,?)",
+        # write-behind: el handler del bot no espera el commit
+        writer.execute(
+            DB_PATH,
+            "INSERT INTO bot_usage_logs (user_id, ts, command, result, response_time, details) VALUES (?,?,?,?,?,?)",
             (str(user_id), ts, command, result, response_time, det_json)
         )
-        conn.commit()
     except Exception as e:
         logger.error(f"Error guardando log de uso: {e}")
+
+
+def count_requests_today(user_id: str) -> int:
+    """Consultas válidas (que ocupan cupo) del usuario en el día UTC actual."""
+    conn = sqlite3.connect(DB_PATH)
+    cur = conn.cursor()
+    day_start, day_end = _day_range_ms()
+    try:
+        cur.execute(
+            "SELECT COUNT(*) FROM bot_usage_logs WHERE user_id = ? AND ts >= ? AND ts < ? AND result NOT IN ('LIMIT_USER', 'CAPACITY_FULL', 'WAITLIST', 'BANNED', 'ALREADY_WAITLIST')",
+            (str(user_id), day_start, day_end)
+        )
+        return cur.fetchone()[0]
     finally:
         conn.close()
 
 
+# consultas válidas del día por usuario, incluidas las que aún esperan en la cola del writer
+_usage_lock = threading.Lock()
+_usage_today = {}  # (inicio del día en ms, user_id) -> consultas
+
+
+def requests_today(user_id: str) -> int:
+    """Como `count_requests_today`, pero desde el contador en memoria (un COUNT por usuario y día)."""
+    day_start, _ = _day_range_ms()
+    key = (day_start, str(user_id))
+    with _usage_lock:
+        n = _usage_today.get(key)
+    if n is not None:
+        return n
+    n = count_requests_today(user_id)
+    with _usage_lock:
+        for old in [k for k in _usage_today if k[0] != day_start]:
+            del _usage_today[old]
+        return _usage_today.setdefault(key, n)
+
+
+def reserve_request(user_id: str) -> int:
+    """Suma al contador la consulta que se va a ejecutar, antes de encolar su log. Retorna el total del día."""
+    requests_today(user_id)
+    day_start, _ = _day_range_ms()
+    key = (day_start, str(user_id))
+    with _usage_lock:
+        _usage_today[key] = _usage_today.get(key, 0) + 1
+        return _usage_today[key]
+
+
 def is_blacklisted(user_id: str) -> bool:
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
@@ -234,13 +294,11 @@ def check_daily_limits(user_id: str, max_users: int = 30, max_requests_per_user:
     conn = sqlite3.connect(DB_PATH)
     cur = conn.cursor()
     today_prefix = datetime.now(timezone.utc).isoformat()[:10]
+    day_start, day_end = _day_range_ms()
 
     try:
-        cur.execute(
-            "SELECT COUNT(*) FROM bot_usage_logs WHERE user_id = ? AND timestamp LIKE ? AND result NOT IN ('LIMIT_USER', 'CAPACITY_FULL', 'WAITLIST', 'BANNED', 'ALREADY_WAITLIST')",
-            (str(user_id), f"{today_prefix}%")
-        )
-        user_reqs = cur.fetchone()[0]
+        # el log de uso es write-behind: el contador en memoria incluye lo aún no confirmado
+        user_reqs = requests_today(user_id)
 
         # 1. Ya alcanzó sus consultas máximas
         if user_reqs >= max_requests_per_user:
@@ -262,14 +320,19 @@ def check_daily_limits(user_id: str, max_users: int = 30, max_requests_per_user:
         cur.execute('''
             SELECT user_id, COUNT(*) as reqs
             FROM bot_usage_logs
-            WHERE timestamp LIKE ? AND result NOT IN ('LIMIT_USER', 'CAPACITY_FULL', 'WAITLIST', 'BANNED', 'ALREADY_WAITLIST')
+            WHERE ts >= ? AND ts < ? AND result NOT IN ('LIMIT_USER', 'CAPACITY_FULL', 'WAITLIST', 'BANNED', 'ALREADY_WAITLIST')
             GROUP BY user_id
-        ''', (f"{today_prefix}%",))
-        rows = cur.fetchall()
-
-        users_in_logs = set(row[0] for row in rows)
+        ''', (day_start, day_end))
+        usage = {str(row[0]): row[1] for row in cur.fetchall()}
+        # más lo que sigue en la cola del writer: el contador en memoria va por delante de la DB
+        with _usage_lock:
+            for (day, uid), n in _usage_today.items():
+                if day == day_start and n > usage.get(uid, 0):
+                    usage[uid] = n
+
+        users_in_logs = set(uid for uid, n in usage.items() if n > 0)
         active_from_logs = sum(
-            1 for row in rows if row[1] < max_requests_per_user)
+            1 for n in usage.values() if 0 < n < max_requests_per_user)
 
         # Usuarios promovidos que aún no tiran su primer query valido
         cur.execute(
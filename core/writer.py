@@ -0,0 +1,295 @@
+"""Write-behind batch writer for high-frequency inserts.
+
+A single background thread owns the SQLite write connections. Callers enqueue
+`(db_path, sql, params)` and return immediately; the thread groups consecutive
+rows of the same statement and flushes them with `executemany` inside one
+transaction every `flush_ms` milliseconds or as soon as `max_rows` rows are
+pending. Queue order is preserved across statements.
+
+When the writer is not running (scripts, tests, bot-only processes) `execute`
+falls back to a synchronous insert so callers never need to care.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core import app_config
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class BatchWriter:
+    def __init__(self, flush_ms: int = 250, max_rows: int = 500):
+        self.flush_ms = max(1, int(flush_ms))
+        self.max_rows = max(1, int(max_rows))
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._conns: Dict[str, sqlite3.Connection] = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'rows_written': 0,
+            'flushes': 0,
+            'errors': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+        }
+
+    # -- public API -------------------------------------------------------
+    def start(self):
+        if self._thread:
+            return
+        t = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        t.start()
+        self._thread = t
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, db_path, sql: str, params: Sequence[Any] = ()):
+        self._queue.put((str(db_path), sql, tuple(params)))
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Block until everything queued before this call is committed."""
+        thread = self._thread
+        if thread is None or not thread.is_alive():
+            return False
+        done = threading.Event()
+        self._queue.put(done)
+        deadline = time.monotonic() + timeout
+        while not done.wait(min(0.05, max(0.0, deadline - time.monotonic()))):
+            # el hilo terminó (stop) sin llegar al marcador: no esperar el timeout completo
+            if not thread.is_alive() or time.monotonic() >= deadline:
+                return done.is_set()
+        return True
+
+    def stop(self, timeout: float = 10.0) -> bool:
+        """Durable shutdown: drain the queue, commit and close connections.
+
+        Returns False if the thread is still draining after `timeout`; it then stays
+        `running()` so callers keep queueing instead of writing alongside it.
+        """
+        if not self._thread:
+            return True
+        self._queue.put(_STOP)
+        self._thread.join(timeout=timeout)
+        if self._thread.is_alive():
+            return False
+        self._thread = None
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        flushes = out.pop('total_flush_ms')
+        out['avg_flush_ms'] = (flushes / out['flushes']) if out['flushes'] else 0.0
+        out['queue_depth'] = self.queue_depth()
+        return out
+
+    # -- worker thread ----------------------------------------------------
+    def _run(self):
+        batch = []
+        first_at = None
+        flush_s = self.flush_ms / 1000.0
+        while True:
+            if batch:
+                timeout = max(0.0, first_at + flush_s - time.monotonic())
+            else:
+                timeout = None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP or isinstance(item, threading.Event):
+                markers = [] if item is _STOP else [item]
+                stop = item is _STOP or self._drain_into(batch, markers)
+                if stop:
+                    # lo encolado después de _STOP (p. ej. un flush() concurrente) también se atiende
+                    self._drain_into(batch, markers)
+                self._flush(batch)
+                batch, first_at = [], None
+                for m in markers:
+                    m.set()
+                if stop:
+                    self._close()
+                    return
+                continue
+            if item is not None:
+                if not batch:
+                    first_at = time.monotonic()
+                batch.append(item)
+
+            if batch and (len(batch) >= self.max_rows or time.monotonic() - first_at >= flush_s):
+                self._flush(batch)
+                batch, first_at = [], None
+
+    def _drain_into(self, batch, markers) -> bool:
+        """Pull whatever is already queued. Markers are collected to be set after the flush
+        (everything queued before them is in `batch`); returns True if `_STOP` was seen."""
+        stop = False
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return stop
+            if item is _STOP:
+                stop = True
+            elif isinstance(item, threading.Event):
+                markers.append(item)
+            else:
+                batch.append(item)
+
+    def _conn(self, db_path: str) -> sqlite3.Connection:
+        conn = self._conns.get(db_path)
+        if conn is None:
+            conn = sqlite3.connect(db_path, timeout=30)
+            self._conns[db_path] = conn
+        return conn
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        # per db, runs of consecutive rows with the same statement: queue order is kept
+        grouped: Dict[str, List[Tuple[str, list]]] = {}
+        for db_path, sql, params in batch:
+            runs = grouped.setdefault(db_path, [])
+            if runs and runs[-1][0] == sql:
+                runs[-1][1].append(params)
+            else:
+                runs.append((sql, [params]))
+
+        written = 0
+        errors = 0
+        for db_path, statements in grouped.items():
+            conn = self._conn(db_path)
+            try:
+                with conn:
+                    for sql, rows in statements:
+                        conn.executemany(sql, rows)
+                        written += len(rows)
+            except Exception as e:
+                logger.error(f"BatchWriter: error en flush ({db_path}): {e}; reintentando fila a fila")
+                w, errs = self._flush_row_by_row(conn, statements)
+                written += w
+                errors += errs
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._stats_lock:
+            self._stats['rows_written'] += written
+            self._stats['errors'] += errors
+            self._stats['flushes'] += 1
+            self._stats['last_flush_ms'] = elapsed_ms
+            self._stats['total_flush_ms'] += elapsed_ms
+            if elapsed_ms > self._stats['max_flush_ms']:
+                self._stats['max_flush_ms'] = elapsed_ms
+
+    def _flush_row_by_row(self, conn, statements):
+        written = 0
+        errors = 0
+        for sql, rows in statements:
+            for params in rows:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    written += 1
+                except Exception as e:
+                    errors += 1
+                    logger.error(f"BatchWriter: fila descartada ({sql[:60]}...): {e}")
+        return written, errors
+
+    def _close(self):
+        for conn in self._conns.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._conns = {}
+
+
+_GLOBAL_WRITER: Optional[BatchWriter] = None
+
+
+def start_writer(flush_ms: int = None, max_rows: int = None) -> BatchWriter:
+    global _GLOBAL_WRITER
+    if _GLOBAL_WRITER is None:
+        _GLOBAL_WRITER = BatchWriter(
+            flush_ms=flush_ms or app_config.WRITER_FLUSH_MS,
+            max_rows=max_rows or app_config.WRITER_MAX_ROWS,
+        )
+        _GLOBAL_WRITER.start()
+    return _GLOBAL_WRITER
+
+
+def get_writer() -> Optional[BatchWriter]:
+    if _GLOBAL_WRITER is not None and _GLOBAL_WRITER.running():
+        return _GLOBAL_WRITER
+    return None
+
+
+def stop_writer():
+    global _GLOBAL_WRITER
+    if _GLOBAL_WRITER is not None:
+        try:
+            stats = _GLOBAL_WRITER.stats()
+            if not _GLOBAL_WRITER.stop():
+                # sigue vaciando la cola: se conserva para que nadie escriba en paralelo
+                logger.warning("BatchWriter: el hilo sigue vaciando la cola tras el timeout de stop")
+                return
+            logger.info(
+                "BatchWriter detenido: %s filas en %s flushes (avg %.1f ms, max %.1f ms)",
+                stats['rows_written'], stats['flushes'], stats['avg_flush_ms'], stats['max_flush_ms'])
+        except Exception:
+            pass
+        _GLOBAL_WRITER = None
+
+
+def get_stats() -> Dict[str, Any]:
+    """Queue depth and flush latency of the global writer (empty if stopped)."""
+    w = get_writer()
+    return w.stats() if w else {}
+
+
+def execute(db_path, sql: str, params: Sequence[Any] = ()):
+    """Enqueue a write on the global writer, or run it synchronously if stopped."""
+    w = get_writer()
+    if w is not None:
+        w.submit(db_path, sql, params)
+        return
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute(sql, tuple(params))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def execute_many(db_path, sql: str, rows: Sequence[Sequence[Any]]):
+    """Like `execute` for many rows; the synchronous fallback uses one `executemany` transaction."""
+    w = get_writer()
+    if w is not None:
+        for params in rows:
+            w.submit(db_path, sql, params)
+        return
+    if not rows:
+        return
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            conn.executemany(sql, [tuple(p) for p in rows])
+    finally:
+        conn.close()
+
+
+def flush(timeout: float = 5.0) -> bool:
+    w = get_writer()
+    return w.flush(timeout) if w else True
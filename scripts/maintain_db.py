@@ -7,9 +7,108 @@ from core.user_db import init_user_db, DB_PATH as USER_DB_PATH
 logging.basicConfig(level=logging.INFO, format="%(asctime)s | %(levelname)s | %(message)s")
 logger = logging.getLogger(__name__)
 
+def _iso_to_ms(value):
+    from core.db import to_ms
+    try:
+        return to_ms(value)
+    except Exception:
+        return 0
+
+
+def migrate_epoch_timestamps(db_path=None) -> int:
+    """Convierte las columnas de tiempo ISO TEXT a epoch-ms INTEGER.
+
+    Recorre las tablas base y sus particiones diarias: elimina los índices sobre la
+    columna antigua, añade la nueva, copia los valores convertidos y borra la antigua.
+    Los índices compuestos nuevos los crean `init_db`/`init_user_db`. Retorna tablas migradas.
+    """
+    from core import db, partitions
+
+    path = Path(db_path or db.DB_PATH)
+    if not path.exists():
+        return 0
+    conn = sqlite3.connect(path)
+    conn.create_function("iso_to_ms", 1, _iso_to_ms, deterministic=True)
+    migrated = 0
+    try:
+        for table, old, new in db.LEGACY_TIME_COLUMNS:
+            targets = [table]
+            if table in partitions.PARTITIONED:
+                targets += [name for _, name in partitions.list_partitions(conn, table)]
+            for t in targets:
+                cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{t}")')]
+                if old not in cols or new in cols:
+                    continue
+                logger.info(f"Migración: {t}.{old} (ISO) -> {t}.{new} (epoch ms)...")
+                with conn:
+                    for idx in conn.execute(f'PRAGMA index_list("{t}")').fetchall():
+                        idx_name, origin = idx[1], idx[3]
+                        idx_cols = [r[2] for r in conn.execute(f'PRAGMA index_info("{idx_name}")')]
+                        if origin == 'c' and old in idx_cols:
+                            conn.execute(f'DROP INDEX "{idx_name}"')
+                    conn.execute(f'ALTER TABLE "{t}" ADD COLUMN {new} INTEGER NOT NULL DEFAULT 0')
+                    conn.execute(f'UPDATE "{t}" SET {new} = iso_to_ms({old})')
+                    conn.execute(f'ALTER TABLE "{t}" DROP COLUMN {old}')
+                    if t != table:
+                        partitions.ensure_indexes(conn, table, t)
+                migrated += 1
+    finally:
+        conn.close()
+    return migrated
+
+
+def migrate_aggregated_resolution(db_path=None, resolution: int = 600) -> int:
+    """Añade `resolution` a aggregated_prices y deja un único bucket alineado por clave.
+
+    Los `bucket_ts` antiguos se bajan al múltiplo de `resolution` y, de las filas que
+    coinciden en (pair, bucket_ts), se conserva la más reciente (mayor id). El índice
+    único lo crea `init_db`. Retorna las filas duplicadas eliminadas.
+    """
+    from core import db
+
+    path = Path(db_path or db.DB_PATH)
+    if not path.exists():
+        return 0
+    conn = sqlite3.connect(path)
+    try:
+        cols = [r[1] for r in conn.execute("PRAGMA table_info(aggregated_prices)")]
+        if not cols or "resolution" in cols or "bucket_ts" not in cols:
+            return 0
+        logger.info("Migración: aggregated_prices.resolution + buckets alineados y únicos...")
+        step = resolution * 1000
+        with conn:
+            conn.execute(f"ALTER TABLE aggregated_prices ADD COLUMN resolution INTEGER NOT NULL DEFAULT {int(resolution)}")
+            conn.execute("UPDATE aggregated_prices SET bucket_ts = bucket_ts - (bucket_ts % ?)", (step,))
+            removed = conn.execute("""
+                DELETE FROM aggregated_prices WHERE id NOT IN (
+                    SELECT MAX(id) FROM aggregated_prices GROUP BY pair, resolution, bucket_ts)
+            """).rowcount
+    finally:
+        conn.close()
+    return removed
+
+
 def check_migrations():
     """Realiza verificaciones de integridad y migraciones pendientes."""
     logger.info("Verificando integridad de base de datos...")
+
+    # Migración: timestamps ISO TEXT -> epoch ms (antes de crear los índices nuevos)
+    try:
+        n = migrate_epoch_timestamps()
+        if n:
+            logger.info(f"Migración: {n} tablas convertidas a timestamps epoch-ms.")
+    except Exception as e:
+        logger.error(f"Error migrando timestamps: {e}")
+        raise
+
+    # Migración: buckets agregados únicos por (pair, resolution, bucket_ts)
+    try:
+        removed = migrate_aggregated_resolution()
+        if removed:
+            logger.info(f"Migración: {removed} buckets agregados duplicados eliminados.")
+    except Exception as e:
+        logger.error(f"Error migrando aggregated_prices: {e}")
+        raise
     
     # Asegurar que las tablas base existen
     init_db()
@@ -34,6 +133,15 @@ def check_migrations():
     finally:
         conn.close()
 
+    # Migración: mover raw_responses (JSON) al archivo compacto
+    try:
+        from core import raw_archive
+        moved = raw_archive.migrate_legacy_raw_responses()
+        if moved:
+            logger.info(f"Migración: {moved} respuestas crudas movidas a raw_archive_blocks.")
+    except Exception as e:
+        logger.error(f"Error migrando raw_responses: {e}")
+
     logger.info("Base de datos lista para operar.")
 
 if __name__ == "__main__":
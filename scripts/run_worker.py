@@ -5,7 +5,7 @@ import time
 from typing import Optional
 from core.scheduler import start_scheduler
 from core.app_config import CONFIG
-from core import ram_window, aggregator
+from core import ram_window, aggregator, writer, pipeline
 from adapters import binance_p2p
 
 logger = logging.getLogger(__name__)
@@ -47,6 +47,12 @@ def _ingest_loop(window: ram_window.RamWindow, stop_event: threading.Event, inte
                         window.append_snapshot(pair, ads, exchange=ex_name)
                     except Exception as e:
                         logger.error(f"Error ingestando {pair} desde {ex_name}: {e}")
+
+            # precalcula la estructura de /tasa, /cop, /ves y /arbitraje para los snapshots nuevos
+            try:
+                pipeline.build_data_from_ram(CONFIG)
+            except Exception as e:
+                logger.warning("Error precalculando datos de RAM: %s", e)
                         
         except Exception as e:
             logger.exception("Error en ingest loop: %s", e)
@@ -64,9 +70,12 @@ def start_worker(fetch_interval: int = 300, snapshot_interval: int = 600, ingest
     db.init_db()
     if _sched is not None:
         return
-    _sched = start_scheduler(
-        CONFIG, fetch_interval=fetch_interval, snapshot_interval=snapshot_interval)
+    # Escritor write-behind: los inserts de ingest/detectores/bot no esperan fsync
+    writer.start_writer()
+    _sched = start_scheduler(CONFIG, fetch_interval=fetch_interval)
     _window = ram_window.init_global(window_seconds=6 * 3600)
+    # resúmenes de la tabla `snapshots`, escritos desde la ingesta a este ritmo
+    _window.summaries.interval_seconds = snapshot_interval
     aggregator.start_aggregator(_window, bucket_seconds=600)
 
     _ingest_stop_event.clear()
@@ -76,7 +85,7 @@ def start_worker(fetch_interval: int = 300, snapshot_interval: int = 600, ingest
 
 
 def stop_worker():
-    """Stop ingest, aggregator, ram window and scheduler."""
+    """Stop ingest, aggregator, ram window and scheduler, then flush pending writes."""
     global _ingest_thread, _ingest_stop_event, _sched, _window
     try:
         if _ingest_stop_event is not None:
@@ -101,6 +110,22 @@ def stop_worker():
             _sched.shutdown()
     except Exception as e:
         logger.warning("Error shutting down scheduler: %s", e)
+    try:
+        # scores en memoria pendientes de volcar a merchant_registry
+        from core import merchant_scores
+        merchant_scores.flush_registry(force=True)
+    except Exception as e:
+        logger.warning("Error flushing merchant scores: %s", e)
+    try:
+        from core.merchant_stats import store_hourly_merchant_stats
+        store_hourly_merchant_stats()
+    except Exception as e:
+        logger.warning("Error flushing merchant stats: %s", e)
+    try:
+        # último: drena la cola y hace commit de todo lo pendiente
+        writer.stop_writer()
+    except Exception as e:
+        logger.warning("Error stopping batch writer: %s", e)
     _ingest_thread = None
     _sched = None
     _window = None
@@ -0,0 +1,128 @@
+"""Caché de respuestas de los comandos analíticos (/spread, /depth, /volume, /volatilidad, /merchant).
+
+La clave es (comando, args normalizados, par, versión del par en la ventana RAM): la respuesta
+solo cambia cuando llega un snapshot nuevo del par, así que las consultas repetidas dentro del
+mismo minuto (usuarios y tareas /auto) comparten el texto ya formateado.
+
+- Un snapshot nuevo del par invalida sus entradas (se purgan al ver la versión nueva).
+- Pares sin snapshots en la ventana no se cachean: su respuesta viene de la DB y no hay versión.
+- LRU acotada a `maxsize` entradas.
+- Single-flight: peticiones idénticas concurrentes esperan al primer cálculo.
+"""
+import functools
+import threading
+from collections import OrderedDict
+from typing import Callable, List
+
+from core.ram_window import get_global
+
+DEFAULT_MAXSIZE = 512
+
+
+class ResponseCache:
+    def __init__(self, maxsize: int = DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._inflight = {}
+        # pair -> última versión vista (para purgar las entradas viejas del par)
+        self._versions = {}
+        self.hits = 0
+        self.misses = 0
+        self.joined = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(command: str, args: List[str], pair: str, version) -> tuple:
+        norm = tuple(a.strip().lower() for a in (args or []) if a.strip())
+        return (command, norm, pair.upper(), version)
+
+    def _purge_pair(self, pair: str, version):
+        """Descarta las entradas de `pair` de versiones anteriores (con el lock tomado)."""
+        current = self._versions.get(pair)
+        if current is not None and version <= current:
+            return  # misma versión o petición de un snapshot ya superado
+        self._versions[pair] = version
+        stale = [k for k in self._entries if k[2] == pair and k[3] != version]
+        for k in stale:
+            del self._entries[k]
+        self.evictions += len(stale)
+
+    def get(self, key: tuple, compute: Callable[[], str]) -> str:
+        with self._lock:
+            self._purge_pair(key[2], key[3])
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            done = self._inflight.get(key)
+            leader = done is None
+            if leader:
+                done = self._inflight[key] = threading.Event()
+                self.misses += 1
+            else:
+                self.joined += 1
+        if not leader:
+            done.wait()
+            with self._lock:
+                if key in self._entries:
+                    return self._entries[key]
+            # el cálculo del otro hilo falló: reintentar por cuenta propia
+            return compute()
+        try:
+            value = compute()
+            with self._lock:
+                # no guardar si mientras tanto llegó un snapshot más nuevo del par
+                if self._versions.get(key[2]) == key[3]:
+                    self._entries[key] = value
+                    while len(self._entries) > self.maxsize:
+                        self._entries.popitem(last=False)
+                        self.evictions += 1
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            done.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            served = self.hits + self.joined
+            total = served + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'joined': self.joined,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'hit_rate': served / total if total else 0.0,
+            }
+
+
+RESPONSES = ResponseCache()
+
+
+def cached(command: str, handler: Callable[[List[str], str], str], cache: ResponseCache = None):
+    """Envuelve un handler `(args, pair) -> str` con la caché de respuestas.
+
+    Sin ventana RAM, o si el par aún no tiene snapshots en ella (los handlers leen la DB),
+    no hay versión con qué invalidar: se llama al handler directamente.
+    """
+    @functools.wraps(handler)
+    def wrapper(args: List[str], pair: str = 'USDT-COP') -> str:
+        c = cache or RESPONSES
+        rw = get_global()
+        if not rw:
+            return handler(args, pair)
+        with rw.lock:
+            seq = rw.versions.get(pair)
+        if seq is None:
+            return handler(args, pair)
+        version = (id(rw), seq)
+        return c.get(ResponseCache.key(command, args, pair, version), lambda: handler(args, pair))
+
+    return wrapper
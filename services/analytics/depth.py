@@ -1,63 +1,95 @@
-from typing import List, Tuple
-from statistics import mean
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from core.book import BookView
 from core.ram_window import get_global
 from core.processor import format_num, format_vol, ai_meta
 from core import app_config
 
 
+DEFAULT_AMOUNTS = (1000, 5000, 10000, 50000)
+
+
+def _parse_args(args: List[str]) -> Tuple[bool, Optional[str], List[float]]:
+    """(muro, banco, montos): los números son montos en USDT (ej. 23750, 23,750 o 5k)."""
+    muro, bank, amounts = False, None, []
+    for raw in args:
+        tok = raw.lower().strip().replace(',', '').replace('$', '')
+        mult = 1000 if tok.endswith('k') else 1
+        try:
+            amounts.append(float(tok[:-1] if mult > 1 else tok) * mult)
+            continue
+        except ValueError:
+            pass
+        if tok == 'muro':
+            muro = True
+        elif tok:
+            bank = tok
+    return muro, bank, amounts
+
+
+def find_walls(book: BookView, side: str) -> List[Tuple[int, object]]:
+    """Posiciones (1-based) del top 50 con volumen >= umbral fijo o >= multiplicador x media del top 10."""
+    cfg = app_config.DETECTORS.get('depth', {})
+    min_wall = cfg.get('wall_threshold_usdt', 25000.0)
+    multiplier = cfg.get('wall_multiplier', 3.0)
+
+    qty = book.qty_of(side)
+    if not len(qty):
+        return []
+    avg_vol_top10 = float(qty[:10].mean()) if len(qty) >= 5 else 1000
+    top = qty[:50]
+    ads = book.side(side)
+    return [(int(i) + 1, ads[i]) for i in np.flatnonzero((top >= min_wall) | (top >= avg_vol_top10 * multiplier))]
+
+
+def slippage_table(book: BookView, side: str, amounts) -> List[str]:
+    """Filas de la tabla Monto / Precio efectivo / Slippage para todos los montos en una llamada."""
+    avg, slip = book.fill(side, amounts)
+    rows = []
+    for amt, p, sl in zip(amounts, avg, slip):
+        if p == p:
+            rows.append(f"<code>{amt:>5.0f}$   {format_num(float(p), 0):>11}   {sl:>7.2f}%</code>")
+        else:
+            rows.append(f"<code>{amt:>5.0f}$   Sin liq. (Max: {book.depth_of(side):,.0f})</code>")
+    return rows
+
+
 def handle_depth(args: List[str], pair: str = 'USDT-COP') -> str:
-    """Análisis de profundidad de mercado, deslizamiento y muros de liquidez."""
+    """Análisis de profundidad de mercado, deslizamiento y muros de liquidez.
+
+    - /depth               : slippage para 1k, 5k, 10k y 50k USDT
+    - /depth 23750 [...]   : slippage para los montos indicados
+    - /depth <banco>       : lo mismo con solo los anuncios del banco
+    - /depth muro          : muros de liquidez
+    """
     rw = get_global()
     if not rw:
         return "⚠️ RAM no inicializada. Inicia el worker."
 
-    token = args[0].lower() if args else ""
-    bank_filter = token if token and token != 'muro' else None
+    muro, bank_filter, amounts = _parse_args(args)
 
     with rw.lock:
         dq = rw.pair_index.get(pair)
         if not dq:
             return f"⚠️ No hay datos para {pair}"
-
         snap = dq[-1]
-        
-        # Aplicar filtro de banco si existe
-        if bank_filter:
-            filtered_ads = [a for a in snap.ads if bank_filter in (a.payment_method or '').lower()]
-            if not filtered_ads:
-                return f"⚠️ No hay anuncios activos para el banco: <b>{bank_filter.upper()}</b> en {pair}"
-            target_ads = filtered_ads
-        else:
-            target_ads = snap.ads
-
-        # BUY: Ascendente (quien menos paga a quien más paga)
-        buys = sorted([a for a in target_ads if a.side == 'buy'],
-                      key=lambda a: a.price)
-        # SELL: Descendente (quien más cobra a quien menos cobra)
-        sells = sorted([a for a in target_ads if a.side == 'sell'],
-                       key=lambda a: a.price, reverse=True)
-
-    def find_walls(ads, side):
-        cfg = app_config.DETECTORS.get('depth', {})
-        min_wall = cfg.get('wall_threshold_usdt', 25000.0)
-        multiplier = cfg.get('wall_multiplier', 3.0)
-        
-        if not ads: return []
-        
-        avg_vol_top10 = mean([a.quantity for a in ads[:10]]) if len(ads) >= 5 else 1000
-        walls = []
-        for i, ad in enumerate(ads[:50]): # Buscamos en el top 50
-            if ad.quantity >= min_wall or ad.quantity >= (avg_vol_top10 * multiplier):
-                walls.append((i+1, ad))
-        return walls
+
+    book = snap.book
+    # Aplicar filtro de banco si existe (vista memoizada por snapshot)
+    if bank_filter:
+        book = book.for_bank(bank_filter)
+        if not book.asks and not book.bids:
+            return f"⚠️ No hay anuncios activos para el banco: <b>{bank_filter.upper()}</b> en {pair}"
 
     # Caso específico de solo muros
-    if token == 'muro':
-        buy_walls = find_walls(buys, 'buy')
-        sell_walls = find_walls(sells, 'sell')
-        
+    if muro:
+        buy_walls = find_walls(book, 'buy')
+        sell_walls = find_walls(book, 'sell')
+
         lines = [f"🧱 <b>MUROS DE LIQUIDEZ DETECTADOS</b> ({pair})", ""]
-        
+
         if not buy_walls and not sell_walls:
             return f"✅ No se detectan muros de liquidez significativos en {pair} (Top 50)."
 
@@ -71,63 +103,28 @@ def handle_depth(args: List[str], pair: str = 'USDT-COP') -> str:
             lines.append("🔴 <b>Muros en Venta (Resistencias):</b>")
             for pos, ad in sell_walls:
                 lines.append(f"• Pos #{pos}: <b>{format_vol(ad.quantity)} USDT</b> a {format_num(ad.price)}")
-        
+
         return "\n".join(lines)
 
-    # Caso estándar con Slippage y Muros resumidos
-    def calculate_slippage(ads, target_usdt):
-        total_vol = 0
-        total_cost = 0
-        if not ads:
-            return None, 0
-
-        # Para el slippage necesitamos el orden inverso (los mejores precios primero para el usuario)
-        # Usuario compra -> ve SELL ads (el mas barato primero)
-        # Usuario vende -> ve BUY ads (el que mas paga primero)
-        effective_ads = sorted(ads, key=lambda a: a.price, reverse=(ads[0].side == 'buy'))
-        
-        for ad in effective_ads:
-            if total_vol >= target_usdt:
-                break
-            qty = min(ad.quantity, target_usdt - total_vol)
-            total_vol += qty
-            total_cost += qty * ad.price
-
-        if total_vol < target_usdt:
-            return None, total_vol
-        avg_price = total_cost / total_vol
-        top1_price = effective_ads[0].price
-        slippage = abs((avg_price / top1_price - 1) * 100)
-        return avg_price, slippage
-
-    amounts = [1000, 5000, 10000, 50000]
+    # Caso estándar con Slippage y Muros resumidos.
+    # Usuario vende USDT -> toma los bids ('sell', el que más paga primero);
+    # usuario compra USDT -> toma los asks ('buy', el más barato primero).
+    amounts = amounts or list(DEFAULT_AMOUNTS)
     lines = [
         f"🌊 <b>PROFUNDIDAD Y SLIPPAGE</b> ({pair})",
         "",
         "<b>Liquidando USDT (Venta):</b>",
         "<code>Monto     Precio Eff   Slippage</code>"
     ]
-
-    for amt in amounts:
-        avg_p, slip = calculate_slippage(buys, amt)
-        if avg_p:
-            lines.append(f"<code>{amt:>5}$   {format_num(avg_p, 0):>11}   {slip:>7.2f}%</code>")
-        else:
-            lines.append(f"<code>{amt:>5}$   Sin liq. (Max: {slip:,.0f})</code>")
+    lines.extend(slippage_table(book, 'sell', amounts))
 
     lines.append("\n<b>Obteniendo USDT (Compra):</b>")
     lines.append("<code>Monto     Precio Eff   Slippage</code>")
-
-    for amt in amounts:
-        avg_p, slip = calculate_slippage(sells, amt)
-        if avg_p:
-            lines.append(f"<code>{amt:>5}$   {format_num(avg_p, 0):>11}   {slip:>7.2f}%</code>")
-        else:
-            lines.append(f"<code>{amt:>5}$   Sin liq. (Max: {slip:,.0f})</code>")
+    lines.extend(slippage_table(book, 'buy', amounts))
 
     # Resumen de muros
-    buy_walls = find_walls(buys, 'buy')
-    sell_walls = find_walls(sells, 'sell')
+    buy_walls = find_walls(book, 'buy')
+    sell_walls = find_walls(book, 'sell')
     if buy_walls or sell_walls:
         lines.append("\n🧱 <b>Muros detectados:</b>")
         if buy_walls: lines.append(f"• {len(buy_walls)} Soportes (BUY)")
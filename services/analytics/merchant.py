@@ -1,13 +1,13 @@
 from datetime import datetime, timezone, timedelta
 from statistics import mean, pstdev
 from typing import List, Dict, Optional, Tuple
-from collections import defaultdict
 import sqlite3
 
 from core.ram_window import get_global
 from core.db import DB_PATH
 from core.processor import format_num, format_vol, ai_meta
 from core.detectors.merchant_intel import calculate_automation_score
+from core.merchant_scores import get_profile
 
 
 def _cutoff(seconds: int = 3600):
@@ -151,45 +151,13 @@ def _search_merchants(query: str, limit: int = 10) -> List[str]:
 
 
 def _top_merchants(pair: str, side: Optional[str] = None, limit: int = 10) -> List[Tuple]:
+    """Top por volumen visible del par en la última hora (ranking mantenido al ingerir)."""
     rw = get_global()
     if not rw:
         return []
 
-    cutoff = _cutoff(3600)
-    merchant_stats = defaultdict(
-        lambda: {'vol_usdt': 0.0, 'sum_price': 0.0, 'count': 0, 'side': None})
-
     with rw.lock:
-        for merchant, ads_list in rw.merchant_index.items():
-            for ts, ad in ads_list:
-                if ts < cutoff:
-                    continue
-
-                if side and ad.side != side:
-                    continue
-
-                usdt_volume = ad.quantity
-
-                stats = merchant_stats[merchant]
-                stats['vol_usdt'] += usdt_volume
-                stats['sum_price'] += ad.price
-                stats['count'] += 1
-                stats['side'] = ad.side
-
-    results = []
-    for merchant, stats in merchant_stats.items():
-        if stats['count'] > 0:
-            avg_price = stats['sum_price'] / stats['count']
-            results.append((
-                merchant,
-                stats['vol_usdt'],
-                avg_price,
-                stats['side'],
-                stats['count']
-            ))
-
-    results.sort(key=lambda x: x[1], reverse=True)
-    return results[:limit]
+        return rw.leaderboards.top_volume(pair, side=side, limit=limit)
 
 
 def _format_merchant_list(merchants: List[Tuple], title: str, side_desc: str = "") -> str:
@@ -269,6 +237,8 @@ def _build_merchant_profile(name: str, pair: str) -> str:
     m_id = row[0] if row else None
     intel = calculate_automation_score(m_id) if m_id else {'score': 0, 'classification': 'N/D', 'metrics': {}}
     
+    life = rw.ad_tracker.merchant_stats(m_id or name, seconds=24 * 3600)
+
     # 2. Cálculos base
     avg_price = mean(prices) if prices else 0
     price_std = pstdev(prices) if len(prices) > 1 else 0
@@ -308,6 +278,14 @@ def _build_merchant_profile(name: str, pair: str) -> str:
         f"• Frecuencia: {intel['metrics'].get('changes_24h', 0)} cambios",
         f"• Persistencia Top 3: {intel['metrics'].get('persistence_top3_pct', 0)}%",
         "",
+        "♻️ <b>Ciclo de vida de anuncios (24h)</b>",
+        f"• Repricing: {life['reprices']} cambios"
+        + (f" (cada {life['avg_reprice_interval_s']:.0f}s)" if life['avg_reprice_interval_s'] else ""),
+        f"• Relists: {life['relists']}"
+        + (f" (latencia media {life['avg_relist_latency_s']:.0f}s)" if life['avg_relist_latency_s'] else ""),
+        f"• Vida media de un anuncio: "
+        + (f"{life['avg_ad_lifetime_s'] / 60:.0f} min" if life['avg_ad_lifetime_s'] else "N/D"),
+        "",
         "📊 <b>Actividad (última hora)</b>",
         f"• Anuncios publicados (1h): {count}",
         f"• Volumen total: <b>{format_vol(vol)} USDT</b>",
@@ -323,7 +301,10 @@ def _build_merchant_profile(name: str, pair: str) -> str:
         "volume_1h": vol,
         "ad_count_1h": count,
         "avg_price": avg_price,
-        "activity_score": activity_score
+        "activity_score": activity_score,
+        "reprices_24h": life['reprices'],
+        "relists_24h": life['relists'],
+        "avg_relist_latency_s": life['avg_relist_latency_s'],
     }
 
     with rw.lock:
@@ -389,22 +370,35 @@ def handle_merchant(args: List[str], pair: str = 'USDT-COP') -> str:
     # CASO 4: Deteccion de bots
     # ===========================================
     if token == 'bots':
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cur = conn.cursor()
-        
-        # Obtener los top bots segun score y actividad reciente
-        cur.execute(
-            """
-            SELECT nickname, automation_score, classification 
-            FROM merchant_registry 
-            WHERE automation_score > 60 OR classification = 'BOT/ALGORITMO'
-            ORDER BY automation_score DESC 
-            LIMIT 10
-            """
-        )
-        suspects = cur.fetchall()
-        conn.close()
+        profile = get_profile()
+        suspects = []
+        rw = get_global()
+        if rw:
+            # ranking del par por score del motor en memoria (worker en este proceso)
+            with rw.lock:
+                ranked = rw.leaderboards.top_automation(pair, limit=10, min_score=profile.active_threshold)
+            suspects = [{'nickname': m, 'automation_score': score,
+                         'classification': "BOT/ALGORITMO" if score > profile.bot_threshold else "ACTIVO"}
+                        for m, _, score in ranked]
+
+        if not suspects:
+            conn = sqlite3.connect(DB_PATH)
+            conn.row_factory = sqlite3.Row
+            cur = conn.cursor()
+
+            # Scores precalculados por el re-scoring por lotes (merchant_scores.rescore_all)
+            cur.execute(
+                """
+                SELECT nickname, automation_score, classification 
+                FROM merchant_registry 
+                WHERE automation_score > ?
+                ORDER BY automation_score DESC 
+                LIMIT 10
+                """,
+                (profile.active_threshold,)
+            )
+            suspects = cur.fetchall()
+            conn.close()
 
         if not suspects:
             return "✅ No se han detectado merchants con comportamiento algorítmico significativo en el historial."
@@ -419,7 +413,7 @@ def handle_merchant(args: List[str], pair: str = 'USDT-COP') -> str:
             cl = s['classification']
             lines.append(f"<code>{i:2d}  @{name:<10}  {score:>5.1f}   {cl}</code>")
 
-        lines.append("\n💡 <i>Detección basada en frecuencia de cambios, persistencia en Top y velocidad de relist (7 días).</i>")
+        lines.append("\n💡 <i>Detección basada en frecuencia de cambios, persistencia en Top y velocidad de relist (24h).</i>")
         return "\n".join(lines)
 
     # ===========================================
@@ -430,34 +424,27 @@ def handle_merchant(args: List[str], pair: str = 'USDT-COP') -> str:
         if not rw:
             return "⚠️ RAM no inicializada"
 
-        cutoff = _cutoff(3600)
         bigs = []
-
         with rw.lock:
-            for m, dq in rw.merchant_index.items():
-                vol = 0.0
-                count = 0
-                for ts, ad in dq:
-                    if ts < cutoff:
-                        continue
-                    vol += ad.quantity
-                    count += 1
-
+            # ranking por volumen: se recorre solo hasta juntar 10
+            for m, vol, _, _, count in rw.leaderboards.iter_volume(pair):
                 if vol >= 1000 or count >= 10:
                     bigs.append((m, vol, count))
+                if len(bigs) >= 10:
+                    break
 
         if not bigs:
             return "⚠️ No se encontraron merchants grandes en la última hora."
 
         lines = ["🏦 <b>MERCHANTS DESTACADOS</b>", ""]
-        for m, v, c in sorted(bigs, key=lambda x: x[1], reverse=True)[:10]:
+        for m, v, c in bigs:
             lines.append(
                 f"• <code>@{m:<12}</code>: Vol: <b>{format_vol(v):>8}</b> USDT | Ads: <b>{c:>3}</b>")
 
         meta = {
             "type": "merchant_bigs",
             "count": len(bigs),
-            "top_merchants": [b[0] for b in sorted(bigs, key=lambda x: x[1], reverse=True)[:5]]
+            "top_merchants": [b[0] for b in bigs[:5]]
         }
         return "\n".join(lines) + ai_meta(meta)
 
@@ -486,28 +473,38 @@ def handle_merchant(args: List[str], pair: str = 'USDT-COP') -> str:
     # CASO 8: Merchants estables
     # ===========================================
     if token == 'estables':
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-
-        c.execute("""
-            SELECT 
-                merchant,
-                AVG(avg_price) as precio_promedio,
-                COUNT(DISTINCT hour) as horas_activas,
-                SUM(volume_usdt) as volumen_total,
-                AVG(CASE WHEN side='buy' THEN avg_price ELSE NULL END) as buy_avg,
-                AVG(CASE WHEN side='sell' THEN avg_price ELSE NULL END) as sell_avg,
-                COUNT(*) as muestras
-            FROM merchant_stats
-            WHERE pair = ? AND date = ?
-            GROUP BY merchant
-            HAVING muestras >= 4
-            ORDER BY ABS(COALESCE(buy_avg,0) - COALESCE(sell_avg,0)) ASC
-            LIMIT 10
-        """, (pair, datetime.now(timezone.utc).strftime("%Y-%m-%d")))
+        rows = []
+        rw = get_global()
+        if rw:
+            # ranking del par por spread compra-venta de la última hora
+            with rw.lock:
+                stable = rw.leaderboards.top_stable(pair, limit=10)
+            rows = [(m, vol, spread) for m, spread, vol in stable]
 
-        rows = c.fetchall()
-        conn.close()
+        if not rows:
+            conn = sqlite3.connect(DB_PATH)
+            c = conn.cursor()
+
+            c.execute("""
+                SELECT 
+                    merchant,
+                    AVG(avg_price) as precio_promedio,
+                    COUNT(DISTINCT hour) as horas_activas,
+                    SUM(volume_usdt) as volumen_total,
+                    AVG(CASE WHEN side='buy' THEN avg_price ELSE NULL END) as buy_avg,
+                    AVG(CASE WHEN side='sell' THEN avg_price ELSE NULL END) as sell_avg,
+                    COUNT(*) as muestras
+                FROM merchant_stats
+                WHERE pair = ? AND date = ?
+                GROUP BY merchant
+                HAVING muestras >= 4
+                ORDER BY ABS(COALESCE(buy_avg,0) - COALESCE(sell_avg,0)) ASC
+                LIMIT 10
+            """, (pair, datetime.now(timezone.utc).strftime("%Y-%m-%d")))
+
+            rows = [(r[0], r[3], abs(((r[4] or 0) - (r[5] or 0)) / (r[5] or 1) * 100))
+                    for r in c.fetchall()]
+            conn.close()
 
         if not rows:
             return f"⚠️ No hay suficientes datos de merchants estables para {pair} hoy."
@@ -516,22 +513,21 @@ def handle_merchant(args: List[str], pair: str = 'USDT-COP') -> str:
         lines.append("<code> #  Merchant      Spread   Volumen </code>")
         lines.append("<code>---  ----------  -------  ---------</code>")
 
-        for idx, row in enumerate(rows, 1):
-            merchant = row[0][:10]
-            spread = abs(((row[4] or 0) - (row[5] or 0)) / (row[5] or 1) * 100)
-            volumen = row[3] or 0
+        for idx, (merchant, volumen, spread) in enumerate(rows, 1):
+            merchant = merchant[:10]
+            volumen = volumen or 0
 
             lines.append(
                 f"<code>{idx:2d}  @{merchant:<10}  {spread:>5.2f}%  {format_vol(volumen):>9}</code>"
             )
 
-        lines.append("\n💡 <i>Estables = menor spread promedio hoy</i>")
+        lines.append("\n💡 <i>Estables = menor spread promedio compra/venta</i>")
 
         meta = {
             "type": "merchant_estables",
             "pair": pair,
             "count": len(rows),
-            "best_spread": abs(((rows[0][4] or 0) - (rows[0][5] or 0)) / (rows[0][5] or 1) * 100) if rows else 0
+            "best_spread": rows[0][2] if rows else 0
         }
         return "\n".join(lines) + ai_meta(meta)
 
@@ -2,12 +2,13 @@ from datetime import datetime, timezone, timedelta
 from statistics import mean, pstdev
 from typing import Tuple, List, Optional
 
+import numpy as np
+
 from core.ram_window import get_global
-from core import db as core_db
+from core.series import per_hour, range_volume
+from core import db as core_db, heatmap
 from core.processor import format_num, format_vol, ai_meta
 from types import SimpleNamespace
-from core.app_config import DEFAULT_TZ
-import pytz
 
 
 def _get_latest_snapshot(pair: str):
@@ -30,16 +31,10 @@ def _ordered_lists(snapshot):
     - side='sell' (Tab Venta): Mercaderes COMPRANDO. Tú vendes (Ingreso).
       El mejor es el de MAYOR precio (Descendente).
     """
-    m_sellers = [ad for ad in snapshot.ads if ad.side == 'buy']
-    m_buyers = [ad for ad in snapshot.ads if ad.side == 'sell']
-
-    # Tab Compra: 3676, 3680, 3688...
-    buys_sorted = sorted(m_sellers, key=lambda a: a.price)
-    
-    # Tab Venta: 3685, 3681, 3680...
-    sells_sorted = sorted(m_buyers, key=lambda a: a.price, reverse=True)
-
-    return buys_sorted, sells_sorted
+    # Tab Compra: 3676, 3680, 3688... / Tab Venta: 3685, 3681, 3680...
+    # (ya ordenados una vez en la vista del libro del snapshot)
+    book = snapshot.book
+    return book.asks, book.bids
 
 
 def _spread_from_pair(buy_ad, sell_ad) -> Optional[float]:
@@ -113,36 +108,14 @@ def _format_spread_result(title: str, spreads: List[float], vols: List[float],
     return "\n".join(lines) + ai_meta(meta)
 
 
-def _format_heat_map(pair: str, metrics: List[dict], period_name: str) -> str:
-    """Genera una visualización de mapa de calor basada en bloques temporales."""
-    if not metrics:
+def _format_heat_map(pair: str, blocks: List[Tuple[str, float]], period_name: str) -> str:
+    """Genera una visualización de mapa de calor a partir de bloques (etiqueta, spread medio)."""
+    if not blocks:
         return f"⚠️ No hay suficientes datos históricos para generar el reporte {period_name}."
 
     lines = [f"📊 <b>MAPA DE SPREAD {period_name.upper()}</b> ({pair})", ""]
 
-    # Agrupar por bloques (ej. 1h)
-    blocks = {}
-    local_tz = pytz.timezone(DEFAULT_TZ)
-    
-    for m in metrics:
-        # El timestamp viene en ISO UTC desde la DB
-        utc_dt = datetime.fromisoformat(m['timestamp'].replace('Z', '+00:00'))
-        if utc_dt.tzinfo is None:
-            utc_dt = utc_dt.replace(tzinfo=pytz.UTC)
-            
-        local_dt = utc_dt.astimezone(local_tz)
-        
-        if period_name == 'dia':
-            label = local_dt.strftime("%H:00")
-        else:  # semana
-            label = local_dt.strftime("%a %d")
-        
-        if label not in blocks:
-            blocks[label] = []
-        blocks[label].append(m['value'])
-
-    for label, vals in blocks.items():
-        avg = mean(vals)
+    for label, avg in blocks:
         if avg > 2.0:
             emoji = "🔥"
         elif avg > 1.2:
@@ -158,6 +131,24 @@ def _format_heat_map(pair: str, metrics: List[dict], period_name: str) -> str:
     return "\n".join(lines)
 
 
+_DIAS = ("Lun", "Mar", "Mié", "Jue", "Vie", "Sáb", "Dom")
+
+
+def _format_weekday_profile(pair: str, profile) -> str:
+    """Perfil semanal: spread medio de cada día de la semana y su mejor hora local."""
+    if np.isnan(profile).all():
+        return "⚠️ No hay suficientes datos históricos para generar el perfil semanal."
+
+    lines = [f"📅 <b>PERFIL SEMANAL DE SPREAD</b> ({pair})", ""]
+    for dow, row in enumerate(profile):
+        if np.isnan(row).all():
+            continue
+        best = int(np.nanargmax(row))
+        lines.append(f"• {_DIAS[dow]}: media <b>{np.nanmean(row):.2f}%</b> | mejor hora {best:02d}:00 ({row[best]:.2f}%)")
+    lines.append("\n💡 <i>Últimas 4 semanas, hora local.</i>")
+    return "\n".join(lines)
+
+
 def handle_spread(args: List[str], pair: str = 'USDT-COP') -> str:
     """
     Procesa comandos /spread.
@@ -169,6 +160,8 @@ def handle_spread(args: List[str], pair: str = 'USDT-COP') -> str:
     - /spread X%       : Busca posición más cercana a X% (ej. /spread 1%)
     - /spread X-Y%     : Lista posiciones en rango de % (ej. /spread 1-2%)
     - /spread >X       : Análisis de viabilidad (ej. /spread >0.7)
+    - /spread dia|semana : Mapa de calor por hora / día local
+    - /spread perfil   : Spread medio y mejor hora por día de la semana
     """
     # Obtener snapshot
     snap = _get_latest_snapshot(pair)
@@ -196,16 +189,21 @@ def handle_spread(args: List[str], pair: str = 'USDT-COP') -> str:
     # NUEVOS CASOS: dia / semana (Heatmap)
     # ===========================================
     if token in ('dia', 'semana'):
-        hours = 24 if token == 'dia' else 168
-        # Intentar con la nueva tabla detallada
-        metrics = core_db.fetch_spread_analysis(pair, hours=hours)
-        
-        # Fallback a métricas genéricas si la nueva tabla está vacía (instalaciones nuevas)
-        if not metrics:
+        # Buckets por hora local pre-agregados (spread_heatmap): como mucho 24·7 filas
+        since = heatmap.period_start(token)
+        buckets = heatmap.hourly(pair, since)
+
+        # Fallback a métricas genéricas si no hay historial de spread (instalaciones nuevas)
+        if not buckets:
+            hours = 24 if token == 'dia' else 168
             metrics = core_db.fetch_metrics_history(
                 pair, 'avg_spread_top50', since_hours=hours)
-        
-        return _format_heat_map(pair, metrics, token)
+            buckets = heatmap.from_samples(metrics, since)
+
+        return _format_heat_map(pair, heatmap.blocks(buckets, token), token)
+
+    if token == 'perfil':
+        return _format_weekday_profile(pair, heatmap.weekday_profile(pair))
 
     # ===========================================
     # NUEVO CASO: Filtro por Banco / Método Pago
@@ -437,97 +435,64 @@ def handle_spread(args: List[str], pair: str = 'USDT-COP') -> str:
         spread_min = threshold
         spread_max = threshold + 0.3
 
-        # PASO 1: Encontrar las posiciones que caen en este rango de spreads
-        positions_in_range = []
-        first_pos = None
-        last_pos = None
+        rw = get_global()
+        if not rw:
+            return "⚠️ No hay datos históricos disponibles. El worker debe estar activo."
 
-        for i in range(max_positions):
-            sp = _spread_from_pair(buys[i], sells[i])
-            if sp is None:
-                continue
-
-            if spread_min <= sp <= spread_max:
-                positions_in_range.append({
-                    'pos': i + 1,
-                    'spread': sp,
-                    'vol_actual': buys[i].quantity + sells[i].quantity
-                })
-                if first_pos is None:
-                    first_pos = i + 1
-                last_pos = i + 1
+        # El historial por posición solo guarda el top `k` de cada lado: la búsqueda no pasa de ahí
+        depth = min(max_positions, rw.positions.k)
+        depth_note = (f"ℹ️ Búsqueda limitada a las primeras {depth} posiciones (historial por posición)"
+                      if depth < max_positions else None)
+
+        # PASO 1: Encontrar las posiciones que caen en este rango de spreads (snapshot actual)
+        book = snap.book
+        ask_p, bid_p = book.ask_prices[:depth], book.bid_prices[:depth]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            spreads_now = (ask_p - bid_p) / bid_p * 100
+        vols_now = book.ask_qty[:depth] + book.bid_qty[:depth]
+        in_range = np.flatnonzero((spreads_now >= spread_min) & (spreads_now <= spread_max))
+        positions_in_range = [{'pos': int(i) + 1, 'spread': float(spreads_now[i]), 'vol_actual': float(vols_now[i])}
+                              for i in in_range]
 
         if not positions_in_range:
             # Buscar la posición más cercana para dar recomendación
-            closest_pos = None
-            closest_spread = None
-            closest_diff = float('inf')
-
-            for i in range(max_positions):
-                sp = _spread_from_pair(buys[i], sells[i])
-                if sp is None:
-                    continue
-                diff = abs(sp - threshold)
-                if diff < closest_diff:
-                    closest_diff = diff
-                    closest_pos = i + 1
-                    closest_spread = sp
-
-            if closest_pos:
+            valid = np.flatnonzero(np.isfinite(spreads_now))
+            if len(valid):
+                i = int(valid[np.argmin(np.abs(spreads_now[valid] - threshold))])
+                closest_pos, closest_spread = i + 1, float(spreads_now[i])
                 direction = "aumentar" if closest_spread < threshold else "disminuir"
                 return (
                     f"⚠️ No hay spreads entre {spread_min:.2f}% y {spread_max:.2f}%\n\n"
                     f"• El spread más cercano a {threshold}% es **{closest_spread:.2f}%** en posición #{closest_pos}\n"
                     f"• Prueba con: `/spread >{closest_spread:.1f}` para {direction} el umbral"
-                )
+                ) + (f"\n{depth_note}" if depth_note else "")
             else:
                 return f"⚠️ No se encontraron posiciones cerca de {threshold}%"
 
-        # PASO 2: Obtener datos históricos de la última hora desde RAM
-        rw = get_global()
-        if not rw:
-            return "⚠️ No hay datos históricos disponibles. El worker debe estar activo."
-
-        cutoff = datetime.now(timezone.utc) - timedelta(hours=1)
-
-        # Recolectar volúmenes históricos para el rango de posiciones
-        historical_volumes = []
-        snapshot_count = 0
+        first_pos = positions_in_range[0]['pos']
+        last_pos = positions_in_range[-1]['pos']
 
+        # PASO 2: Volumen del bloque en cada snapshot de la última hora (matrices tiempo × posición)
+        cutoff = (datetime.now(timezone.utc) - timedelta(hours=1)).timestamp()
         with rw.lock:
-            dq = rw.pair_index.get(pair, [])
-            for snap in reversed(dq):
-                if snap.timestamp < cutoff:
-                    break
-
-                snapshot_count += 1
+            hist = rw.positions.window(pair, since_ts=cutoff)
 
-                # Obtener datos de ese snapshot
-                b_hist, s_hist = _ordered_lists(snap)
-                if len(b_hist) < last_pos or len(s_hist) < last_pos:
-                    continue  # Snapshot no tiene suficientes posiciones
+        snapshot_count = len(hist['ts'])
+        # NaN = el snapshot no tiene suficientes posiciones
+        block_vols = range_volume(hist['cum_qty'], first_pos, last_pos)
+        ok = ~np.isnan(block_vols)
+        historical_volumes = block_vols[ok]
 
-                # Sumar volumen en el rango de posiciones
-                total_vol_range = 0
-                for pos_idx in range(first_pos - 1, last_pos):
-                    if pos_idx < len(b_hist) and pos_idx < len(s_hist):
-                        total_vol_range += b_hist[pos_idx].quantity + \
-                            s_hist[pos_idx].quantity
-
-                historical_volumes.append(total_vol_range)
-
-        if not historical_volumes:
+        if not len(historical_volumes):
             return "⚠️ No hay suficientes snapshots históricos en la última hora."
 
         # PASO 3: Calcular métricas
-        avg_vol_per_snapshot = mean(historical_volumes)
-        max_vol = max(historical_volumes)
-        min_vol = min(historical_volumes)
+        avg_vol_per_snapshot = float(historical_volumes.mean())
+        max_vol = float(historical_volumes.max())
+        min_vol = float(historical_volumes.min())
 
-        # Proyectar volumen por hora (asumiendo snapshots cada ~2 minutos)
-        snapshots_per_hour = len(historical_volumes)
-        estimated_hourly_volume = avg_vol_per_snapshot * \
-            (60 / 2)  # 2 min entre snapshots
+        # Proyectar volumen por hora con la cadencia real de los snapshots
+        estimated_hourly_volume = avg_vol_per_snapshot * per_hour(hist['ts'][ok])
 
         # PASO 4: Determinar nivel de rotación
         if estimated_hourly_volume < 1000:
@@ -541,24 +506,25 @@ def handle_spread(args: List[str], pair: str = 'USDT-COP') -> str:
             recommendation = "✅ Ideal para arbitraje. Buen volumen y rotación."
 
         # PASO 5: Construir mensaje
-            lines = [
-                f"📊 <b>ANÁLISIS DE VIABILIDAD</b>",
-                f"• Umbral: <b>>{threshold}%</b> | Rango: {spread_min:.2f}% – {spread_max:.2f}%",
-                f"• Bloque analizado: <b>Posiciones {first_pos} – {last_pos}</b>",
-                f"• Total posiciones en rango: {len(positions_in_range)}",
-                "",
-                f"📈 <b>Volumen histórico (última hora)</b>",
-                f"• Snapshots analizados: {snapshot_count}",
-                f"• Volumen promedio por snapshot: <b>{format_vol(avg_vol_per_snapshot)} USDT</b>",
-                f"• Volumen mínimo: {format_vol(min_vol)} USDT",
-                f"• Volumen máximo: {format_vol(max_vol)} USDT",
-                f"• <b>Volumen estimado por hora: {format_vol(estimated_hourly_volume)} USDT</b>",
-                "",
-                f"🔄 <b>Rotación: {rotation}</b>",
-                f"• {recommendation}",
-                "",
-                f"💡 <b>Posiciones en el bloque:</b>"
-            ]
+        lines = [
+            f"📊 <b>ANÁLISIS DE VIABILIDAD</b>",
+            f"• Umbral: <b>>{threshold}%</b> | Rango: {spread_min:.2f}% – {spread_max:.2f}%",
+            f"• Bloque analizado: <b>Posiciones {first_pos} – {last_pos}</b>",
+            f"• Total posiciones en rango: {len(positions_in_range)}",
+            *([depth_note] if depth_note else []),
+            "",
+            f"📈 <b>Volumen histórico (última hora)</b>",
+            f"• Snapshots analizados: {snapshot_count}",
+            f"• Volumen promedio por snapshot: <b>{format_vol(avg_vol_per_snapshot)} USDT</b>",
+            f"• Volumen mínimo: {format_vol(min_vol)} USDT",
+            f"• Volumen máximo: {format_vol(max_vol)} USDT",
+            f"• <b>Volumen estimado por hora: {format_vol(estimated_hourly_volume)} USDT</b>",
+            "",
+            f"🔄 <b>Rotación: {rotation}</b>",
+            f"• {recommendation}",
+            "",
+            f"💡 <b>Posiciones en el bloque:</b>"
+        ]
 
         # Mostrar primeras 5 posiciones del bloque
         for idx, p in enumerate(positions_in_range[:5], 1):
@@ -1,6 +1,7 @@
 import sqlite3
 from datetime import datetime, timedelta, timezone
 from core.user_db import DB_PATH
+from services.analytics.cache import RESPONSES
 
 
 def generate_cso_report() -> str:
@@ -10,14 +11,14 @@ def generate_cso_report() -> str:
 
     # Análisis de los últimos 7 días
     now = datetime.now(timezone.utc)
-    week_ago = (now - timedelta(days=7)).isoformat()
+    week_ago = int((now - timedelta(days=7)).timestamp() * 1000)
 
     try:
         # 1. Usuarios recurrentes (Retention) - >3 días en la semana
         cur.execute('''
-            SELECT user_id, COUNT(DISTINCT substr(timestamp, 1, 10)) as days_active
+            SELECT user_id, COUNT(DISTINCT date(ts / 1000, 'unixepoch')) as days_active
             FROM bot_usage_logs
-            WHERE timestamp >= ?
+            WHERE ts >= ?
             GROUP BY user_id
         ''', (week_ago,))
         retention_rows = cur.fetchall()
@@ -28,9 +29,9 @@ def generate_cso_report() -> str:
 
         # 2. Power users (Agotaron 15 solicitudes en 1 día)
         cur.execute('''
-            SELECT user_id, substr(timestamp, 1, 10) as day, COUNT(*) as reqs
+            SELECT user_id, date(ts / 1000, 'unixepoch') as day, COUNT(*) as reqs
             FROM bot_usage_logs
-            WHERE timestamp >= ? AND result != 'CAPACITY_FULL'
+            WHERE ts >= ? AND result != 'CAPACITY_FULL'
             GROUP BY user_id, day
             HAVING reqs >= 15
         ''', (week_ago,))
@@ -39,9 +40,9 @@ def generate_cso_report() -> str:
 
         # 3. Análisis de Escasez (Días con 30 usuarios)
         cur.execute('''
-            SELECT substr(timestamp, 1, 10) as day, COUNT(DISTINCT user_id) as users_count, MIN(substr(timestamp, 12, 5)) as time_full
+            SELECT date(ts / 1000, 'unixepoch') as day, COUNT(DISTINCT user_id) as users_count, MIN(strftime('%H:%M', ts / 1000, 'unixepoch')) as time_full
             FROM bot_usage_logs
-            WHERE timestamp >= ?
+            WHERE ts >= ?
             GROUP BY day
             HAVING users_count >= 30
         ''', (week_ago,))
@@ -54,7 +55,7 @@ def generate_cso_report() -> str:
         cur.execute('''
             SELECT command, COUNT(*) as count
             FROM bot_usage_logs
-            WHERE timestamp >= ?
+            WHERE ts >= ?
             GROUP BY command
             ORDER BY count DESC
             LIMIT 3
@@ -76,7 +77,7 @@ def generate_cso_report() -> str:
             FROM (
                 SELECT json_extract(details, '$.exchange') as exchange
                 FROM bot_usage_logs
-                WHERE timestamp >= ? AND details IS NOT NULL
+                WHERE ts >= ? AND details IS NOT NULL
             )
             WHERE exchange IS NOT NULL
             GROUP BY exchange
@@ -88,13 +89,13 @@ def generate_cso_report() -> str:
         cur.execute('''
             SELECT COUNT(*) 
             FROM bot_usage_logs
-            WHERE timestamp >= ? AND result = 'ERROR'
+            WHERE ts >= ? AND result = 'ERROR'
         ''', (week_ago,))
         errores_count = cur.fetchone()[0]
 
         # 6. Tiempo de sesión (Traders vs Monitors)
         cur.execute(
-            '''SELECT user_id, timestamp FROM bot_usage_logs WHERE timestamp >= ? ORDER BY user_id, timestamp''', (week_ago,))
+            '''SELECT user_id, ts FROM bot_usage_logs WHERE ts >= ? ORDER BY user_id, ts''', (week_ago,))
         logs = cur.fetchall()
 
         trader_profiles = set()
@@ -102,7 +103,7 @@ def generate_cso_report() -> str:
         user_times = defaultdict(list)
         for uid, ts in logs:
             try:
-                user_times[uid].append(datetime.fromisoformat(ts).timestamp())
+                user_times[uid].append(ts / 1000)
             except:
                 pass
 
@@ -177,6 +178,15 @@ def generate_cso_report() -> str:
         ""
     ])
 
+    cache = RESPONSES.stats()
+    lines.extend([
+        "<b>5. Caché de respuestas (desde el arranque)</b>",
+        f"• Hit rate: <b>{cache['hit_rate'] * 100:.1f}%</b> ({cache['hits']} hits, {cache['joined']} compartidas, "
+        f"{cache['misses']} cálculos)",
+        f"• Entradas: {cache['size']} | Expulsadas: {cache['evictions']}",
+        ""
+    ])
+
     # Feature suggestions based on behaviour
     lines.append("💡 <b>Sugerencia de 'Feature':</b>")
     if "Saber el precio" in dolor_usuario:
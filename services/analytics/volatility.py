@@ -4,6 +4,7 @@ from typing import List, Optional
 
 from core.ram_window import get_global
 from core import pipeline
+from core.sketches import price_quantiles
 from core.processor import format_num, ai_meta
 
 
@@ -148,6 +149,21 @@ def handle_volatility(args: List[str], pair: str = 'USDT-COP') -> str:
             lines.append(
                 f"{level_info['emoji']} {h['hour']} {bar_str} {h['volatility']:.1f} ({level_info['level'].lower()})")
 
+    # Percentiles del precio (t-digest por minuto + rollups persistidos)
+    bands = []
+    for label, seconds in (("1h", 3600), ("6h", 6 * 3600), ("24h", 24 * 3600)):
+        try:
+            qs = price_quantiles(pair, 'buy', seconds)
+        except Exception:
+            qs = None
+        if qs:
+            bands.append((label, qs))
+    if bands:
+        lines.extend(["", "📐 <b>Estabilidad de la tasa (compra, p10 / p50 / p90):</b>"])
+        for label, (p10, p50, p90) in bands:
+            width = ((p90 - p10) / p50 * 100) if p50 else 0
+            lines.append(f"• {label}: {format_num(p10)} / <b>{format_num(p50)}</b> / {format_num(p90)} (±{width / 2:.2f}%)")
+
     # Recomendación
     lines.extend([
         "",
@@ -165,7 +181,8 @@ def handle_volatility(args: List[str], pair: str = 'USDT-COP') -> str:
         "pair": pair,
         "coef_var": coef_var,
         "level": interp['level'],
-        "confidence": max(0, 100 - coef_var*10)
+        "confidence": max(0, 100 - coef_var*10),
+        "price_bands": {label: qs for label, qs in bands},
     }
 
     return "\n".join(lines) + ai_meta(meta)
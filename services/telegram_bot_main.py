@@ -29,16 +29,11 @@ from datetime import datetime
 from core import pipeline, notifier, db, scheduler
 from core.processor import ai_meta
 import asyncio
-from services.analytics.spread import handle_spread
-from services.analytics.merchant import handle_merchant
-from services.analytics.volatility import handle_volatility
-from services.analytics.volume import handle_volume
-from services.analytics.depth import handle_depth
 from services.analytics.usage import generate_cso_report
 from core.app_config import CONFIG
 from core.user_db import init_user_db, get_user_currency, set_user_currency
 from services.users.manager import rate_limited
-from services.users.autos import start_autos, stop_autos
+from services.users.autos import HANDLERS, start_autos, stop_autos
 from services.users.premium import cmd_donar, cmd_planes, handle_callback_premium
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -96,11 +91,13 @@ async def cmd_help(update, context):
         "• <code>/volume</code>: Análisis de liquidez, rotación y dominancia de merchants.\n"
         "• <code>/depth</code>: Profundidad de mercado y slippage global.\n"
         "• <code>/depth muro</code>: Detecta muros de liquidez (soportes/resistencias).\n"
+        "• <code>/depth 23750</code>: Precio efectivo y slippage para montos propios.\n"
         "• <code>/depth bancolombia</code>: Profundidad filtrada por banco.\n\n"
         "📉 <b>COMANDOS DE SPREAD</b>\n"
         "• <code>/spread</code>: Media del Top 5 actual.\n"
         "• <code>/spread dia</code>: Mapa de calor de las últimas 24h.\n"
         "• <code>/spread semana</code>: Mapa de calor de los últimos 7 días.\n"
+        "• <code>/spread perfil</code>: Spread medio y mejor hora por día de la semana.\n"
         "• <code>/spread banesco</code>: Spread filtrado por método de pago.\n"
         "• <code>/spread N-M</code>: Media en un rango de posiciones.\n"
         "• <code>/spread &gt;1.2</code>: <b>Análisis de Viabilidad</b> histórico.\n\n"
@@ -241,6 +238,20 @@ async def cmd_arbitraje(update, context):
                     lines.append(
                         "\n⚠️ <b>Nota:</b> La tasa de remesa es más competitiva que el P2P.")
 
+        # Resto de la matriz N×N (fiats además de COP/VES)
+        matriz = data.get("matriz") or {}
+        fiats = matriz.get("fiats", [])
+        otros = [f for f in fiats if f not in ("COP", "VES")]
+        if otros:
+            lines.append("\n🌐 <b>Otros corredores P2P</b>")
+            for src in fiats:
+                for dst in fiats:
+                    rate = matriz["p2p"][src][dst]
+                    if rate and (src in otros or dst in otros):
+                        lines.append(f"• {src}→{dst}: <b>{rate:.4f}</b> {src}/{dst}")
+        for tri in data.get("triangulares") or []:
+            lines.append(f"🔺 Ciclo {' → '.join(tri['cycle'])}: <b>{tri['profit_pct']:+.2f}%</b>")
+
         lines.append(
             "\n💡 <i>La tasa implícita incluye un 0.16% de comisión por cada tramo (vía USDT).</i>")
 
@@ -828,7 +839,7 @@ async def _wrap_analytics(update, context, func):
             if ('/' in first or '-' in first) and any(c.isalpha() for c in first):
                 pair = first
                 args = args[1:]
-            elif len(first) == 3 and first not in reserved:  # it's just a currency code like COP
+            elif len(first) == 3 and first.isalpha() and first not in reserved:  # it's just a currency code like COP
                 pair = f"USDT-{first}"
                 args = args[1:]
         else:
@@ -845,27 +856,27 @@ async def _wrap_analytics(update, context, func):
 
 @rate_limited("/spread")
 async def cmd_spread(update, context):
-    await _wrap_analytics(update, context, handle_spread)
+    await _wrap_analytics(update, context, HANDLERS["spread"])
 
 
 @rate_limited("/merchant")
 async def cmd_merchant(update, context):
-    await _wrap_analytics(update, context, handle_merchant)
+    await _wrap_analytics(update, context, HANDLERS["merchant"])
 
 
 @rate_limited("/volatilidad")
 async def cmd_volatilidad(update, context):
-    await _wrap_analytics(update, context, handle_volatility)
+    await _wrap_analytics(update, context, HANDLERS["volatilidad"])
 
 
 @rate_limited("/volume")
 async def cmd_volume(update, context):
-    await _wrap_analytics(update, context, handle_volume)
+    await _wrap_analytics(update, context, HANDLERS["volume"])
 
 
 @rate_limited("/depth")
 async def cmd_depth(update, context):
-    await _wrap_analytics(update, context, handle_depth)
+    await _wrap_analytics(update, context, HANDLERS["depth"])
 
 
 if __name__ == "__main__":
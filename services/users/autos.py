@@ -6,17 +6,18 @@ from services.analytics.volume import handle_volume
 from services.analytics.depth import handle_depth
 from services.analytics.volatility import handle_volatility
 from services.analytics.merchant import handle_merchant
+from services.analytics.cache import cached
 from telegram.constants import ParseMode
 
 logger = logging.getLogger(__name__)
 
-# Mapeo de comandos a funciones de análisis
+# Mapeo de comandos a funciones de análisis (con caché de respuestas por versión del snapshot)
 HANDLERS = {
-    "spread": handle_spread,
-    "volume": handle_volume,
-    "depth": handle_depth,
-    "volatilidad": handle_volatility,
-    "merchant": handle_merchant
+    "spread": cached("spread", handle_spread),
+    "volume": cached("volume", handle_volume),
+    "depth": cached("depth", handle_depth),
+    "volatilidad": cached("volatilidad", handle_volatility),
+    "merchant": cached("merchant", handle_merchant)
 }
 
 _SCHEDULER = AsyncIOScheduler()
@@ -8,7 +8,7 @@ try:
 except Exception:
     ContextTypes = None
 
-from core.user_db import check_daily_limits, log_usage, get_next_in_waitlist
+from core.user_db import check_daily_limits, log_usage, get_next_in_waitlist, reserve_request
 
 logger = logging.getLogger(__name__)
 
@@ -86,6 +86,14 @@ def rate_limited(command_name: str):
                 return
 
             # Si el usuario puede proceder, ejecutamos la función original
+            # La consulta se reserva en el contador en memoria antes de ejecutar: otra ráfaga
+            # del mismo usuario ya la ve aunque su log siga en la cola del writer
+            try:
+                reqs_now = reserve_request(user_id)
+            except Exception as e:
+                logger.error(f"Error contando consultas de {user_id}: {e}")
+                reqs_now = None
+
             result_status = 'SUCCESS'
             error_thrown = False
             try:
@@ -99,18 +107,7 @@ def rate_limited(command_name: str):
                 log_usage(user_id, command_name, result_status, res_time, details=usage_details)
 
                 # Checkear si acaba de consumir su solicitud 15 exactament!
-                import sqlite3
-                from core.user_db import DB_PATH
-                from datetime import datetime, timezone
                 try:
-                    conn = sqlite3.connect(DB_PATH)
-                    cur = conn.cursor()
-                    today = datetime.now(timezone.utc).isoformat()[:10]
-                    cur.execute(
-                        "SELECT COUNT(*) FROM bot_usage_logs WHERE user_id = ? AND timestamp LIKE ? AND result NOT IN ('LIMIT_USER', 'CAPACITY_FULL', 'WAITLIST', 'BANNED', 'ALREADY_WAITLIST')", (str(user_id), f"{today}%"))
-                    reqs_now = cur.fetchone()[0]
-                    conn.close()
-
                     if reqs_now == 15 and not error_thrown:
                         try:
                             await context.bot.send_message(
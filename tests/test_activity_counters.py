@@ -0,0 +1,21 @@
+from core.activity_counters import SlidingCounters
+
+
+def test_sliding_counters_expire_and_rank_offenders():
+    c = SlidingCounters(window_seconds=60, bucket_seconds=10, threshold=3)
+    t0 = 1_000_000
+    for i in range(4):
+        c.add(t0 + i, 'busy', 'buy')
+    for i in range(3):
+        c.add(t0 + 20 + i, 'mid', 'sell')
+    c.add(t0 + 30, 'quiet', 'buy')
+
+    assert c.get('busy') == {'merchant': 'busy', 'count': 4, 'buy': 4, 'sell': 0}
+    assert c.offenders() == [('busy', 4), ('mid', 3)]
+
+    # a t0+65 el bucket de 'busy' sale de la ventana
+    c.advance(t0 + 65)
+    assert c.get('busy')['count'] == 0
+    assert c.offenders() == [('mid', 3)]
+    c.advance(t0 + 200)
+    assert len(c) == 0 and c.offenders() == []
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+from core.ad_lifecycle import AdTracker
+from core.ram_window import Ad, Snapshot
+
+
+def _ad(m_id, price, qty=100.0, side='buy', pay='Nequi,Bancolombia'):
+    return Ad(price=price, quantity=qty, merchant=f"nick_{m_id}", side=side, min_limit=0, max_limit=0,
+              payment_method=pay, merchant_id=m_id)
+
+
+def test_lifecycle_events_across_snapshots():
+    tracker = AdTracker(relist_window_seconds=300)
+    t0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    kinds = lambda evs: sorted((e.kind, e.merchant_id) for e in evs)
+
+    evs = tracker.observe(Snapshot(t0, 'USDT-COP', ads=[_ad('a', 4000), _ad('b', 4010)]))
+    assert kinds(evs) == [('appear', 'a'), ('appear', 'b')]
+
+    # mismo set de pagos en otro orden -> mismo anuncio; cambia precio y cantidad
+    t1 = t0 + timedelta(seconds=60)
+    evs = tracker.observe(Snapshot(t1, 'USDT-COP', ads=[_ad('a', 3990, pay='Bancolombia,Nequi'), _ad('b', 4010, qty=50)]))
+    assert kinds(evs) == [('reprice', 'a'), ('requantity', 'b')]
+    assert [e.duration_ms for e in evs] == [60_000, 60_000]
+
+    t2 = t1 + timedelta(seconds=60)
+    evs = tracker.observe(Snapshot(t2, 'USDT-COP', ads=[_ad('b', 4010, qty=50)]))
+    assert kinds(evs) == [('disappear', 'a')]
+    assert evs[0].duration_ms == 120_000
+
+    t3 = t2 + timedelta(seconds=30)
+    evs = tracker.observe(Snapshot(t3, 'USDT-COP', ads=[_ad('a', 3995), _ad('b', 4010, qty=50)]))
+    assert kinds(evs) == [('relist', 'a')]
+    assert evs[0].duration_ms == 30_000
+
+    stats = tracker.merchant_stats('a')
+    assert stats['reprices'] == 1 and stats['relists'] == 1
+    assert stats['avg_relist_latency_s'] == 30.0
+    assert stats['avg_ad_lifetime_s'] == 120.0
+    assert tracker.live_count('USDT-COP') == 2
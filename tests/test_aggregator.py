@@ -0,0 +1,98 @@
+import math
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from statistics import mean
+
+from core import db, raw_archive
+from core.aggregator import Aggregator, _compute_bucket
+from core.ram_window import Ad, RamWindow, Snapshot
+
+
+def _reference(snaps):
+    # cálculo original en Python puro (con el `mean` ya sin sombrear)
+    prices, spreads, totals, costs, revenues = [], [], [], [], []
+    for s in snaps:
+        sellers = sorted([a for a in s.ads if a.side == 'buy'], key=lambda x: x.price)
+        buyers = sorted([a for a in s.ads if a.side == 'sell'], key=lambda x: x.price, reverse=True)
+        n = min(50, len(sellers), len(buyers))
+        sp = [(sellers[i].price - buyers[i].price) / buyers[i].price * 100 for i in range(n) if buyers[i].price > 0]
+        if sp:
+            spreads.append(sum(sp) / len(sp))
+        totals.append(sum(a.quantity for a in s.ads))
+        prices += [a.price for a in s.ads]
+        if sellers:
+            costs.append(mean(a.price for a in sellers[:50]))
+        if buyers:
+            revenues.append(mean(a.price for a in buyers[:50]))
+    avg = sum(prices) / len(prices)
+    return {
+        'avg_price': avg, 'min_price': min(prices), 'max_price': max(prices),
+        'spread_pct_bucket': sum(spreads) / len(spreads),
+        'volatility': math.sqrt(sum((p - avg) ** 2 for p in prices) / len(prices)),
+        'sample_count': len(prices), 'total_exposed_vol': sum(totals) / len(totals),
+        'avg_cost': mean(costs), 'avg_revenue': mean(revenues),
+    }
+
+
+def test_vectorized_bucket_matches_reference():
+    rng = random.Random(5)
+    t0 = datetime.now(timezone.utc)
+    snaps = []
+    for k in range(10):
+        n_buy, n_sell = rng.randint(0 if k == 3 else 20, 80), rng.randint(30, 70)
+        ads = [Ad(rng.uniform(4000, 4100), rng.uniform(10, 500), 'm', 'buy', 0, 0, '') for _ in range(n_buy)]
+        ads += [Ad(rng.uniform(3900, 3990), rng.uniform(10, 500), 'm', 'sell', 0, 0, '') for _ in range(n_sell)]
+        snaps.append(Snapshot(t0 + timedelta(minutes=k), 'USDT-COP', ads=ads))
+    got = _compute_bucket(snaps)
+    for key, expected in _reference(snaps).items():
+        assert math.isclose(got[key], expected, rel_tol=1e-9), key
+
+
+def _raw(price, nick):
+    return {"adv": {"price": price, "tradableQuantity": 100.0, "tradeMethods": [{"tradeMethodName": "Nequi"}]},
+            "advertiser": {"userNo": nick, "nickName": nick}}
+
+
+def test_aligned_buckets_catch_up_from_archive_without_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "agg.db")
+    db.init_db()
+    now = time.time()
+    closed = int(now) - int(now) % 600
+    pair = "USDT-COP"
+    # último bucket persistido antes de la caída
+    db.save_aggregated_price(pair, db.ms_to_iso((closed - 3600) * 1000), avg_price=1.0, resolution=600)
+    # durante la caída solo quedó el archivo crudo (un BUY + un SELL por ciclo)
+    for start in (closed - 3000, closed - 2400, closed - 1800):
+        raw_archive.append_block("binance", pair, "BUY", [_raw(4010.0, "a")], timestamp=(start + 10) * 1000)
+        raw_archive.append_block("binance", pair, "SELL", [_raw(3990.0, "b")], timestamp=(start + 15) * 1000)
+
+    rw = RamWindow(window_seconds=3 * 3600)
+    try:
+        for ts in (closed - 1170, closed - 570, closed - 300, closed + 5):
+            rw.append_snapshot(pair, [{"price": 4000.0, "quantity": 50, "side": "buy"},
+                                      {"price": 3980.0, "quantity": 50, "side": "sell"}],
+                               timestamp=datetime.fromtimestamp(ts, tz=timezone.utc))
+        assert Aggregator(rw).flush_once(now=closed + 10) == 5
+        # reinicio: continúa desde el último bucket persistido, sin reescribir nada
+        assert Aggregator(rw).flush_once(now=closed + 10) == 0
+    finally:
+        rw.stop()
+
+    rows = db.fetch_recent_aggregates(pair, limit=10)
+    starts = [db.to_ms(r["bucket_start"]) // 1000 for r in rows]
+    assert starts == [closed - 600 * k for k in range(1, 7)]
+    by_start = dict(zip(starts, rows))
+    assert by_start[closed - 3000]["min_price"] == 3990.0 and by_start[closed - 3000]["max_price"] == 4010.0
+    assert by_start[closed - 600]["sample_count"] == 4
+
+    # upsert: recalcular un bucket lo reemplaza
+    db.save_aggregated_price(pair, db.ms_to_iso((closed - 600) * 1000), avg_price=2.0, resolution=600)
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        n, avg = conn.execute("SELECT COUNT(*), MAX(avg_price) FROM aggregated_prices WHERE bucket_ts = ?",
+                              ((closed - 600) * 1000,)).fetchone()
+    finally:
+        conn.close()
+    assert (n, avg) == (1, 2.0)
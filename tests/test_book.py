@@ -0,0 +1,41 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+
+from core.book import BookView
+
+
+def _walk(ads, target):
+    """Recorrido lineal de referencia (mejor precio primero)."""
+    vol = cost = 0.0
+    for ad in ads:
+        if vol >= target:
+            break
+        qty = min(ad.quantity, target - vol)
+        vol += qty
+        cost += qty * ad.price
+    return cost / vol if vol >= target else None
+
+
+def test_fill_matches_linear_walk_for_any_size():
+    rng = random.Random(3)
+    ads = [SimpleNamespace(price=round(rng.uniform(3900, 4100), 2), quantity=rng.uniform(50, 3000),
+                           side=rng.choice(('buy', 'sell')), payment_method=rng.choice(('Nequi', 'Bancolombia')))
+           for _ in range(120)]
+    book = BookView(ads)
+    sizes = [1, 1000, 5000, 23750, 50000, 10 ** 7]
+    for side in ('buy', 'sell'):
+        avg, slip = book.fill(side, sizes)
+        for s, a, sl in zip(sizes, avg, slip):
+            ref = _walk(book.side(side), s)
+            if ref is None:
+                assert np.isnan(a) and np.isnan(sl)
+            else:
+                assert np.isclose(a, ref)
+                assert np.isclose(sl, abs(ref / book.side(side)[0].price - 1) * 100)
+
+    nequi = book.for_bank('nequi')
+    assert nequi is book.for_bank('NEQUI')
+    assert all(a.payment_method == 'Nequi' for a in nequi.asks + nequi.bids)
+    assert np.isclose(nequi.fill('buy', [2000])[0][0], _walk(nequi.asks, 2000))
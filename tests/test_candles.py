@@ -0,0 +1,95 @@
+import math
+import random
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from core import candles, db
+from core.candles import CandleEngine, get_candles
+from core.ram_window import Ad, RamWindow, Snapshot
+
+
+def _snaps(t0, count, step=30, seed=11):
+    rng = random.Random(seed)
+    out = []
+    for k in range(count):
+        ads = [Ad(rng.uniform(4000, 4100), rng.uniform(10, 500), 'm', 'buy', 0, 0, '') for _ in range(15)]
+        ads += [Ad(rng.uniform(3900, 3990), rng.uniform(10, 500), 'm', 'sell', 0, 0, '') for _ in range(15)]
+        out.append(Snapshot(datetime.fromtimestamp(t0 + k * step, tz=timezone.utc), 'USDT-COP', ads=ads))
+    return out
+
+
+def _direct(snaps, side, since, until):
+    pts = [candles.snapshot_points(s)[side] for s in snaps if since <= s.timestamp.timestamp() < until]
+    best = [p[0] for p in pts]
+    return {'best_open': best[0], 'best_high': max(best), 'best_low': min(best), 'best_close': best[-1],
+            'top_close': pts[-1][1], 'spread_high': max(p[2] for p in pts),
+            'volume': sum(p[3] for p in pts) / len(pts), 'n': len(pts)}
+
+
+def test_higher_resolutions_derive_from_lower_and_survive_restart(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "candles.db")
+    t0 = 1_790_000_000 - 1_790_000_000 % 86400 + 3600  # 01:00 UTC
+    snaps = _snaps(t0, 260)  # 2h10m cada 30 s
+
+    eng = CandleEngine()
+    # el snapshot 150 (02:15:00) cierra la vela de 02:14 y queda en la de 1 m abierta, que se pierde
+    for s in snaps[:151]:
+        eng.add_snapshot(s)
+    # reinicio a mitad de la segunda hora: las velas abiertas se siembran desde la DB
+    eng = CandleEngine()
+    for s in snaps[150:]:
+        eng.add_snapshot(s)
+
+    h = get_candles('USDT-COP', 'buy', '1h', since=t0 * 1000, until=(t0 + 7200) * 1000, engine=eng)
+    assert list(h['ts']) == [t0 * 1000, (t0 + 3600) * 1000]
+    for i, start in enumerate((t0, t0 + 3600)):
+        for col, expected in _direct(snaps, 'buy', start, start + 3600).items():
+            assert math.isclose(h[col][i], expected, rel_tol=1e-9), (start, col)
+
+    m5 = get_candles('USDT-COP', 'sell', 300, since=t0 * 1000, engine=eng)
+    assert len(m5['ts']) == 26 and np.all(np.diff(m5['ts']) == 300_000)
+    # la vela en curso (sin persistir) incluye la de 1 m abierta
+    last = _direct(snaps, 'sell', t0 + 7500, t0 + 7800)
+    assert m5['n'][-1] == last['n'] and math.isclose(m5['best_close'][-1], last['best_close'])
+    assert math.isclose(m5['best_high'][-1], last['best_high'])
+
+    d = get_candles('USDT-COP', 'sell', '1d', engine=eng)
+    assert list(d['ts']) == [(t0 - 3600) * 1000] and d['n'][0] == len(snaps)
+
+
+def _free(lock) -> bool:
+    out = []
+
+    def run():
+        ok = lock.acquire(timeout=1)
+        if ok:
+            lock.release()
+        out.append(ok)
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    return out[0]
+
+
+def test_seeding_reads_db_outside_window_and_engine_locks(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "seed.db")
+    rw = RamWindow()
+    seen = []
+    real_load = candles._load
+
+    def probe(*args, **kwargs):
+        seen.append(_free(rw.lock) and _free(rw.candles._lock))
+        return real_load(*args, **kwargs)
+
+    monkeypatch.setattr(candles, "_load", probe)
+    try:
+        ads = [{'price': 4000.0 + i, 'quantity': 10.0, 'side': 'buy'} for i in range(5)]
+        ads += [{'price': 3990.0 - i, 'quantity': 10.0, 'side': 'sell'} for i in range(5)]
+        rw.append_snapshot('USDT-COP', ads)
+        assert seen and all(seen)
+    finally:
+        rw.detectors.join()
+        rw.stop()
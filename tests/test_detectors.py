@@ -44,3 +44,74 @@ def test_detectors_smoke():
     assert l is None or isinstance(l, dict)
     m = detect_merchant_activity(rw, 'COP-VES', latest_snapshot=rw.snapshots[-1])
     assert m is None or isinstance(m, dict)
+
+
+def test_incremental_detectors_match_window(tmp_path, monkeypatch):
+    import math
+    import statistics
+    from core import app_config, db
+    from core.detectors.base import Detector, SnapshotDelta
+    from core.detectors.runner import DetectorRunner, load_detectors
+
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "d.db")
+    rw = RamWindow(window_seconds=3600)
+    dets = {d.name: d for d in load_detectors(rw)}
+    assert {'volatility', 'liquidity', 'merchant', 'merchant_intelligence'} <= set(dets)
+    runner = DetectorRunner(rw, [dets['volatility'], dets['liquidity']])
+
+    snaps = []
+    for i in range(5):
+        rw.append_snapshot('COP-VES', make_ads(20, price_start=100.0 + i), timestamp=datetime.now(timezone.utc))
+        snaps.append(rw.snapshots[-1])
+        runner.process_snapshot(SnapshotDelta('COP-VES', snaps[-1]))
+    # sale el más antiguo
+    runner.process_evict('COP-VES', snaps[0])
+
+    prices = [ad.price for s in snaps[1:] for ad in s.ads]
+    vol = dets['volatility'].state('COP-VES')
+    assert vol.n == len(prices)
+    assert math.isclose(vol.mean, statistics.mean(prices))
+    assert math.isclose(vol.stddev(), statistics.stdev(prices))
+    liq = dets['liquidity'].state('COP-VES')
+    assert liq == {'buy': 80.0, 'sell': 80.0}
+
+    class Slow(Detector):
+        name = 'slow'
+
+        def evaluate(self, delta):
+            end = time.thread_time() + 0.005
+            while time.thread_time() < end:
+                pass
+
+    slow_runner = DetectorRunner(rw, [Slow({'budget_ms': 1})])
+    for _ in range(4):
+        slow_runner.process_snapshot(SnapshotDelta('COP-VES', snaps[-1]))
+    stats = slow_runner.stats()['slow']
+    # 1ª evaluación excede -> salta 1; 3ª excede -> salta 2
+    assert stats['calls'] == 2 and stats['overruns'] == 2 and stats['skipped'] == 2
+    rw.stop()
+
+
+def test_merchant_activity_counts_across_pairs(tmp_path, monkeypatch):
+    from core import app_config, db
+    from core.detectors.base import SnapshotDelta
+    from core.detectors.merchant import MerchantActivityDetector
+    from core.detectors.runner import DetectorRunner
+
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "d.db")
+    cfg = dict(app_config.DETECTORS['merchant'], activity_count_threshold=20)
+    rw = RamWindow(window_seconds=3600)
+    rw._detectors = DetectorRunner(rw, [])  # sin hilo de detectores: se evalúa a mano
+    det = MerchantActivityDetector(cfg, rw)
+
+    def ads(pair_tag):
+        return [{'price': 100.0 + i, 'quantity': 1.0, 'merchant_name': 'cross_pair_bot', 'side': 'buy',
+                 'min': 1, 'max': 1000, 'id': f'{pair_tag}{i}'} for i in range(12)]
+
+    rw.append_snapshot('USDT-COP', ads('c'), timestamp=datetime.now(timezone.utc))
+    assert det.evaluate(SnapshotDelta('USDT-COP', rw.snapshots[-1])) is None
+    # 12 COP + 12 VES del mismo merchant superan el umbral de 20 (conteo global, como el baseline)
+    rw.append_snapshot('USDT-VES', ads('v'), timestamp=datetime.now(timezone.utc))
+    ev = det.evaluate(SnapshotDelta('USDT-VES', rw.snapshots[-1]))
+    assert ev is not None and ev['merchant'] == 'cross_pair_bot' and ev['details']['count'] == 24
+    rw.stop()
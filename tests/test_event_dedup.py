@@ -0,0 +1,52 @@
+import importlib
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core import db, event_dedup
+from core.event_dedup import EventDeduper
+
+
+def test_dedup_warms_from_events_and_checks_in_memory(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "e.db")
+    recent = (datetime.now(timezone.utc) - timedelta(seconds=30)).isoformat()
+    db.save_event("merchant_activity", "USDT-COP", recent, details={"merchant": "alice", "count": 25})
+
+    d = EventDeduper()
+    d.warm(since_seconds=300)
+    assert d.seen_recently("merchant_activity", "USDT-COP", 300, match={"merchant": "alice"})
+    assert not d.seen_recently("merchant_activity", "USDT-COP", 300, match={"merchant": "bob"})
+
+    # tras el warm-up las comprobaciones no abren conexiones
+    def _no_db(*a, **k):
+        raise AssertionError("dedup check touched the database")
+
+    monkeypatch.setattr(sqlite3, "connect", _no_db)
+    assert not d.check_and_mark("merchant_activity", "USDT-COP", 300, match={"merchant": "alice"})
+    assert d.check_and_mark("merchant_activity", "USDT-COP", 300, match={"merchant": "bob"})
+    assert not d.check_and_mark("merchant_activity", "USDT-COP", 300, match={"merchant": "bob"})
+    # ventana corta: el evento de hace 30 s ya no cuenta
+    assert d.check_and_mark("merchant_activity", "USDT-COP", 10, match={"merchant": "alice"})
+    assert d.check_and_mark("volatility", "USDT-VES", 300)
+
+
+def test_restart_keeps_debounce_for_detector_match_fields(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "r.db")
+    monkeypatch.setattr(event_dedup, "_DEDUP", EventDeduper())
+    now = datetime.now(timezone.utc).isoformat()
+    jump = {'metric': 'best_buy', 'horizon_s': 900, 'z': 4.2}
+    match = {'metric': 'best_buy', 'horizon_s': 900}
+    assert db.save_event_dedup('price_jump', 'USDT-COP', now, details=jump, dedup_seconds=600, match_details=match)
+    assert db.save_event_dedup('spread_regime', 'USDT-COP', now, details={'direction': 'widening', 'cusum': 6.1},
+                               dedup_seconds=600, match_details={'direction': 'widening'})
+
+    # reinicio: módulo recargado (caché y MATCH_FIELDS como al arrancar), warm-up desde `events`
+    importlib.reload(event_dedup)
+    assert not db.save_event_dedup('price_jump', 'USDT-COP', now, details=jump, dedup_seconds=600,
+                                   match_details=match)
+    assert not db.save_event_dedup('spread_regime', 'USDT-COP', now, details={'direction': 'widening'},
+                                   dedup_seconds=600, match_details={'direction': 'widening'})
+    # otra métrica / otra dirección no están deduplicadas
+    assert db.save_event_dedup('price_jump', 'USDT-COP', now, details=jump, dedup_seconds=600,
+                               match_details={'metric': 'spread', 'horizon_s': 900})
+    assert db.save_event_dedup('spread_regime', 'USDT-COP', now, details={'direction': 'narrowing'},
+                               dedup_seconds=600, match_details={'direction': 'narrowing'})
@@ -0,0 +1,47 @@
+import random
+from datetime import datetime, timezone
+
+import numpy as np
+import pytz
+
+from core import db, heatmap
+
+
+def test_incremental_heatmap_matches_grouping_raw_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "h.db")
+    rng = random.Random(4)
+    now = db.now_ms()
+    rows = [(now - rng.randrange(0, 9 * 24 * 3600 * 1000), rng.uniform(0.2, 2.5)) for _ in range(400)]
+    for ts, v in rows:
+        db.save_spread_entry("USDT-COP", 1.0, 1.0, v, ts=ts)
+
+    since = heatmap.period_start('semana', now)
+    got = {b['bucket_ts']: b for b in heatmap.hourly("USDT-COP", since)}
+    # referencia: agrupar cada fila con pytz (lo que hacía _format_heat_map)
+    tz = pytz.timezone("America/Bogota")
+    ref = {}
+    for ts, v in rows:
+        local = datetime.fromtimestamp(ts / 1000, tz=timezone.utc).astimezone(tz)
+        start = int(local.replace(minute=0, second=0, microsecond=0).timestamp() * 1000)
+        if start >= since:
+            ref.setdefault(start, []).append(v)
+    assert set(got) == set(ref)
+    for b, vals in ref.items():
+        assert got[b]['n'] == len(vals) and np.isclose(got[b]['avg'], np.mean(vals))
+    labels = [label for label, _ in heatmap.blocks(list(got.values()), 'semana')]
+    assert len(labels) == 7
+
+    # reconstruir desde spread_analysis da lo mismo que el mantenimiento incremental
+    before = heatmap.hourly("USDT-COP", 0)
+    assert heatmap.build() == len(before)
+    assert heatmap.hourly("USDT-COP", 0) == before
+    assert np.nanmax(heatmap.weekday_profile("USDT-COP")) > 0
+
+
+def test_local_hours_with_dst_and_half_hour_offsets():
+    ts = np.arange(1710000000000, 1710000000000 + 10 * 24 * 3600 * 1000, 17 * 60 * 1000)
+    for name in ("America/New_York", "Asia/Kolkata"):
+        tz = pytz.timezone(name)
+        expected = [int(datetime.fromtimestamp(t / 1000, tz=timezone.utc).astimezone(tz)
+                        .replace(minute=0, second=0, microsecond=0).timestamp() * 1000) for t in ts]
+        assert heatmap.local_hours(ts, name).tolist() == expected
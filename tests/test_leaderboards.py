@@ -0,0 +1,105 @@
+import random
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from core import db, merchant_scores
+from core.leaderboards import Ranking
+from core.ram_window import RamWindow
+
+
+def _naive(snaps, side=None):
+    vol, count, prices = defaultdict(float), defaultdict(int), defaultdict(float)
+    for snap in snaps:
+        for ad in snap.ads:
+            if side and ad.side != side:
+                continue
+            vol[ad.merchant] += ad.quantity
+            count[ad.merchant] += 1
+            prices[ad.merchant] += ad.price
+    return vol, count, prices
+
+
+def test_leaderboards_match_recount_of_last_hour(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "l.db")
+    engine = merchant_scores.ScoreEngine()
+    monkeypatch.setattr(merchant_scores, "_ENGINE", engine)
+    rng = random.Random(11)
+    rw = RamWindow(window_seconds=6 * 3600)
+    t0 = datetime.now(timezone.utc) - timedelta(minutes=100)
+    try:
+        for i in range(100):
+            ts = t0 + timedelta(minutes=i)
+            for pair, base in (('USDT-COP', 4000.0), ('USDT-VES', 40.0)):
+                ads = [{'price': base * rng.uniform(0.99, 1.01), 'quantity': rng.uniform(10, 5000),
+                        'merchant_name': f'm{rng.randrange(30)}', 'side': rng.choice(('buy', 'sell'))} for _ in range(20)]
+                for a in ads:
+                    a['merchant_id'] = 'id' + a['merchant_name'][1:]
+                    engine.observe(a['merchant_id'], a['price'], rng.randrange(1, 20), db.to_ms(ts))
+                rw.append_snapshot(pair, ads, timestamp=ts)
+
+        latest = rw.pair_index['USDT-COP'][-1].timestamp
+        window = [s for s in rw.pair_index['USDT-COP'] if s.timestamp >= latest - timedelta(hours=1)]
+        for side in (None, 'buy', 'sell'):
+            vol, count, prices = _naive(window, side)
+            expected = sorted(vol, key=lambda m: -vol[m])[:10]
+            got = rw.leaderboards.top_volume('USDT-COP', side=side, limit=10)
+            assert [m for m, *_ in got] == expected
+            for m, v, avg, _, c in got:
+                assert v == pytest.approx(vol[m]) and c == count[m] and avg == pytest.approx(prices[m] / c)
+
+        buy_vol, buy_n, buy_p = _naive(window, 'buy')
+        sell_vol, sell_n, sell_p = _naive(window, 'sell')
+        stable = rw.leaderboards.top_stable('USDT-COP', limit=5)
+        spreads = {m: abs(buy_p[m] / buy_n[m] - sell_p[m] / sell_n[m]) / (sell_p[m] / sell_n[m]) * 100
+                   for m in buy_n if m in sell_n and buy_n[m] + sell_n[m] >= 4}
+        assert [m for m, *_ in stable] == sorted(spreads, key=spreads.get)[:5]
+
+        bots = rw.leaderboards.top_automation('USDT-COP', side='buy', limit=5)
+        scores = [score for *_, score in bots]
+        assert scores == sorted(scores, reverse=True) and all(m in buy_n for m, *_ in bots)
+    finally:
+        rw.detectors.join()
+        rw.stop()
+
+
+def test_ranking_updates_in_place():
+    r = Ranking()
+    for key, score in (("a", 3.0), ("b", 5.0), ("c", 1.0)):
+        r.set(key, score)
+    r.set("c", 9.0)
+    r.discard("b")
+    assert r.top(5) == [("c", 9.0), ("a", 3.0)] and len(r) == 2
+
+
+def test_scores_are_read_outside_the_window_lock(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "s.db")
+    rw = RamWindow(window_seconds=3600)
+    seen = []
+
+    class Probe(merchant_scores.ScoreEngine):
+        def score(self, merchant_id, *args, **kwargs):
+            if threading.current_thread() is not threading.main_thread():
+                return super().score(merchant_id, *args, **kwargs)  # hilo de detectores
+            out = []
+            t = threading.Thread(target=lambda: out.append(rw.lock.acquire(timeout=1) and (rw.lock.release() or True)))
+            t.start()
+            t.join()
+            seen.append(out[0])
+            return super().score(merchant_id, *args, **kwargs)
+
+    engine = Probe()
+    monkeypatch.setattr(merchant_scores, "_ENGINE", engine)
+    try:
+        ads = [{'price': 4000.0 + i, 'quantity': 10.0, 'merchant_name': f'm{i}', 'merchant_id': f'id{i}',
+                'side': 'buy' if i % 2 else 'sell'} for i in range(6)]
+        for a in ads:
+            engine.observe(a['merchant_id'], a['price'], 1, db.now_ms())
+        rw.append_snapshot('USDT-COP', ads)
+        assert len(seen) == 6 and all(seen)
+        assert len(rw.leaderboards.top_automation('USDT-COP', limit=10)) == 6
+    finally:
+        rw.detectors.join()
+        rw.stop()
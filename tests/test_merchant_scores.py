@@ -0,0 +1,145 @@
+import random
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core import db, merchant_scores, partitions
+from core.detectors import merchant_intel
+from core.merchant_scores import ScoreEngine, rescore_all
+
+MINUTE = 60_000
+W = (0.4, 0.3, 0.3)
+
+
+def _insert(rows):
+    tables = [partitions.table_for_write('merchant_history', ts) for _, _, _, ts in rows]
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        with conn:
+            for table, (m_id, price, pos, ts) in zip(tables, rows):
+                conn.execute(
+                    f"INSERT INTO {table} (merchant_id, merchant_name, pair, side, price, position, volume, ts) "
+                    "VALUES (?, ?, 'USDT-COP', 'buy', ?, ?, 1.0, ?)", (m_id, m_id, price, pos, ts))
+    finally:
+        conn.close()
+
+
+def test_engine_matches_sql_scores(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "s.db")
+    # fuerza la ruta SQL aunque otro test haya arrancado el motor global
+    monkeypatch.setattr(merchant_scores, "_ENGINE", None)
+    db.init_db()
+    rng = random.Random(7)
+    now = (db.now_ms() // MINUTE) * MINUTE
+    # 30 h de historial minuto a minuto (parte queda fuera de la ventana de 24 h)
+    start = now - 30 * 60 * MINUTE
+    rows = []
+    engine = ScoreEngine(bucket_seconds=60)
+    for m_id, p_seen, p_change in (("bot", 0.95, 0.5), ("active", 0.4, 0.1), ("human", 0.03, 0.3)):
+        price = 4000.0
+        for k in range(30 * 60):
+            if rng.random() > p_seen:
+                continue
+            ts = start + k * MINUTE + 1_000
+            if rng.random() < p_change:
+                price += rng.choice((-1, 1)) * 0.5
+            pos = rng.randint(1, 10)
+            rows.append((m_id, price, pos, ts))
+            engine.observe(m_id, price, pos, ts)
+    _insert(rows)
+
+    # el corte (now - 24 h) cae justo en un borde de bucket
+    monkeypatch.setattr(db, "now_ms", lambda: now)
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        for m_id in ("bot", "active", "human", "missing"):
+            expected_quick = merchant_intel._quick_calculate_score(conn.cursor(), m_id, *W)
+            assert engine.score(m_id, weights=W, now_ms=now) == expected_quick
+            expected_full = merchant_intel.calculate_automation_score(m_id)
+            assert engine.automation_score(m_id, weights=W, now_ms=now) == expected_full
+    finally:
+        conn.close()
+    assert engine.score("bot", weights=W, now_ms=now)['classification'] == "BOT/ALGORITMO"
+
+    # el re-scoring por lotes escribe en el registro los mismos scores
+    monkeypatch.setattr(merchant_scores, "_weights", lambda: W)
+    stats = rescore_all(now_ms=now)
+    assert stats['merchants'] == 3
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        registry = dict((m, (s, c)) for m, s, c in conn.execute(
+            "SELECT merchant_id, automation_score, classification FROM merchant_registry"))
+    finally:
+        conn.close()
+    for m_id in ("bot", "active", "human"):
+        expected = engine.score(m_id, weights=W, now_ms=now)
+        assert abs(registry[m_id][0] - expected['score']) < 0.011
+        assert registry[m_id][1] == expected['classification']
+
+
+def test_engine_trims_boundary_bucket_at_exact_cutoff(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "c.db")
+    monkeypatch.setattr(merchant_scores, "_ENGINE", None)
+    db.init_db()
+    day = 24 * 60 * MINUTE
+    engine = ScoreEngine(bucket_seconds=60)
+    engine.observe("m", 4000.0, 1, 30_000)
+    engine.observe("m", 4001.0, 2, 90_000)
+    # el corte (40 s) cae dentro del primer bucket: solo queda el avistamiento de 90 s
+    assert engine.counts("m", now_ms=day + 40_000) == (0, 1, 1)
+
+    # paridad con la ruta SQL con un `now` sin alinear y avistamientos a ambos lados del corte
+    rng = random.Random(3)
+    now = db.now_ms() // MINUTE * MINUTE + 37_123
+    rows = []
+    price = 4000.0
+    for ts in sorted(now - day + rng.randrange(-5 * MINUTE, 5 * MINUTE) for _ in range(400)):
+        if rng.random() < 0.5:
+            price += 0.5
+        rows.append(("m", price, rng.randint(1, 6), ts))
+    rows += [("m", price, 2, now - k * 7_000) for k in range(59, 0, -1)]
+    engine = ScoreEngine(bucket_seconds=60)
+    for m_id, p, pos, ts in rows:
+        engine.observe(m_id, p, pos, ts)
+    _insert(rows)
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        for cut in (now, now + 13_000, now + 59_999):
+            monkeypatch.setattr(db, "now_ms", lambda: cut)
+            assert engine.score("m", weights=W, now_ms=cut) == \
+                merchant_intel._quick_calculate_score(conn.cursor(), "m", *W)
+            assert engine.automation_score("m", weights=W, now_ms=cut) == \
+                merchant_intel.calculate_automation_score("m")
+    finally:
+        conn.close()
+
+
+def test_rescore_zeroes_stale_registry_rows_by_epoch(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "r.db")
+    monkeypatch.setattr(merchant_scores, "_weights", lambda: W)
+    db.init_db()
+    now = db.now_ms()
+    since = now - 24 * 60 * MINUTE
+    _insert([("live", 4000.0, 1, now - 5 * MINUTE)])
+    tz_east, tz_west = timezone(timedelta(hours=9)), timezone(timedelta(hours=-5))
+    seen = {
+        # fuera de la ventana, pero con un offset que como texto queda "después" del corte
+        "old": datetime.fromtimestamp((since - 60 * MINUTE) / 1000, tz=tz_east).isoformat(),
+        # dentro de la ventana, con un offset que como texto queda "antes" del corte
+        "recent": datetime.fromtimestamp((since + 60 * MINUTE) / 1000, tz=tz_west).isoformat(timespec="seconds"),
+    }
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT INTO merchant_registry (merchant_id, nickname, last_seen, automation_score, classification) "
+                "VALUES (?, ?, ?, 80, 'BOT/ALGORITMO')", [(m, m, ts) for m, ts in seen.items()])
+    finally:
+        conn.close()
+
+    assert rescore_all(now_ms=now)['stale'] == 1
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        scores = dict(conn.execute("SELECT merchant_id, automation_score FROM merchant_registry"))
+    finally:
+        conn.close()
+    assert scores["old"] == 0 and scores["recent"] == 80 and scores["live"] > 0
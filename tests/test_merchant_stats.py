@@ -0,0 +1,31 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core import db
+from core.merchant_stats import HourlyAccumulators
+from core.ram_window import Ad, Snapshot
+
+
+def _snap(pair, ts, merchant, price, qty):
+    return Snapshot(ts, pair, ads=[Ad(price=price, quantity=qty, merchant=merchant, side='buy',
+                                      min_limit=0, max_limit=0, payment_method='')])
+
+
+def test_hourly_accumulators_flush_per_pair(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "m.db")
+    acc = HourlyAccumulators()
+    h = datetime(2026, 3, 1, 10, tzinfo=timezone.utc)
+    acc.observe(_snap('USDT-COP', h + timedelta(minutes=5), 'cop_m', 4000.0, 100.0))
+    acc.observe(_snap('USDT-COP', h + timedelta(minutes=40), 'cop_m', 4010.0, 50.0))
+    acc.observe(_snap('USDT-VES', h + timedelta(minutes=10), 'ves_m', 60.0, 20.0))
+
+    # a las 11:00 la hora 10 está cerrada: se vuelca solo el par pedido y se libera
+    assert acc.flush('USDT-COP', now=h + timedelta(hours=1)) == 1
+    assert acc.size() == 1
+
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        rows = conn.execute("SELECT merchant, pair, volume_usdt, avg_price, ad_count, hour, date FROM merchant_stats").fetchall()
+    finally:
+        conn.close()
+    assert rows == [('cop_m', 'USDT-COP', 150.0, 4005.0, 2, 10, '2026-03-01')]
@@ -0,0 +1,30 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core import db, partitions
+
+
+def test_partitions_route_reads_and_drop_whole_days(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "p.db")
+    now = datetime.now(timezone.utc)
+    for days_ago in (0, 1, 40):
+        ts = (now - timedelta(days=days_ago)).isoformat()
+        db.save_event("test", "USDT-COP", ts, details={"d": days_ago})
+
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        assert len(partitions.list_partitions(conn, "events")) == 3
+        src = partitions.source(conn, "events", since=now - timedelta(days=2))
+        rows = conn.execute(f"SELECT details FROM {src} ORDER BY ts").fetchall()
+        assert len(rows) == 2
+    finally:
+        conn.close()
+
+    assert partitions.drop_older_than("events", now - timedelta(days=30)) == 1
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        assert len(partitions.list_partitions(conn, "events")) == 2
+        src = partitions.source(conn, "events")
+        assert conn.execute(f"SELECT COUNT(*) FROM {src}").fetchone()[0] == 2
+    finally:
+        conn.close()
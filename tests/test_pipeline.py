@@ -0,0 +1,101 @@
+import threading
+import time
+
+from core import db, pipeline, ram_window, raw_archive
+from core.ram_window import RamWindow
+
+
+def _ads(base):
+    return ([{'price': base + i, 'quantity': 10, 'side': 'buy'} for i in range(60)]
+            + [{'price': base - 5 - i, 'quantity': 10, 'side': 'sell'} for i in range(60)])
+
+
+def test_build_data_from_ram_computed_once_per_snapshot_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "p.db")
+    rw = RamWindow(window_seconds=3600)
+    monkeypatch.setattr(ram_window, "_GLOBAL_WINDOW", rw)
+    calls = []
+    real = pipeline._build_data_structure
+
+    def slow(*args):
+        calls.append(1)
+        time.sleep(0.05)
+        return real(*args)
+
+    monkeypatch.setattr(pipeline, "_build_data_structure", slow)
+    cfg = {"ponderacion_volumen": True, "limite_outlier": 0.025}
+    try:
+        rw.append_snapshot('USDT-COP', _ads(4000.0))
+        rw.append_snapshot('USDT-VES', _ads(40.0))
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(pipeline.build_data_from_ram(cfg)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1 and all(r is results[0] for r in results)
+        assert results[0]["COP"]["promedio_buy_tasa"] is not None
+
+        # un snapshot nuevo invalida el resultado compartido
+        rw.append_snapshot('USDT-COP', _ads(4100.0))
+        fresh = pipeline.build_data_from_ram(cfg)
+        assert len(calls) == 2 and fresh["COP"]["promedio_buy_tasa"] > results[0]["COP"]["promedio_buy_tasa"]
+        assert pipeline.build_data_from_ram(cfg) is fresh
+    finally:
+        rw.stop()
+
+
+def test_build_data_from_ram_uses_rates_of_the_captured_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "p.db")
+    rw = RamWindow(window_seconds=3600)
+    monkeypatch.setattr(ram_window, "_GLOBAL_WINDOW", rw)
+    real = pipeline._build_data_structure
+
+    def racing(*args):
+        # un snapshot nuevo actualiza la matriz mientras se arma la respuesta
+        rw.append_snapshot('USDT-COP', _ads(4400.0))
+        return real(*args)
+
+    monkeypatch.setattr(pipeline, "_build_data_structure", racing)
+    try:
+        rw.append_snapshot('USDT-COP', _ads(4000.0))
+        rw.append_snapshot('USDT-VES', _ads(40.0))
+        expected = rw.rates.as_dict()
+        out = pipeline.build_data_from_ram({"ponderacion_volumen": True, "limite_outlier": 0.025})
+        assert out["matriz"] == expected
+    finally:
+        rw.stop()
+
+
+def _raw_items(base, n):
+    return [{"adv": {"price": f"{base + i * 0.5:.2f}", "tradableQuantity": "100",
+                     "dynamicMaxSingleTransAmount": f"{1000 + i * 10}",
+                     "tradeMethods": [{"tradeMethodName": "Nequi"}]},
+             "advertiser": {"userNo": f"u{i % 5}", "nickName": f"m{i % 5}"}} for i in range(n)]
+
+
+def test_build_data_from_db_uses_cached_columns_and_lazy_raw(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "p.db")
+    for fiat, base in (("COP", 4000.0), ("VES", 40.0)):
+        raw_archive.append_block("binance", f"USDT-{fiat}", "BUY", _raw_items(base, 80))
+        raw_archive.append_block("binance", f"USDT-{fiat}", "SELL", _raw_items(base - 10, 30))
+    cfg = {"monedas": {"COP": {}, "VES": {}}, "ponderacion_volumen": True}
+
+    data = pipeline.build_data_from_db(cfg)
+    # misma salida que con los dicts completos de fetch_latest_raw
+    lists = [db.fetch_latest_raw(fiat=f, trade_type=t, limit=1)[0]["raw"]
+             for f in ("COP", "VES") for t in ("BUY", "SELL")]
+    expected = pipeline._build_data_structure(*lists, cfg)
+    for key in ("COP", "VES", "tasas_remesas", "analisis", "arbitraje"):
+        assert data[key] == expected[key], key
+
+    raw = data["raw"]["cop_buy_raw"]
+    assert len(raw) == 80 and raw._items is None
+    assert raw[0]["adv"]["price"] == 4000.0
+
+    # segunda lectura: mismo bloque decodificado (caché por fila), sin releer el payload
+    first = raw.block
+    again = pipeline.build_data_from_db(cfg)["raw"]["cop_buy_raw"]
+    assert again.block is first
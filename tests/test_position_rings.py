@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from core import db, ram_window
+from core.ram_window import RamWindow
+from core.series import per_hour, range_volume
+from services.analytics.spread import handle_spread
+
+
+def _ads(i, n_asks=60):
+    asks = [{'price': 4000.0 + p, 'quantity': 100 + p + i % 3, 'side': 'buy'} for p in range(n_asks)]
+    bids = [{'price': 3980.0 - p, 'quantity': 50 + 2 * p, 'side': 'sell'} for p in range(60)]
+    return asks + bids
+
+
+def test_range_volume_matches_resorted_snapshots(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "r.db")
+    rw = RamWindow(window_seconds=3 * 3600)
+    monkeypatch.setattr(ram_window, "_GLOBAL_WINDOW", rw)
+    rw.positions.capacity = 32
+    t0 = datetime.now(timezone.utc) - timedelta(minutes=40)
+    try:
+        for i in range(40):
+            # un snapshot con libro corto (no llega a la posición 30)
+            rw.append_snapshot('USDT-COP', _ads(i, 20 if i == 35 else 60), timestamp=t0 + timedelta(seconds=60 * i))
+        hist = rw.positions.window('USDT-COP')
+        # el anillo conserva solo las últimas `capacity` filas, en orden
+        assert len(hist['ts']) == 32 and np.all(np.diff(hist['ts']) == 60)
+        snaps = list(rw.pair_index['USDT-COP'])[-32:]
+        vols = range_volume(hist['cum_qty'], 25, 30)
+        for snap, v in zip(snaps, vols):
+            asks, bids = snap.book.asks, snap.book.bids
+            if len(asks) < 30:
+                assert np.isnan(v)
+            else:
+                assert v == sum(asks[p].quantity + bids[p].quantity for p in range(24, 30))
+        assert np.isclose(per_hour(hist['ts']), 60)
+        assert np.allclose(hist['spread'][-1, :3], [(4000.0 + p - (3980.0 - p)) / (3980.0 - p) * 100 for p in range(3)])
+
+        out = handle_spread(['>1.5'], 'USDT-COP')
+        assert "ANÁLISIS DE VIABILIDAD" in out and "Rotación" in out
+    finally:
+        rw.detectors.join()
+        rw.stop()
+
+
+def test_viability_search_is_capped_at_ring_depth(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "k.db")
+    rw = RamWindow(window_seconds=3 * 3600)
+    monkeypatch.setattr(ram_window, "_GLOBAL_WINDOW", rw)
+    rw.positions.k = 20
+    t0 = datetime.now(timezone.utc) - timedelta(minutes=30)
+    try:
+        for i in range(30):
+            rw.append_snapshot('USDT-COP', _ads(i), timestamp=t0 + timedelta(seconds=60 * i))
+        # el bloque cae dentro del top 20: hay historial y se avisa del límite
+        out = handle_spread(['>1.0'], 'USDT-COP')
+        assert "ANÁLISIS DE VIABILIDAD" in out and "primeras 20 posiciones" in out
+        # un bloque más allá de la posición 20 no se busca (antes: "No hay suficientes snapshots")
+        out = handle_spread(['>2.0'], 'USDT-COP')
+        assert "No hay spreads" in out and "primeras 20 posiciones" in out
+    finally:
+        rw.detectors.join()
+        rw.stop()
@@ -0,0 +1,44 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from core import db
+from core.detectors.base import SnapshotDelta
+from core.detectors.price_jump import PriceJumpDetector
+from core.ram_window import Ad, Snapshot
+
+CFG = {'horizons': '60,300,1800', 'z_threshold': 4.0, 'min_move_pct': 0.3, 'min_samples': 5,
+       'cusum_k': 0.5, 'cusum_h': 5.0, 'eval_seconds': 0, 'debounce_seconds': 600}
+
+
+def _snap(pair, ts, ask, bid):
+    ads = [Ad(price=ask + i, quantity=1, merchant=f's{i}', side='buy', min_limit=0, max_limit=0, payment_method='')
+           for i in range(10)]
+    ads += [Ad(price=bid - i, quantity=1, merchant=f'b{i}', side='sell', min_limit=0, max_limit=0, payment_method='')
+            for i in range(10)]
+    return Snapshot(ts, pair, ads=ads)
+
+
+def test_price_jump_and_spread_regime_across_pairs(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "j.db")
+    det = PriceJumpDetector(CFG)
+    rng = random.Random(1)
+    t0 = datetime.now(timezone.utc) - timedelta(minutes=40)
+    events = []
+    for k in range(40):
+        ts = t0 + timedelta(minutes=k)
+        noise = rng.uniform(-1, 1)
+        # A: salto del 3% en el último minuto
+        ask_a = 4000 + noise + (120 if k == 39 else 0)
+        # B: el spread se abre de forma sostenida desde el minuto 30
+        widen = 0 if k < 30 else 8 * (k - 29)
+        for pair, ask, bid in (('USDT-A', ask_a, 3960 + noise), ('USDT-B', 4000 + noise + widen, 3960 + noise)):
+            delta = SnapshotDelta(pair, _snap(pair, ts, ask, bid))
+            det.on_snapshot(delta)
+        events += det.evaluate_all()
+
+    a_events = [e for e in events if e['pair'] == 'USDT-A']
+    # en A solo el salto final (precios); nada durante los 39 minutos de ruido
+    assert {e['timestamp'] for e in a_events} == {(t0 + timedelta(minutes=39)).isoformat()}
+    assert any(e['event'] == 'price_jump' and e['details']['metric'] == 'best_ask' for e in a_events)
+    b_regimes = [e for e in events if e['pair'] == 'USDT-B' and e['event'] == 'spread_regime']
+    assert b_regimes and all(e['details']['direction'] == 'widening' for e in b_regimes)
@@ -0,0 +1,73 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+from core import db, merchant_scores, user_db
+from core.detectors import merchant_intel
+
+
+def _capture_selects(monkeypatch):
+    """Wrap sqlite3.connect so every SELECT the data layer runs is recorded (params inlined)."""
+    seen = []
+    real_connect = sqlite3.connect
+
+    def connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        conn.set_trace_callback(lambda sql: seen.append(sql))
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", connect)
+    return seen
+
+
+def _history_selects(statements):
+    out = []
+    for sql in statements:
+        s = sql.strip()
+        if not s.upper().startswith("SELECT") or "sqlite_master" in s:
+            continue
+        out.append(s)
+    return out
+
+
+def test_history_queries_use_composite_range_indexes(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "q.db")
+    monkeypatch.setattr(user_db, "DB_PATH", tmp_path / "q.db")
+    # fuerza la ruta SQL aunque otro test haya arrancado el motor global
+    monkeypatch.setattr(merchant_scores, "_ENGINE", None)
+    db.init_db()
+    user_db.init_user_db()
+
+    now = datetime.now(timezone.utc)
+    for i in range(50):
+        ts = (now - timedelta(minutes=i)).isoformat()
+        db.save_event("volatility", "USDT-COP", ts, details={"i": i})
+        db.save_spread_entry("USDT-COP", 1.0, 1.01, 1.0)
+        db.save_market_metric("USDT-COP", "avg_spread_top50", 1.0)
+        db.save_snapshot_summary("USDT-COP", {"timestamp_utc": ts, "pair": "USDT-COP"})
+        user_db.log_usage("42", "/tasa", "OK")
+
+    statements = _capture_selects(monkeypatch)
+    db.fetch_spread_analysis("USDT-COP", hours=24)
+    db.fetch_metrics_history("USDT-COP", "avg_spread_top50", since_hours=24)
+    db.recent_event_exists("volatility", "USDT-COP", within_seconds=300)
+    db.get_latest_snapshot_for_pair("USDT-COP")
+    db.query_snapshots(pair="USDT-COP", since=(now - timedelta(hours=1)).isoformat())
+    db.fetch_recent_aggregates("USDT-COP", limit=5)
+    user_db.count_requests_today("42")
+    merchant_intel.calculate_automation_score("m1")
+    queries = _history_selects(statements)
+    assert len(queries) >= 8
+
+    conn = sqlite3.connect(db.DB_PATH)
+    try:
+        for sql in queries:
+            plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            table_scans = [p for p in plan if p.startswith("SCAN ") and "subquery" not in p]
+            assert not table_scans, (sql, plan)
+            searches = [p for p in plan if p.startswith("SEARCH ")]
+            assert searches and all("INDEX" in p for p in searches), (sql, plan)
+            if "UNION ALL" not in sql:
+                # tablas sin particionar: el índice compuesto ya entrega el orden
+                assert all("TEMP B-TREE" not in p for p in plan), (sql, plan)
+    finally:
+        conn.close()
@@ -0,0 +1,38 @@
+import math
+import random
+
+import numpy as np
+
+from core.rates import FEE, RatesEngine
+
+
+def test_incremental_updates_match_full_outer_recompute():
+    rng = random.Random(9)
+    base = {"COP": 4000.0, "VES": 40.0, "ARS": 1200.0, "BRL": 5.5}
+    eng = RatesEngine()
+    for _ in range(50):
+        fiat = rng.choice(list(base))
+        mid = base[fiat] * rng.uniform(0.98, 1.02)
+        eng.update(fiat, mid * 1.01, mid * 0.99)
+    full = np.outer(eng.buy * (1 + FEE), 1 / (eng.sell * (1 - FEE)))
+    assert np.allclose(eng.cross, full)
+
+    # mismas fórmulas que el par COP-VES fijo de antes
+    cop_buy, ves_sell = eng.buy[eng.fiats.index("COP")], eng.sell[eng.fiats.index("VES")]
+    assert math.isclose(eng.rate("COP", "VES"), cop_buy * (1 + FEE) / (ves_sell * (1 - FEE)))
+    assert math.isclose(eng.reference("COP", "VES", 0.05), cop_buy / ves_sell * 1.05)
+    p2p, ref = eng.rate("COP", "VES"), eng.reference("COP", "VES", 0.05)
+    assert math.isclose(eng.efficiency("COP", "VES", 0.05), (p2p / ref - 1) * 100)
+
+
+def test_triangles_find_mispriced_cycle():
+    eng = RatesEngine(fee=0.0)
+    eng.update("COP", 4000.0, 4000.0)
+    eng.update("VES", 40.0, 40.0)
+    eng.update("ARS", 1200.0, 1200.0)
+    assert all(abs(t["profit_pct"]) < 1e-9 for t in eng.triangles(min_pct=-1))
+    # ARS se vende caro: COP -> ARS -> ... gana
+    eng.update("ARS", 1200.0, 1260.0)
+    best = eng.triangles(min_pct=0.1)[0]
+    assert best["cycle"][0] == best["cycle"][-1] and best["profit_pct"] > 4
+    assert eng.as_dict()["p2p"]["COP"]["COP"] is None
@@ -0,0 +1,62 @@
+import json
+
+from core import db, raw_archive
+
+
+def _binance_item(i, price):
+    # forma similar a la respuesta real de Binance (con campos que no archivamos)
+    return {
+        "adv": {
+            "advNo": f"1180000000{i:08d}",
+            "tradeType": "BUY",
+            "asset": "USDT",
+            "fiatUnit": "COP",
+            "price": f"{price:.2f}",
+            "surplusAmount": "1520.35",
+            "tradableQuantity": "1520.35",
+            "maxSingleTransAmount": "5000000.00",
+            "minSingleTransAmount": "50000.00",
+            "dynamicMaxSingleTransAmount": f"{3000000 + i * 1000:.2f}",
+            "remarks": "Pago inmediato. No terceros. " * 4,
+            "tradeMethods": [
+                {"payType": "Nequi", "identifier": "Nequi", "tradeMethodName": "Nequi", "tradeMethodBgColor": "#5B2C83"},
+                {"payType": "Bancolombia", "identifier": "BancolombiaSA", "tradeMethodName": "Bancolombia", "tradeMethodBgColor": "#FDDA24"},
+            ],
+            "assetScale": 2, "fiatScale": 2, "priceScale": 2, "isTradable": True,
+        },
+        "advertiser": {
+            "userNo": f"s{i % 7:031d}",
+            "nickName": f"merchant_{i % 7}",
+            "monthOrderCount": 1200 + i, "monthFinishRate": 0.98, "positiveRate": 0.99,
+            "userType": "merchant", "userGrade": 3, "vipLevel": 1,
+            "badges": ["trusted"],
+        },
+    }
+
+
+def test_archive_roundtrip_and_size(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "a.db")
+    raw = [_binance_item(i, 3900 + i * 0.5) for i in range(60)]
+    json_size = 0
+    for n in range(10):
+        raw_archive.append_block("binance", "USDT-COP", "BUY", raw, timestamp=1_700_000_000_000 + n * 60_000)
+        json_size += len(json.dumps(raw, ensure_ascii=False))
+
+    blocks = raw_archive.read_blocks(pair="USDT-COP", trade_type="BUY",
+                                     since=1_700_000_000_000 + 3 * 60_000, until=1_700_000_000_000 + 6 * 60_000)
+    assert [b.ts_ms for b in blocks] == [1_700_000_000_000 + k * 60_000 for k in (3, 4, 5)]
+
+    latest = raw_archive.read_latest("USDT-COP", "BUY")
+    rebuilt = latest.to_raw()
+    assert len(rebuilt) == 60
+    assert rebuilt[5]["adv"]["price"] == float(raw[5]["adv"]["price"])
+    assert rebuilt[5]["adv"]["dynamicMaxSingleTransAmount"] == 3005000.0
+    assert rebuilt[5]["advertiser"]["nickName"] == "merchant_5"
+    assert [m["tradeMethodName"] for m in rebuilt[5]["adv"]["tradeMethods"]] == ["Nequi", "Bancolombia"]
+
+    archived = sum(len(b._payload) for b in raw_archive.read_blocks(pair="USDT-COP"))
+    assert archived * 10 <= json_size
+
+    # fetch_latest_raw sigue devolviendo la forma antigua
+    rows = db.fetch_latest_raw(fiat="COP", trade_type="BUY", limit=1)
+    assert rows[0]["fiat"] == "COP" and len(rows[0]["raw"]) == 60
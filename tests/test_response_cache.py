@@ -0,0 +1,59 @@
+import threading
+import time
+
+from core import db, ram_window
+from core.ram_window import RamWindow
+from services.analytics.cache import ResponseCache, cached
+
+
+def _ads(base):
+    return [{'price': base + i, 'quantity': 10, 'side': 'buy'} for i in range(5)]
+
+
+def test_responses_shared_per_snapshot_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "c.db")
+    rw = RamWindow(window_seconds=3600)
+    monkeypatch.setattr(ram_window, "_GLOBAL_WINDOW", rw)
+    calls = []
+
+    def handler(args, pair):
+        calls.append((tuple(args), pair))
+        time.sleep(0.05)
+        return f"{pair} {args} v{len(calls)}"
+
+    cache = ResponseCache(maxsize=2)
+    spread = cached("spread", handler, cache)
+    try:
+        rw.append_snapshot('USDT-COP', _ads(4000.0))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(spread(['10'], 'USDT-COP'))) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(calls) == 1 and len(set(results)) == 1
+        # args normalizados: mismo resultado
+        assert spread([' 10'], 'USDT-COP') == results[0] and len(calls) == 1
+
+        # snapshot nuevo del par: se invalida
+        rw.append_snapshot('USDT-COP', _ads(4100.0))
+        assert spread(['10'], 'USDT-COP') != results[0] and len(calls) == 2
+        assert cache.stats()['evictions'] == 1
+
+        # LRU acotada
+        spread(['1'], 'USDT-COP')
+        spread(['2'], 'USDT-COP')
+        assert cache.stats()['size'] == 2
+        spread(['10'], 'USDT-COP')
+        assert len(calls) == 5
+
+        # par sin snapshots en RAM (respuesta desde la DB): nunca se cachea
+        spread(['10'], 'USDT-ARS')
+        spread(['10'], 'USDT-ARS')
+        assert len(calls) == 7 and cache.stats()['size'] == 2
+    finally:
+        rw.stop()
+
+    stats = cache.stats()
+    assert stats['hits'] == 1 and stats['joined'] == 5 and stats['misses'] == 5
+    assert stats['hit_rate'] == 6 / 11
@@ -0,0 +1,48 @@
+import random
+from collections import deque
+from datetime import datetime, timezone
+
+import numpy as np
+
+from core import db
+from core.ram_window import Ad, Snapshot
+from core.sketches import QuantileWindow, TDigest, price_quantiles
+
+
+def test_tdigest_quantiles_merge_and_roundtrip():
+    rng = random.Random(3)
+    values = [rng.gauss(4000, 25) for _ in range(20000)]
+    parts = []
+    for i in range(0, len(values), 500):
+        d = TDigest()
+        d.add_many(values[i:i + 500])
+        parts.append(d)
+    merged = TDigest.merge(parts)
+    assert merged.count == len(values)
+    exact = np.quantile(values, [0.01, 0.1, 0.5, 0.9, 0.99])
+    approx = merged.quantile([0.01, 0.1, 0.5, 0.9, 0.99])
+    assert np.allclose(approx, exact, atol=2.0)
+    assert len(merged._means) <= 100
+
+    back = TDigest.from_bytes(merged.to_bytes())
+    assert back.quantile(0.5) == merged.quantile(0.5)
+
+
+def test_window_rollups_answer_longer_ranges(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "q.db")
+    now = int(datetime.now(timezone.utc).timestamp())
+    now -= now % 600
+    old = QuantileWindow(window_seconds=3 * 3600)
+    for k in range(180):  # 3 h, precio sube 1 por minuto
+        ts = now - 3 * 3600 + k * 60
+        ads = [Ad(price=1000 + k + j * 0.01, quantity=1, merchant='m', side='buy', min_limit=0, max_limit=0,
+                  payment_method='') for j in range(10)]
+        old.add_snapshot(Snapshot(datetime.fromtimestamp(ts, tz=timezone.utc), 'USDT-COP', ads=ads))
+    assert old.rollup(now=now) == 18
+
+    # ventana nueva con solo la última hora: las 2 h previas salen de price_sketches
+    ram = QuantileWindow(window_seconds=3600)
+    ram._buckets[('USDT-COP', 'buy')] = deque(b for b in old._buckets[('USDT-COP', 'buy')] if b[0] >= now - 3600)
+    p10, p50, p90 = price_quantiles('USDT-COP', 'buy', 3 * 3600, window=ram, now=now)
+    assert abs(p50 - 1090) < 2 and abs(p10 - 1018) < 2 and abs(p90 - 1162) < 2
+    assert abs(price_quantiles('USDT-COP', 'buy', 3600, qs=(0.5,), window=ram, now=now)[0] - 1150) < 2
@@ -0,0 +1,40 @@
+from datetime import datetime, timedelta, timezone
+
+from core import db, pipeline
+from core.ram_window import RamWindow
+
+
+def _ads(base):
+    ads = [{'price': base + i, 'quantity': 10 + i, 'merchant_name': f'm{i}', 'side': 'buy'} for i in range(60)]
+    ads += [{'price': base - 5 - i, 'quantity': 20, 'merchant_name': f's{i}', 'side': 'sell'} for i in range(60)]
+    return ads[::-1]
+
+
+def test_summaries_written_from_ram_snapshots_per_interval(tmp_path, monkeypatch):
+    monkeypatch.setattr(db, "DB_PATH", tmp_path / "s.db")
+    rw = RamWindow(window_seconds=3600)
+    rw.summaries.interval_seconds = 600
+    t0 = datetime.now(timezone.utc)
+    try:
+        rw.append_snapshot('USDT-COP', _ads(4000.0), timestamp=t0)
+        rw.append_snapshot('USDT-VES', _ads(40.0), timestamp=t0)
+        # dentro del intervalo: no se escribe otro resumen
+        rw.append_snapshot('USDT-COP', _ads(4100.0), timestamp=t0 + timedelta(seconds=60))
+        snap = rw.pair_index['USDT-COP'][0]
+    finally:
+        rw.stop()
+
+    rows = db.query_snapshots(pair='USDT-COP')
+    assert len(rows) == 1
+    summary = rows[0]["raw"]
+    assert summary["top1_price"] == 4000.0 and summary["top1_nick"] == 'm0' and summary["top1_vol"] == 10
+    assert summary["top3_prices"] == "[4000.0, 4001.0, 4002.0]"
+    assert summary["total_exposed_volume"] == sum(10 + i for i in range(60)) + 20 * 60
+    assert summary["spread_pct"] == (4000.0 - 3995.0) / 3995.0 * 100
+
+    # mismos valores que el resumen que salía del pipeline
+    buys = [a for a in snap.ads if a.side == 'buy']
+    info = pipeline._analyze_list([a.price for a in buys], [a.quantity for a in buys], {"ponderacion_volumen": True})
+    assert summary["avg_price_simple"] == pipeline._stable_avg(buys)
+    assert summary["avg_price_weighted"] == info["avg_ponderado"] and summary["coef_var"] == info["coef_var"]
+    assert len(db.query_snapshots(pair='USDT-VES')) == 1
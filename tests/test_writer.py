@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+
+from core import user_db, writer
+from core.writer import BatchWriter
+
+
+def _make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (a INTEGER, b TEXT)")
+    conn.execute("CREATE TABLE u (x REAL)")
+    conn.commit()
+    conn.close()
+
+
+def _count(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_batch_writer_groups_and_flushes(tmp_path):
+    db_path = tmp_path / "w.db"
+    _make_db(db_path)
+    w = BatchWriter(flush_ms=50, max_rows=1000)
+    w.start()
+    for i in range(120):
+        w.submit(db_path, "INSERT INTO t (a, b) VALUES (?, ?)", (i, str(i)))
+        w.submit(db_path, "INSERT INTO u (x) VALUES (?)", (i * 1.5,))
+    assert w.flush(timeout=5)
+    assert _count(db_path, "t") == 120
+    assert _count(db_path, "u") == 120
+
+    stats = w.stats()
+    assert stats['rows_written'] == 240
+    assert stats['queue_depth'] == 0
+    assert stats['flushes'] >= 1
+    w.stop()
+
+
+def test_batch_writer_stop_is_durable_and_skips_bad_rows(tmp_path):
+    db_path = tmp_path / "w.db"
+    _make_db(db_path)
+    w = BatchWriter(flush_ms=10_000, max_rows=10_000)
+    w.start()
+    for i in range(10):
+        w.submit(db_path, "INSERT INTO t (a, b) VALUES (?, ?)", (i, 'x'))
+    w.submit(db_path, "INSERT INTO missing_table (a) VALUES (?)", (1,))
+    w.stop()
+    # the long flush interval never elapsed: rows land only because stop drains the queue
+    assert _count(db_path, "t") == 10
+    assert w.stats()['errors'] == 1
+
+
+def test_batch_writer_keeps_queue_order_across_statements(tmp_path):
+    db_path = tmp_path / "w.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE kv (k TEXT PRIMARY KEY, v TEXT)")
+    conn.commit()
+    conn.close()
+    upsert_a = "INSERT INTO kv (k, v) VALUES (?, ?) ON CONFLICT(k) DO UPDATE SET v = excluded.v"
+    upsert_b = "INSERT OR REPLACE INTO kv (k, v) VALUES (?, ?)"
+    w = BatchWriter(flush_ms=10_000, max_rows=10_000)
+    w.start()
+    w.submit(db_path, upsert_a, ("m", "engine-old"))
+    w.submit(db_path, upsert_b, ("m", "rescore"))
+    w.submit(db_path, upsert_a, ("m", "engine-new"))
+    assert w.flush(timeout=5)
+    w.stop()
+    conn = sqlite3.connect(db_path)
+    try:
+        assert conn.execute("SELECT v FROM kv WHERE k = 'm'").fetchone()[0] == "engine-new"
+    finally:
+        conn.close()
+
+
+def test_flush_markers_around_stop_are_released(tmp_path):
+    db_path = tmp_path / "w.db"
+    _make_db(db_path)
+    w = BatchWriter(flush_ms=10_000, max_rows=10_000)
+    markers = [threading.Event() for _ in range(2)]
+    # todo encolado antes de arrancar: el hilo ve _STOP con marcadores a ambos lados
+    w.submit(db_path, "INSERT INTO t (a, b) VALUES (?, ?)", (1, 'x'))
+    w._queue.put(writer._STOP)
+    w._queue.put(markers[0])
+    w.submit(db_path, "INSERT INTO t (a, b) VALUES (?, ?)", (2, 'y'))
+    w._queue.put(markers[1])
+    w.start()
+    w._thread.join(timeout=5)
+    assert all(m.is_set() for m in markers)
+    assert _count(db_path, "t") == 2
+    # el hilo ya no corre: flush() no espera su timeout
+    assert w.flush(timeout=5) is False
+
+
+def test_usage_limit_counts_requests_still_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_db, "DB_PATH", tmp_path / "u.db")
+    monkeypatch.setattr(user_db, "_usage_today", {})
+    user_db.init_user_db()
+    w = BatchWriter(flush_ms=60_000, max_rows=10_000)
+    w.start()
+    monkeypatch.setattr(writer, "_GLOBAL_WRITER", w)
+    try:
+        for _ in range(3):
+            assert user_db.check_daily_limits("7", max_requests_per_user=3) == (True, "OK")
+            user_db.reserve_request("7")
+            user_db.log_usage("7", "/tasa", "SUCCESS")
+        # nada confirmado aún, pero la ráfaga no pasa del límite
+        assert user_db.count_requests_today("7") == 0
+        assert user_db.requests_today("7") == 3
+        assert user_db.check_daily_limits("7", max_requests_per_user=3) == (False, "USER_LIMIT_REACHED")
+    finally:
+        w.stop()
+    assert user_db.count_requests_today("7") == 3
+
+
+def test_usage_slots_count_requests_still_queued(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_db, "DB_PATH", tmp_path / "u.db")
+    monkeypatch.setattr(user_db, "_usage_today", {})
+    user_db.init_user_db()
+    w = BatchWriter(flush_ms=60_000, max_rows=10_000)
+    w.start()
+    monkeypatch.setattr(writer, "_GLOBAL_WRITER", w)
+    try:
+        for uid in ("1", "2"):
+            assert user_db.check_daily_limits(uid, max_users=2) == (True, "OK")
+            user_db.reserve_request(uid)
+            user_db.log_usage(uid, "/tasa", "SUCCESS")
+        # las primeras consultas de 1 y 2 aún están en cola pero ya ocupan los dos slots
+        ok, status = user_db.check_daily_limits("3", max_users=2)
+        assert not ok and status.startswith("WAITLIST_")
+    finally:
+        w.stop()